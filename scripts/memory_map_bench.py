@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for memory_map.py.
+
+Generates a synthetic tree (nested CLAUDE.md levels, conditional rules,
+deep @-import chains with a cycle, a large node_modules decoy and sibling
+projects), then times each loader phase and counts file reads, stat
+calls, directory scans and subprocesses. It also times CLI startup in
+fresh interpreters. Baselines are saved as JSON so later runs can flag
+regressions.
+
+Usage:
+    python scripts/memory_map_bench.py                          # default tree
+    python scripts/memory_map_bench.py --rules 400 --projects 120
+    python scripts/memory_map_bench.py --save-baseline bench.json
+    python scripts/memory_map_bench.py --compare bench.json     # exit 1 on regression
+    python scripts/memory_map_bench.py --keep /tmp/mm-tree      # keep the tree
+    python scripts/memory_map_bench.py --startup-budget 50      # CLI overhead in ms
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import py_compile
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+SCRIPTS = Path(__file__).parent
+sys.path.insert(0, str(SCRIPTS))
+
+import memory_map_core as mm  # noqa: E402
+
+# ── Synthetic tree ─────────────────────────────────────────────────
+
+
+@dataclass
+class TreeSpec:
+    levels: int = 6  # nested CLAUDE.md levels above the project
+    rules: int = 60  # conditional project rules (paths: frontmatter)
+    user_rules: int = 10
+    import_depth: int = 8  # @-import chain length (past the 5-level limit)
+    decoy_dirs: int = 400  # directories inside node_modules
+    projects: int = 20  # sibling projects for --all-projects
+    skills: int = 10
+    topics: int = 2000  # auto-memory topic files (in a project of their own)
+
+
+def _write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def _body(title: str, lines: int = 40) -> str:
+    rows = [f"# {title}", "", "## Commands", "make test", "", "## Project Structure"]
+    rows += [f"- item {i}: keep `src/mod{i}.py` small and typed" for i in range(lines)]
+    return "\n".join(rows) + "\n"
+
+
+def project_dir(root: Path, spec: TreeSpec) -> Path:
+    return root.joinpath("ws", *(f"level{i}" for i in range(spec.levels)), "project")
+
+
+def generate_tree(root: Path, spec: TreeSpec) -> tuple[Path, Path, Path]:
+    """Build the tree; return (home, project dir, workspace dir)."""
+    home = root / "home"
+    _write(home / ".claude" / "CLAUDE.md", _body("User") + "@~/.claude/imp0.md\n")
+    for i in range(spec.import_depth):
+        _write(home / ".claude" / f"imp{i}.md", f"chain {i}\n@imp{i + 1}.md\n")
+    _write(home / ".claude" / f"imp{spec.import_depth}.md", "end of chain\n")
+    _write(home / ".claude" / "cycle-a.md", "a\n@cycle-b.md\n")
+    _write(home / ".claude" / "cycle-b.md", "b\n@cycle-a.md\n")
+    for i in range(spec.user_rules):
+        _write(home / ".claude" / "rules" / f"user-{i}.md", _body(f"User rule {i}", 10))
+
+    workspace = root / "ws"
+    level = workspace
+    for i in range(spec.levels):
+        _write(level / "CLAUDE.md", _body(f"Level {i}", 20))
+        level = level / f"level{i}"
+    project = project_dir(root, spec)
+    (project / ".git").mkdir(parents=True)
+    _write(project / ".git" / "HEAD", "ref: refs/heads/main\n")
+    _write(project / "CLAUDE.md", _body("Project") + "@docs/cycle.md\n")
+    _write(project / "docs" / "cycle.md", "@~/.claude/cycle-a.md\n")
+    _write(project / ".gitignore", "dist/\n*.log\n")
+    for i in range(spec.rules):
+        ext = "py" if i % 3 else "rs"  # every third rule targets no file
+        fm = f'---\npaths:\n  - "src/**/*.{ext}"\n  - "lib/mod{i}/**"\n---\n'
+        _write(
+            project / ".claude" / "rules" / f"rule-{i}.md", fm + _body(f"Rule {i}", 8)
+        )
+    for i in range(20):
+        _write(project / "src" / f"pkg{i}" / f"mod{i}.py", "x = 1\n")
+    for i in range(spec.skills):
+        skill = project / ".claude" / "skills" / f"skill-{i}"
+        _write(skill / "SKILL.md", f"---\nname: skill-{i}\ndescription: d\n---\nbody\n")
+        _write(skill / "references" / "ref.md", "ref\n")
+    for i in range(spec.decoy_dirs):
+        pkg = project / "node_modules" / f"pkg{i % 40}" / f"sub{i}"
+        _write(pkg / "CLAUDE.md", "# decoy\n")
+        _write(pkg / "index.py", "x = 1\n")
+    _write(project / "dist" / "deep" / "CLAUDE.md", "# ignored\n")
+    _write(project / "sub" / "CLAUDE.md", "# child\n")
+
+    for i in range(spec.projects):
+        sibling = workspace / f"sibling{i:03d}"
+        _write(sibling / "CLAUDE.md", _body(f"Sibling {i}", 15))
+        _write(
+            sibling / ".claude" / "rules" / "api.md", "---\npaths:\n  - api/**\n---\n"
+        )
+
+    # Auto-memory with a MEMORY.md past the 200-line cutoff, linking
+    # cross-referenced topic files (no CLAUDE.md: not a sibling project)
+    memproj = workspace / "memproj"
+    memproj.mkdir(parents=True)
+    memory = home / ".claude" / "projects" / mm.get_project_key(memproj) / "memory"
+    rows = ["# Memory", ""]
+    for i in range(spec.topics):
+        links = " ".join(
+            f"[t](topic-{(i * 7 + k) % spec.topics}.md)" for k in (1, 2, 3)
+        )
+        _write(memory / f"topic-{i}.md", f"# Topic {i}\n{links}\nrun `cmd{i % 50}`\n")
+        if i % 8 == 0:
+            rows += ["", f"## Section {i // 8}"]
+        if i < 300:
+            rows.append(f"- [topic {i}](topic-{i}.md): `cmd{i % 50}`")
+    _write(memory / "MEMORY.md", "\n".join(rows) + "\n")
+    return home, project, workspace
+
+
+# ── Measurement ────────────────────────────────────────────────────
+
+
+class Counters:
+    """Counts opens, scandirs and subprocesses (audit hooks) and stat calls."""
+
+    def __init__(self) -> None:
+        self.active = False
+        self.reset()
+        sys.addaudithook(self._hook)
+        for name in ("stat", "lstat"):
+            original = getattr(os, name)
+
+            def counted(*args, _original=original, **kwargs):
+                if self.active:
+                    self.stats += 1
+                return _original(*args, **kwargs)
+
+            setattr(os, name, counted)
+
+    def reset(self) -> None:
+        self.reads = 0
+        self.stats = 0
+        self.scandirs = 0
+        self.subprocesses = 0
+
+    def _hook(self, event: str, args: tuple) -> None:
+        if not self.active:
+            return
+        if event == "open" and isinstance(args[0], (str, bytes, os.PathLike)):
+            self.reads += 1
+        elif event in ("os.scandir", "os.listdir"):
+            self.scandirs += 1
+        elif event == "subprocess.Popen":
+            self.subprocesses += 1
+
+
+@dataclass
+class PhaseResult:
+    wall_ms: float  # best of the repeats; noise only ever adds time
+    median_ms: float
+    reads: int
+    stats: int
+    scandirs: int
+    subprocesses: int
+
+
+def reset_state(home: Path, index: mm.MemoryIndex | None = None) -> None:
+    """Fresh per-run caches, with user-level paths pointed at the tree."""
+    mm.STORE = mm.ContentStore(index)
+    mm.IMPORTS = mm.ImportGraph()
+    mm.TOPICS = mm.TopicIndex()
+    mm.BUDGET = mm.TokenBudget("heuristic")
+    mm._GIT_ROOTS.clear()
+    mm.MANAGED_POLICY = home / "managed" / "CLAUDE.md"
+    mm.USER_CLAUDE = home / ".claude" / "CLAUDE.md"
+    mm.USER_RULES = home / ".claude" / "rules"
+    mm.AUTO_MEMORY_BASE = home / ".claude" / "projects"
+
+
+def measure(counters: Counters, repeats: int, setup, body) -> PhaseResult:
+    walls = []
+    for _ in range(repeats):
+        state = setup()
+        counters.reset()
+        counters.active = True
+        started = time.perf_counter()
+        body(state)
+        walls.append((time.perf_counter() - started) * 1000)
+        counters.active = False
+    return PhaseResult(
+        round(min(walls), 3),
+        round(statistics.median(walls), 3),
+        counters.reads,
+        counters.stats,
+        counters.scandirs,
+        counters.subprocesses,
+    )
+
+
+def run_benchmarks(root: Path, spec: TreeSpec, repeats: int) -> dict[str, PhaseResult]:
+    home, project, workspace = generate_tree(root, spec)
+    index_path = root / "cache" / "memory-map.sqlite3"
+    counters = Counters()
+    results: dict[str, PhaseResult] = {}
+
+    def cold():
+        reset_state(home)
+
+    def warm():
+        reset_state(home, mm.MemoryIndex(index_path))
+        return mm.STORE.index
+
+    def loaded():
+        reset_state(home)
+        return mm.load_memory_map(project)
+
+    dirs = sorted(d for d in workspace.iterdir() if (d / "CLAUDE.md").exists())
+
+    memproj = workspace / "memproj"
+
+    # Populate the on-disk index once for the warm-run phases
+    warm()
+    mm.load_memory_map(project)
+    mm.simulate_truncation(memproj)
+    mm.STORE.index.close()
+
+    results["walk"] = measure(
+        counters, repeats, cold, lambda _: mm.walk_project(project)
+    )
+    results["load_cold"] = measure(
+        counters, repeats, cold, lambda _: mm.load_memory_map(project)
+    )
+    results["load_warm_index"] = measure(
+        counters,
+        repeats,
+        warm,
+        lambda index: (mm.load_memory_map(project), index.close()),
+    )
+    results["dead_rules"] = measure(
+        counters,
+        repeats,
+        loaded,
+        lambda memories: mm.RuleMatcher(memories).find_dead(project),
+    )
+    results["audit"] = measure(
+        counters, repeats, loaded, lambda memories: mm.audit_memory(memories, project)
+    )
+    results["truncation_cold"] = measure(
+        counters, repeats, cold, lambda _: mm.simulate_truncation(memproj)
+    )
+    results["truncation_warm"] = measure(
+        counters,
+        repeats,
+        warm,
+        lambda index: (mm.simulate_truncation(memproj), index.close()),
+    )
+    results["all_projects"] = measure(
+        counters,
+        repeats,
+        cold,
+        lambda _: list(mm.scan_projects(dirs, mm.DEFAULT_WORKERS)),
+    )
+    results["all_projects_audit"] = measure(
+        counters,
+        repeats,
+        cold,
+        lambda _: list(mm.scan_projects(dirs, mm.DEFAULT_WORKERS, audit=True)),
+    )
+    return results
+
+
+# ── Startup ────────────────────────────────────────────────────────
+
+STARTUP_BUDGET_MS = 50.0  # repeat --json overhead on top of a bare interpreter
+BACKDATE_S = 60  # the result cache ignores files touched in the last 2s
+
+
+@dataclass
+class StartupResult:
+    interpreter_ms: float  # python -c pass
+    import_ms: float  # python -c "import memory_map_core"
+    json_ms: float  # full --json run on the synthetic project (warm index)
+    cached_ms: float  # memory_map.py --json answered from the result cache
+    modules: int  # modules imported by the full run
+    cached_modules: int  # modules imported by the cached run
+
+    @property
+    def overhead_ms(self) -> float:
+        return round(self.cached_ms - self.interpreter_ms, 3)
+
+
+def measure_startup(
+    root: Path, home: Path, project: Path, repeats: int
+) -> StartupResult:
+    """Best-of-N wall time of fresh interpreters, the way the status pane runs us."""
+    # Compile the core up front: a PYTHONDONTWRITEBYTECODE environment would
+    # otherwise recompile it on every run, which no installed copy does.
+    for name in ("memory_map_core.py", "memory_map_fast.py"):
+        source = str(SCRIPTS / name)
+        py_compile.compile(source, cfile=importlib.util.cache_from_source(source))
+    env = dict(os.environ, HOME=str(home), XDG_CACHE_HOME=str(root / "cache"))
+    past = time.time() - BACKDATE_S
+    for dirpath, _, filenames in os.walk(root):
+        for name in [*filenames, "."]:
+            os.utime(os.path.join(dirpath, name), (past, past))
+
+    def best(argv: list[str]) -> float:
+        walls = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            subprocess.run(
+                argv, env=env, cwd=SCRIPTS, stdout=subprocess.DEVNULL, check=True
+            )
+            walls.append((time.perf_counter() - started) * 1000)
+        return round(min(walls), 3)
+
+    def modules(argv: list[str]) -> int:
+        trace = subprocess.run(
+            [sys.executable, "-X", "importtime", *argv[1:]],
+            env=env,
+            cwd=SCRIPTS,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=True,
+        )
+        return (
+            sum(
+                1
+                for line in trace.stderr.splitlines()
+                if line.startswith("import time:")
+            )
+            - 1
+        )
+
+    cli = [sys.executable, str(SCRIPTS / "memory_map.py"), "--json", str(project)]
+    # memory_map_core.main() itself never answers from the result cache
+    full = [
+        sys.executable,
+        "-c",
+        "import memory_map_core; memory_map_core.main()",
+        "--json",
+        str(project),
+    ]
+    subprocess.run(
+        cli, env=env, stdout=subprocess.DEVNULL, check=True
+    )  # warm both caches
+    return StartupResult(
+        interpreter_ms=best([sys.executable, "-c", "pass"]),
+        import_ms=best([sys.executable, "-c", "import memory_map_core"]),
+        json_ms=best(full),
+        cached_ms=best(cli),
+        modules=modules(full),
+        cached_modules=modules(cli),
+    )
+
+
+# ── Baselines ──────────────────────────────────────────────────────
+
+MIN_SLOWDOWN_MS = 2.0  # ignore sub-2ms slowdowns on tiny phases
+
+
+def compare(
+    results: dict[str, PhaseResult], baseline: dict, tolerance: float
+) -> list[str]:
+    """Regressions: wall time beyond tolerance, or more I/O than before.
+
+    Threaded phases can race two workers onto the same uncached file, so
+    counters get a 5% slack before they count as a regression.
+    """
+    regressions = []
+    for name, base in baseline.get("phases", {}).items():
+        current = results.get(name)
+        if current is None:
+            continue
+        limit = base["wall_ms"] * (1 + tolerance)
+        if (
+            current.wall_ms > limit
+            and current.wall_ms - base["wall_ms"] > MIN_SLOWDOWN_MS
+        ):
+            regressions.append(
+                f"{name}: {current.wall_ms:.1f}ms vs baseline {base['wall_ms']:.1f}ms"
+            )
+        for counter in ("reads", "stats", "scandirs", "subprocesses"):
+            now, before = getattr(current, counter), base.get(counter, 0)
+            if now > before + max(2, before // 20):
+                regressions.append(f"{name}: {counter} {now} vs baseline {before}")
+    return regressions
+
+
+def compare_startup(
+    startup: StartupResult, baseline: dict, tolerance: float, budget: float
+) -> list[str]:
+    regressions = []
+    if startup.overhead_ms > budget:
+        regressions.append(
+            f"startup: --json overhead {startup.overhead_ms:.1f}ms"
+            f" over the {budget:g}ms budget"
+        )
+    base = baseline.get("startup")
+    if base:
+        for field_, label in (("json_ms", "--json"), ("cached_ms", "cached --json")):
+            now = getattr(startup, field_) - startup.interpreter_ms
+            before = base[field_] - base["interpreter_ms"]
+            if now > before * (1 + tolerance) and now - before > MIN_SLOWDOWN_MS:
+                regressions.append(
+                    f"startup: {label} overhead {now:.1f}ms vs baseline {before:.1f}ms"
+                )
+        for field_ in ("modules", "cached_modules"):
+            if getattr(startup, field_) > base[field_]:
+                regressions.append(
+                    f"startup: {getattr(startup, field_)} {field_.replace('_', ' ')}"
+                    f" imported vs baseline {base[field_]}"
+                )
+    return regressions
+
+
+def print_table(results: dict[str, PhaseResult]) -> None:
+    print(
+        f"  {'phase':<20} {'best ms':>9} {'median':>9}"
+        f" {'reads':>7} {'stats':>7} {'scans':>7} {'procs':>6}"
+    )
+    print(f"  {'─' * 70}")
+    for name, r in results.items():
+        print(
+            f"  {name:<20} {r.wall_ms:>9.2f} {r.median_ms:>9.2f}"
+            f" {r.reads:>7} {r.stats:>7} {r.scandirs:>7} {r.subprocesses:>6}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    defaults = TreeSpec()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=value)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per phase")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.5, help="allowed wall-time slowdown"
+    )
+    parser.add_argument(
+        "--keep", metavar="DIR", help="generate the tree here and keep it"
+    )
+    parser.add_argument("--json", action="store_true", help="JSON output")
+    parser.add_argument(
+        "--startup-budget",
+        type=float,
+        default=STARTUP_BUDGET_MS,
+        help="max --json overhead over a bare interpreter, ms (checked by --compare)",
+    )
+    parser.add_argument(
+        "--no-startup", action="store_true", help="skip the startup runs"
+    )
+    args = parser.parse_args()
+
+    spec = TreeSpec(**{k: getattr(args, k) for k in asdict(defaults)})
+    root = Path(args.keep) if args.keep else Path(tempfile.mkdtemp(prefix="mm-bench-"))
+    startup = None
+    try:
+        results = run_benchmarks(root, spec, args.repeat)
+        if not args.no_startup:
+            home, project = root / "home", project_dir(root, spec)
+            startup = measure_startup(root, home, project, args.repeat)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "spec": asdict(spec),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "phases": {name: asdict(r) for name, r in results.items()},
+    }
+    if startup is not None:
+        report["startup"] = {**asdict(startup), "overhead_ms": startup.overhead_ms}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(results)
+        if startup is not None:
+            print(
+                f"\n  startup: interpreter {startup.interpreter_ms:.1f}ms,"
+                f" import {startup.import_ms:.1f}ms, --json {startup.json_ms:.1f}ms"
+                f" ({startup.modules} modules), cached --json {startup.cached_ms:.1f}ms"
+                f" ({startup.cached_modules} modules)"
+                f"\n  overhead {startup.overhead_ms:.1f}ms"
+                f" of {args.startup_budget:g}ms budget"
+            )
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\n  Baseline saved to {args.save_baseline}", file=sys.stderr)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline.get("spec") != report["spec"]:
+            print(
+                "\n  Warning: baseline was recorded with a different tree spec",
+                file=sys.stderr,
+            )
+        regressions = compare(results, baseline, args.tolerance)
+        if startup is not None:
+            regressions += compare_startup(
+                startup, baseline, args.tolerance, args.startup_budget
+            )
+        if regressions:
+            print("\n  REGRESSIONS:", file=sys.stderr)
+            for r in regressions:
+                print(f"    {r}", file=sys.stderr)
+            sys.exit(1)
+        print("\n  No regressions against baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4493 @@
+"""
+Claude Code Memory Map — implementation behind scripts/memory_map.py.
+
+Kept importable and out of the entry script so its bytecode is cached.
+Startup is kept lean: rich, concurrent.futures, queue and hashlib are
+imported on the code paths that use them and module-level regexes
+compile on first use, so a warm `--json` run loads none of them.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import io
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import memory_map_fast
+
+TYPE_CHECKING = False  # typing.TYPE_CHECKING without importing typing
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+# ── Rich (optional, fallback to plain text) ───────────────────────
+
+Console = Panel = Table = Text = Tree = None  # bound by load_rich()
+
+
+@functools.cache
+def load_rich() -> bool:
+    """Import rich on first use; False when it is not installed."""
+    global Console, Panel, Table, Text, Tree
+    try:
+        from rich.console import Console
+        from rich.panel import Panel
+        from rich.table import Table
+        from rich.text import Text
+        from rich.tree import Tree
+    except ImportError:
+        return False
+    return True
+
+
+class LazyRegex:
+    """A pattern compiled on first use, so importing compiles nothing."""
+
+    def __init__(self, pattern: str, flags: int = 0) -> None:
+        self._args = (pattern, flags)
+        self._compiled: re.Pattern[str] | None = None
+
+    def __getattr__(self, name: str):
+        if self._compiled is None:
+            self._compiled = re.compile(*self._args)
+        return getattr(self._compiled, name)
+
+
+# ── Constants ──────────────────────────────────────────────────────
+
+MANAGED_POLICY = Path("/Library/Application Support/ClaudeCode/CLAUDE.md")
+USER_CLAUDE = Path.home() / ".claude" / "CLAUDE.md"
+USER_RULES = Path.home() / ".claude" / "rules"
+AUTO_MEMORY_BASE = Path.home() / ".claude" / "projects"
+AUTO_MEMORY_LIMIT = 200  # lines loaded at startup
+CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "solo-factory"
+)
+INDEX_PATH = CACHE_DIR / "memory-map.sqlite3"
+SOCKET_PATH = CACHE_DIR / "memory-map.sock"  # --daemon
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)  # --all-projects pool size
+CHAR_BUDGET = 40000  # startup context budget in chars
+TOKEN_BUDGET = 10000  # same budget in tokens (--budget)
+
+
+# ── Data ───────────────────────────────────────────────────────────
+
+
+@dataclass(slots=True)
+class MemoryFile:
+    path: Path
+    kind: str  # managed | user | user_rule | auto_memory | project | project_rule | local | child | import | skill
+    priority: int
+    lines: int = 0
+    loaded_lines: int = 0  # for auto-memory (capped at 200)
+    conditional: bool = False  # path-scoped rules
+    paths_filter: list[str] = field(default_factory=list)
+    imported_by: str | None = None
+    exists: bool = True
+    chars: int = 0  # approximate char count (from the content store)
+
+    @property
+    def size_display(self) -> str:
+        if self.loaded_lines and self.loaded_lines != self.lines:
+            return f"{self.loaded_lines}/{self.lines} lines"
+        return f"{self.lines} lines"
+
+    def to_dict(self) -> dict:
+        d = {
+            "path": str(self.path),
+            "kind": self.kind,
+            "priority": self.priority,
+            "lines": self.lines,
+            "exists": self.exists,
+        }
+        if self.loaded_lines and self.loaded_lines != self.lines:
+            d["loaded_lines"] = self.loaded_lines
+        if self.conditional:
+            d["conditional"] = True
+            d["paths_filter"] = self.paths_filter
+        if self.imported_by:
+            d["imported_by"] = self.imported_by
+        return d
+
+
+class Interner:
+    """Thread-safe value -> small int table; id 0 is reserved for `empty`."""
+
+    def __init__(self, empty=None) -> None:
+        self.values: list = [empty]
+        self._ids: dict = {empty: 0}
+        self._lock = threading.Lock()
+
+    def id(self, value) -> int:
+        i = self._ids.get(value)
+        if i is None:
+            with self._lock:
+                i = self._ids.get(value)
+                if i is None:
+                    i = len(self.values)
+                    self.values.append(value)
+                    self._ids[value] = i
+        return i
+
+
+class MemoryTable:
+    """Columnar, read-only list of MemoryFile for maps kept alive in bulk.
+
+    Each entry costs a few dozen bytes of array storage: paths are split
+    into an interned directory and name, strings and paths: lists are
+    interned, and the int fields live in array('i') columns. Tables built
+    by one scan share its interners (pass them in), so the interned values
+    are freed together with the tables. Indexing or iterating yields
+    ordinary MemoryFile objects built on demand, so display, audit and
+    JSON code use it like a list.
+    """
+
+    _FLAG_CONDITIONAL = 1
+    _FLAG_EXISTS = 2
+
+    def __init__(
+        self,
+        memories: Iterable[MemoryFile] = (),
+        strings: Interner | None = None,
+        filters: Interner | None = None,
+    ) -> None:
+        # directories, file names, kinds, importers; paths: lists as tuples
+        self.strings = strings if strings is not None else Interner()
+        self.filters = filters if filters is not None else Interner(())
+        self._dir = array("I")
+        self._name = array("I")
+        self._kind = array("I")
+        self._imported_by = array("I")
+        self._filter = array("I")
+        self._flags = array("B")
+        self._priority = array("i")
+        self._lines = array("i")
+        self._loaded_lines = array("i")
+        self._chars = array("i")
+        for m in memories:
+            self.append(m)
+
+    def append(self, m: MemoryFile) -> None:
+        directory, name = os.path.split(str(m.path))
+        strings = self.strings
+        self._dir.append(strings.id(directory))
+        self._name.append(strings.id(name))
+        self._kind.append(strings.id(m.kind))
+        self._imported_by.append(strings.id(m.imported_by))
+        self._filter.append(self.filters.id(tuple(m.paths_filter)))
+        self._flags.append(
+            (self._FLAG_CONDITIONAL if m.conditional else 0)
+            | (self._FLAG_EXISTS if m.exists else 0)
+        )
+        self._priority.append(m.priority)
+        self._lines.append(m.lines)
+        self._loaded_lines.append(m.loaded_lines)
+        self._chars.append(m.chars)
+
+    def __len__(self) -> int:
+        return len(self._priority)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        strings = self.strings.values
+        flags = self._flags[i]
+        return MemoryFile(
+            path=Path(os.path.join(strings[self._dir[i]], strings[self._name[i]])),
+            kind=strings[self._kind[i]],
+            priority=self._priority[i],
+            lines=self._lines[i],
+            loaded_lines=self._loaded_lines[i],
+            conditional=bool(flags & self._FLAG_CONDITIONAL),
+            paths_filter=list(self.filters.values[self._filter[i]]),
+            imported_by=strings[self._imported_by[i]],
+            exists=bool(flags & self._FLAG_EXISTS),
+            chars=self._chars[i],
+        )
+
+    def __iter__(self) -> Iterator[MemoryFile]:
+        return (self[i] for i in range(len(self)))
+
+
+# ── Profiling ─────────────────────────────────────────────────────
+
+
+@dataclass
+class PhaseStats:
+    name: str
+    wall: float = 0.0  # seconds, excluding nested phases
+    calls: int = 0
+    reads: int = 0  # files opened
+    bytes_read: int = 0
+    syscalls: int = 0  # opens + stat/lstat + directory scans
+
+    def to_dict(self) -> dict:
+        return {
+            "ms": round(self.wall * 1000, 3),
+            "calls": self.calls,
+            "reads": self.reads,
+            "bytes_read": self.bytes_read,
+            "syscalls": self.syscalls,
+        }
+
+
+class Profiler:
+    """Per-phase wall time and I/O counters behind --timings.
+
+    Phases nest; time and I/O are charged to the innermost open phase, so
+    the rows add up to the total. Counters come from audit hooks (opens,
+    directory scans) and a counting wrapper around os.stat/os.lstat, both
+    installed only by enable(). Disabled, phase() is a shared no-op context.
+    Threads keep separate phase stacks; their times are summed.
+    """
+
+    _NULL = contextlib.nullcontext()
+    _DIR_EVENTS = frozenset({"os.scandir", "os.listdir"})
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.phases: dict[str, PhaseStats] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        self.enabled = True
+        sys.addaudithook(self._on_event)
+        for name in ("stat", "lstat"):
+            original = getattr(os, name)
+
+            def counted(*args, _original=original, **kwargs):
+                frame = self._current()
+                if frame is not None:
+                    frame.syscalls += 1
+                return _original(*args, **kwargs)
+
+            setattr(os, name, counted)
+
+    def _stack(self) -> list[PhaseStats]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _current(self) -> PhaseStats | None:
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    def _on_event(self, event: str, args: tuple) -> None:
+        if event == "open":
+            if isinstance(args[0], int):
+                return  # os.fdopen of an already-open descriptor
+            frame = self._current()
+            if frame is not None:
+                frame.reads += 1
+                frame.syscalls += 1
+        elif event in self._DIR_EVENTS:
+            frame = self._current()
+            if frame is not None:
+                frame.syscalls += 1
+
+    def phase(self, name: str):
+        """Context manager charging everything inside it to phase `name`."""
+        if not self.enabled:
+            return self._NULL
+        return self._phase(name)
+
+    @contextlib.contextmanager
+    def _phase(self, name: str) -> Iterator[None]:
+        stack = self._stack()
+        now = time.perf_counter()
+        if stack:
+            stack[-1].wall += now  # pause the outer phase (see below)
+        frame = PhaseStats(name, -now, calls=1)
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            now = time.perf_counter()
+            frame.wall += now
+            if stack:
+                stack[-1].wall -= now  # resume the outer phase
+            self._merge(frame)
+
+    def timed(self, name: str):
+        """Decorator form of phase() for plain (non-generator) functions."""
+
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.phase(name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def add_bytes(self, n: int) -> None:
+        """Record bytes read by the current phase (opens are counted by hook)."""
+        frame = self._current()
+        if frame is not None:
+            frame.bytes_read += n
+
+    def _merge(self, frame: PhaseStats) -> None:
+        with self._lock:
+            total = self.phases.get(frame.name)
+            if total is None:
+                self.phases[frame.name] = frame
+                return
+            total.wall += frame.wall
+            total.calls += frame.calls
+            total.reads += frame.reads
+            total.bytes_read += frame.bytes_read
+            total.syscalls += frame.syscalls
+
+    def reset(self) -> None:
+        with self._lock:
+            self.phases = {}
+
+    def total(self) -> PhaseStats:
+        total = PhaseStats("total")
+        for p in self.phases.values():
+            total.wall += p.wall
+            total.calls += p.calls
+            total.reads += p.reads
+            total.bytes_read += p.bytes_read
+            total.syscalls += p.syscalls
+        return total
+
+    def to_dict(self) -> dict:
+        return {
+            "phases": {name: p.to_dict() for name, p in self.phases.items()},
+            "total": self.total().to_dict(),
+        }
+
+
+PROFILE = Profiler()
+
+
+# ── Content store ─────────────────────────────────────────────────
+
+_CODE_SPAN_RE = LazyRegex(r"`[^`]+`")
+_IMPORT_RE = LazyRegex(r"@(~?[\w./_-]+)")
+
+
+@dataclass
+class FileContent:
+    """Everything the loader and audit need, derived from a single read."""
+
+    path: Path
+    inode: int
+    mtime_ns: int
+    size: int
+    lines: int
+    chars: int
+    headers: list[str]  # lowercased "## " section names, in order
+    frontmatter: str | None  # text between the --- fences, None if absent
+    has_fence: bool  # file starts with --- (even if unterminated)
+    paths_filter: list[str]  # frontmatter paths: entries
+    import_refs: list[tuple[int, str]]  # (line number, raw @ref) outside code
+    digest: str  # content hash (keys the token-count cache)
+
+
+def _parse_frontmatter_paths(frontmatter: str) -> list[str]:
+    paths = []
+    in_paths = False
+    for line in frontmatter.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("paths:"):
+            in_paths = True
+            continue
+        if in_paths:
+            if stripped.startswith("- "):
+                val = stripped[2:].strip().strip("\"'")
+                paths.append(val)
+            elif stripped and not stripped.startswith("#"):
+                break
+    return paths
+
+
+def parse_content(path: Path, text: str, st: os.stat_result) -> FileContent:
+    """Derive lines, headers, frontmatter and @-imports from file text."""
+    import hashlib
+
+    lines = text.splitlines()
+
+    frontmatter = None
+    has_fence = text.startswith("---")
+    if has_fence:
+        end = text.find("---", 3)
+        if end != -1:
+            frontmatter = text[3:end]
+
+    headers = [
+        line.strip().lstrip("#").strip().lower()
+        for line in lines
+        if line.startswith("## ")
+    ]
+
+    # Match @path references NOT inside code blocks or code spans
+    import_refs: list[tuple[int, str]] = []
+    in_code_block = False
+    for lineno, line in enumerate(lines, 1):
+        if line.strip().startswith("```"):
+            in_code_block = not in_code_block
+            continue
+        if in_code_block or "@" not in line:
+            continue
+        # Match @path — any path-like string; file existence check filters false positives
+        for match in _IMPORT_RE.finditer(_CODE_SPAN_RE.sub("", line)):
+            import_refs.append((lineno, match.group(1)))
+
+    return FileContent(
+        path=path,
+        inode=st.st_ino,
+        mtime_ns=st.st_mtime_ns,
+        size=st.st_size,
+        lines=len(lines),
+        chars=len(text),
+        headers=headers,
+        frontmatter=frontmatter,
+        has_fence=has_fence,
+        paths_filter=_parse_frontmatter_paths(frontmatter) if frontmatter else [],
+        import_refs=import_refs,
+        digest=hashlib.blake2b(text.encode(), digest_size=16).hexdigest(),
+    )
+
+
+class MemoryIndex:
+    """Persistent parse cache (SQLite) shared between runs.
+
+    Rows are keyed by resolved path and validated against (inode, mtime_ns,
+    size), so a warm run only re-reads and re-parses files that changed.
+    Any SQLite failure disables the index for the rest of the run.
+    Safe to share between threads.
+    """
+
+    SCHEMA = 3  # bump whenever FileContent or parse_content() changes
+
+    def __init__(self, path: Path = INDEX_PATH) -> None:
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        self._failed = False
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection | None:
+        if self._db is not None or self._failed:
+            return self._db
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=2, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+            row = db.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is None or row[0] != self.SCHEMA:
+                db.execute("DROP TABLE IF EXISTS files")
+                db.execute("DROP TABLE IF EXISTS tokens")
+                db.execute("DROP TABLE IF EXISTS sections")
+                db.execute("DROP TABLE IF EXISTS results")
+                db.execute("DROP TABLE IF EXISTS refs")
+                db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (self.SCHEMA,)
+                )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, inode INTEGER, mtime_ns INTEGER,"
+                " size INTEGER, digest TEXT, data TEXT)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                "digest TEXT, tokenizer TEXT, max_lines INTEGER, count INTEGER,"
+                " PRIMARY KEY (digest, tokenizer, max_lines))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sections ("
+                "digest TEXT, tokenizer TEXT, data TEXT,"
+                " PRIMARY KEY (digest, tokenizer))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS refs (digest TEXT PRIMARY KEY, data TEXT)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, deps TEXT, output TEXT)"
+            )
+            db.commit()
+        except (OSError, sqlite3.Error):
+            self._failed = True
+            return None
+        self._db = db
+        return db
+
+    def lookup(self, path: Path, st: os.stat_result) -> FileContent | None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return None
+            try:
+                row = db.execute(
+                    "SELECT inode, mtime_ns, size, digest, data FROM files"
+                    " WHERE path = ?",
+                    (str(path),),
+                ).fetchone()
+            except (OSError, sqlite3.Error):
+                return None
+        if row is None or tuple(row[:3]) != (st.st_ino, st.st_mtime_ns, st.st_size):
+            return None
+        data = json.loads(row[4])
+        data["import_refs"] = [tuple(ref) for ref in data["import_refs"]]
+        return FileContent(
+            path=path,
+            inode=st.st_ino,
+            mtime_ns=st.st_mtime_ns,
+            size=st.st_size,
+            digest=row[3],
+            **data,
+        )
+
+    def store(self, content: FileContent) -> None:
+        data = asdict(content)
+        for key in ("path", "inode", "mtime_ns", "size", "digest"):
+            del data[key]
+        row = (
+            str(content.path),
+            content.inode,
+            content.mtime_ns,
+            content.size,
+            content.digest,
+            json.dumps(data),
+        )
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", row
+                )
+                self._dirty = True
+            except (OSError, sqlite3.Error):
+                pass
+
+    def lookup_tokens(self, digest: str, tokenizer: str, max_lines: int) -> int | None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return None
+            try:
+                row = db.execute(
+                    "SELECT count FROM tokens"
+                    " WHERE digest = ? AND tokenizer = ? AND max_lines = ?",
+                    (digest, tokenizer, max_lines),
+                ).fetchone()
+            except (OSError, sqlite3.Error):
+                return None
+        return row[0] if row else None
+
+    def store_tokens(
+        self, digest: str, tokenizer: str, max_lines: int, count: int
+    ) -> None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?)",
+                    (digest, tokenizer, max_lines, count),
+                )
+                self._dirty = True
+            except (OSError, sqlite3.Error):
+                pass
+
+    def lookup_sections(self, digest: str, tokenizer: str) -> dict | None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return None
+            try:
+                row = db.execute(
+                    "SELECT data FROM sections WHERE digest = ? AND tokenizer = ?",
+                    (digest, tokenizer),
+                ).fetchone()
+            except (OSError, sqlite3.Error):
+                return None
+        return json.loads(row[0]) if row else None
+
+    def store_sections(self, digest: str, tokenizer: str, data: dict) -> None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO sections VALUES (?, ?, ?)",
+                    (digest, tokenizer, json.dumps(data)),
+                )
+                self._dirty = True
+            except (OSError, sqlite3.Error):
+                pass
+
+    def lookup_dir(self, directory: Path) -> dict[str, tuple[int, int, int, str]]:
+        """path -> (inode, mtime_ns, size, digest) for every row under directory."""
+        prefix = str(directory) + os.sep
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return {}
+            try:
+                rows = db.execute(
+                    "SELECT path, inode, mtime_ns, size, digest FROM files"
+                    " WHERE path >= ? AND path < ?",
+                    (prefix, prefix[:-1] + chr(ord(os.sep) + 1)),
+                ).fetchall()
+            except (OSError, sqlite3.Error):
+                return {}
+        return {path: tuple(rest) for path, *rest in rows}
+
+    def lookup_refs_many(self, digests: Iterable[str]) -> dict[str, dict]:
+        digests = list(digests)
+        found: dict[str, dict] = {}
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return found
+            try:
+                for i in range(
+                    0, len(digests), 500
+                ):  # stay under SQLite's variable limit
+                    chunk = digests[i : i + 500]
+                    marks = ",".join("?" * len(chunk))
+                    found.update(
+                        db.execute(
+                            f"SELECT digest, data FROM refs WHERE digest IN ({marks})",
+                            chunk,
+                        ).fetchall()
+                    )
+            except (OSError, sqlite3.Error):
+                pass
+        return {digest: json.loads(data) for digest, data in found.items()}
+
+    def lookup_refs(self, digest: str) -> dict | None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return None
+            try:
+                row = db.execute(
+                    "SELECT data FROM refs WHERE digest = ?", (digest,)
+                ).fetchone()
+            except (OSError, sqlite3.Error):
+                return None
+        return json.loads(row[0]) if row else None
+
+    def store_refs(self, digest: str, data: dict) -> None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO refs VALUES (?, ?)",
+                    (digest, json.dumps(data)),
+                )
+                self._dirty = True
+            except (OSError, sqlite3.Error):
+                pass
+
+    def store_result(self, key: str, deps: str, output: str) -> None:
+        """Output for memory_map_fast.lookup(); deps from memory_map_fast.snapshot()."""
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                    (key, deps, output),
+                )
+                self._dirty = True
+            except (OSError, sqlite3.Error):
+                pass
+
+    def commit(self) -> None:
+        with self._lock:
+            if self._db is not None and self._dirty:
+                try:
+                    self._db.commit()
+                except (OSError, sqlite3.Error):
+                    pass
+                self._dirty = False
+
+    def close(self) -> None:
+        self.commit()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class ContentStore:
+    """Per-run file cache keyed by resolved path and (mtime, size).
+
+    Each file is stat'ed and read at most once per run; every loader and
+    audit pass asks the store instead of touching the file again. With an
+    index attached, unchanged files are not read at all. Call invalidate()
+    when a file is known to have changed.
+    """
+
+    def __init__(self, index: MemoryIndex | None = None) -> None:
+        self.index = index
+        self._entries: dict[Path, FileContent | None] = {}
+        self._texts: dict[Path, str] = {}
+        self._resolved: dict[Path, Path] = {}
+
+    def resolve(self, path: Path) -> Path:
+        resolved = self._resolved.get(path)
+        if resolved is None:
+            resolved = path.resolve()
+            self._resolved[path] = resolved
+        return resolved
+
+    def get(self, path: Path) -> FileContent | None:
+        """Return parsed content, or None if the file cannot be stat'ed."""
+        resolved = self.resolve(path)
+        if resolved in self._entries:
+            return self._entries[resolved]
+        entry = self._load(resolved)
+        self._entries[resolved] = entry
+        return entry
+
+    def _load(self, resolved: Path) -> FileContent | None:
+        try:
+            st = resolved.stat()
+        except OSError:
+            return None
+        if self.index is not None:
+            cached = self.index.lookup(resolved, st)
+            if cached is not None:
+                return cached
+        try:
+            text = resolved.read_text(errors="replace")
+        except OSError:
+            # Exists but unreadable: listed with no content, like before
+            # the store. Not indexed, so a later chmod is picked up.
+            self._texts[resolved] = ""
+            return parse_content(resolved, "", st)
+        PROFILE.add_bytes(st.st_size)
+        content = parse_content(resolved, text, st)
+        self._texts[resolved] = text
+        if self.index is not None:
+            self.index.store(content)
+        return content
+
+    def text(self, path: Path) -> str | None:
+        """Return the text get() parsed, reading it only on an index hit."""
+        content = self.get(path)
+        if content is None:
+            return None
+        text = self._texts.get(content.path)
+        if text is None:
+            try:
+                text = content.path.read_text(errors="replace")
+            except OSError:
+                text = ""
+            else:
+                PROFILE.add_bytes(content.size)
+            self._texts[content.path] = text
+        return text
+
+    def invalidate(self, path: Path | None = None) -> None:
+        """Forget one file (or everything) so the next get() re-reads it."""
+        if path is None:
+            self._entries.clear()
+            self._texts.clear()
+            self._resolved.clear()
+            return
+        for key in (self.resolve(path), path):
+            self._entries.pop(key, None)
+            self._texts.pop(key, None)
+
+    def invalidate_dir(self, directory: Path) -> None:
+        """Forget every cached file directly inside directory."""
+        directory = self.resolve(directory)
+        for path in [p for p in self._entries if p.parent == directory]:
+            del self._entries[path]
+            self._texts.pop(path, None)
+
+
+STORE = ContentStore()
+
+
+# ── Helpers ────────────────────────────────────────────────────────
+
+
+def count_lines(path: Path) -> int:
+    content = STORE.get(path)
+    return content.lines if content else 0
+
+
+_GIT_ROOTS: dict[Path, Path | None] = {}  # directory -> enclosing work tree
+
+
+def _is_git_marker(dot_git: Path) -> bool:
+    """True for a .git directory, a gitfile, or a linked-worktree pointer."""
+    if dot_git.is_dir():
+        return (dot_git / "HEAD").exists()
+    try:
+        with dot_git.open() as f:
+            first = f.readline().strip()
+    except (OSError, UnicodeDecodeError):
+        return False
+    if not first.startswith("gitdir:"):
+        return False
+    gitdir = Path(first[len("gitdir:") :].strip())
+    if not gitdir.is_absolute():
+        gitdir = dot_git.parent / gitdir
+    return gitdir.is_dir()
+
+
+def find_git_root(path: Path) -> Path | None:
+    """Find the enclosing work tree (like `git rev-parse --show-toplevel`).
+
+    Walks up looking for .git without spawning git. Every directory visited
+    is memoized, so sibling projects reuse their ancestors' lookups.
+    """
+    current = path.resolve()
+    visited: list[Path] = []
+    while True:
+        if current in _GIT_ROOTS:
+            root = _GIT_ROOTS[current]
+            break
+        visited.append(current)
+        if _is_git_marker(current / ".git"):
+            root = current
+            break
+        if current == current.parent:
+            root = None
+            break
+        current = current.parent
+    for d in visited:
+        _GIT_ROOTS[d] = root
+    return root
+
+
+def get_project_key(cwd: Path) -> str:
+    """Derive auto-memory project key from CWD (matches Claude Code format)."""
+    git_root = find_git_root(cwd)
+    base = git_root if git_root else cwd
+    # Claude Code format: absolute path with / replaced by -
+    return str(base).replace("/", "-")
+
+
+def parse_rule_frontmatter(path: Path) -> list[str]:
+    """Extract paths: field from YAML frontmatter in .claude/rules/*.md."""
+    content = STORE.get(path)
+    return list(content.paths_filter) if content else []
+
+
+@PROFILE.timed("imports")
+def find_imports(path: Path) -> list[MemoryFile]:
+    """Find @-imports in a memory file (max depth 5)."""
+    return IMPORTS.imports_of(path)
+
+
+def on_demand(path: Path, kind: str, priority: int) -> MemoryFile:
+    """Entry for a file that is detected but not loaded at startup."""
+    content = STORE.get(path)
+    return MemoryFile(
+        path=content.path if content else STORE.resolve(path),
+        kind=kind,
+        priority=priority,
+        lines=content.lines if content else 0,
+        loaded_lines=0,  # on-demand (child dir, topic file, or skill)
+        chars=content.chars if content else 0,
+    )
+
+
+@functools.cache
+def home_str() -> str:
+    return str(Path.home())
+
+
+def short_path(p: Path) -> str:
+    """Shorten path for display."""
+    return str(p).replace(home_str(), "~")
+
+
+# ── Import graph ───────────────────────────────────────────────────
+
+MAX_IMPORT_DEPTH = 5
+
+
+@dataclass(frozen=True)
+class ImportEdge:
+    source: Path
+    target: Path
+    line: int  # line of the @ref in source
+
+
+def import_target(source: Path, ref: str) -> Path:
+    """Unresolved path an @ref in source points at (may not exist)."""
+    if ref.startswith("~"):
+        return Path(ref).expanduser()
+    return source.parent / ref
+
+
+@dataclass
+class ImportSummary:
+    """What one root file pulls into context through its @-imports."""
+
+    root: Path
+    files: list[Path]  # imports actually loaded, in load order
+    chars: int  # root + loaded imports
+    tokens: int
+    max_depth: int  # deepest import level reached
+    truncated: list[Path]  # imports past MAX_IMPORT_DEPTH (not loaded)
+
+
+class ImportGraph:
+    """@-import graph over all memory files.
+
+    Each node's refs are resolved once and kept as edges (with line
+    numbers), so an import shared by many rules is parsed and resolved a
+    single time. Per-root traversals replay Claude Code's rules: depth-first,
+    at most MAX_IMPORT_DEPTH levels, each file once per root.
+    """
+
+    def __init__(self) -> None:
+        self._edges: dict[Path, list[ImportEdge]] = {}
+
+    def edges(self, path: Path) -> list[ImportEdge]:
+        path = STORE.resolve(path)
+        edges = self._edges.get(path)
+        if edges is not None:
+            return edges
+        content = STORE.get(path)
+        edges = []
+        for lineno, ref in content.import_refs if content else []:
+            target = STORE.resolve(import_target(path, ref))
+            if STORE.get(target) is not None:
+                edges.append(ImportEdge(path, target, lineno))
+        self._edges[path] = edges
+        return edges
+
+    def invalidate(self, path: Path | None = None) -> None:
+        if path is None:
+            self._edges.clear()
+        else:
+            self._edges.pop(STORE.resolve(path), None)
+
+    def _traverse(self, root: Path) -> Iterator[tuple[ImportEdge, int]]:
+        """Yield (edge, depth) for every import loaded with root."""
+        seen: set[Path] = set()
+
+        def visit(path: Path, depth: int) -> Iterator[tuple[ImportEdge, int]]:
+            if depth >= MAX_IMPORT_DEPTH or path in seen:
+                return
+            seen.add(path)
+            for edge in self.edges(path):
+                if edge.target in seen:
+                    continue
+                yield edge, depth + 1
+                yield from visit(edge.target, depth + 1)
+
+        yield from visit(STORE.resolve(root), 0)
+
+    def imports_of(self, root: Path) -> list[MemoryFile]:
+        """MemoryFile entries for every @-import loaded with root."""
+        imports = []
+        for edge, _depth in self._traverse(root):
+            content = STORE.get(edge.target)
+            lines = content.lines if content else 0
+            imports.append(
+                MemoryFile(
+                    path=edge.target,
+                    kind="import",
+                    priority=50,
+                    lines=lines,
+                    loaded_lines=lines,
+                    imported_by=str(edge.source),
+                    chars=content.chars if content else 0,
+                )
+            )
+        return imports
+
+    def summary(self, root: Path) -> ImportSummary:
+        root = STORE.resolve(root)
+        content = STORE.get(root)
+        chars = content.chars if content else 0
+        tokens = BUDGET.count_path(root)
+        files: list[Path] = []
+        loaded = {root}
+        max_depth = 0
+        for edge, depth in self._traverse(root):
+            files.append(edge.target)
+            max_depth = max(max_depth, depth)
+            if edge.target not in loaded:
+                loaded.add(edge.target)
+                target = STORE.get(edge.target)
+                chars += target.chars if target else 0
+                tokens += BUDGET.count_path(edge.target)
+        truncated = sorted(
+            {
+                edge.target
+                for f in files
+                for edge in self.edges(f)
+                if edge.target not in loaded
+            }
+        )
+        return ImportSummary(root, files, chars, tokens, max_depth, truncated)
+
+    def cycles(self, roots: Iterable[Path]) -> list[list[Path]]:
+        """Import cycles reachable from roots, each as [a, b, ..., a]."""
+        state: dict[Path, int] = {}  # 1 = on stack, 2 = done
+        stack: list[Path] = []
+        found: dict[frozenset[Path], list[Path]] = {}
+
+        def visit(path: Path) -> None:
+            state[path] = 1
+            stack.append(path)
+            for edge in self.edges(path):
+                target_state = state.get(edge.target)
+                if target_state == 1:
+                    cycle = stack[stack.index(edge.target) :] + [edge.target]
+                    found.setdefault(frozenset(cycle), cycle)
+                elif target_state is None:
+                    visit(edge.target)
+            stack.pop()
+            state[path] = 2
+
+        for root in roots:
+            root = STORE.resolve(root)
+            if root not in state:
+                visit(root)
+        return list(found.values())
+
+
+IMPORTS = ImportGraph()
+
+
+# ── Token budget ───────────────────────────────────────────────────
+
+
+class HeuristicTokenizer:
+    """Offline estimate calibrated against BPE tokenizers (cl100k-style).
+
+    Short English words are one token, long ones split every ~5 chars;
+    digits go in groups of 3; punctuation runs cost ~1 token per 2 chars;
+    newline/indent runs cost one. Non-ASCII text is much denser: ~0.45
+    tokens per char for Cyrillic/Greek/Latin-extended, 1 per char for
+    CJK and other BMP scripts, 2 for astral-plane chars (emoji).
+    """
+
+    name = "heuristic"
+    _TOKEN_RE = LazyRegex(
+        r"(?P<word>[A-Za-z]+)|(?P<num>[0-9]+)|(?P<punct>[!-/:-@\[-`{-~]+)"
+        r"|(?P<ws>\s+)|(?P<narrow>[\u0080-\u07ff]+)|(?P<wide>[\u0800-\uffff])"
+        r"|(?P<other>.)",
+        re.DOTALL,
+    )
+
+    def count(self, text: str) -> int:
+        total = 0.0
+        for m in self._TOKEN_RE.finditer(text):
+            kind = m.lastgroup
+            n = m.end() - m.start()
+            if kind == "word":
+                total += 1 + max(0, n - 6) // 5
+            elif kind == "num":
+                total += math.ceil(n / 3)
+            elif kind == "punct":
+                total += math.ceil(n / 2)
+            elif kind == "ws":
+                total += 1 if n > 1 or m.group() != " " else 0
+            elif kind == "narrow":
+                total += n * 0.45
+            elif kind == "wide":
+                total += 1
+            else:
+                total += 2
+        return math.ceil(total)
+
+
+class TiktokenTokenizer:
+    """OpenAI tiktoken encodings (optional dependency)."""
+
+    def __init__(self, encoding: str = "cl100k_base") -> None:
+        import tiktoken
+
+        self._enc = tiktoken.get_encoding(encoding)
+        self.name = f"tiktoken:{encoding}"
+
+    def count(self, text: str) -> int:
+        return len(self._enc.encode(text, disallowed_special=()))
+
+
+class HFTokenizer:
+    """Any Hugging Face tokenizer.json (optional `tokenizers` dependency)."""
+
+    def __init__(self, path: str) -> None:
+        from tokenizers import Tokenizer
+
+        self._tok = Tokenizer.from_file(path)
+        self.name = f"hf:{Path(path).name}"
+
+    def count(self, text: str) -> int:
+        return len(self._tok.encode(text).ids)
+
+
+TOKENIZERS = {
+    "heuristic": lambda arg: HeuristicTokenizer(),
+    "tiktoken": lambda arg: TiktokenTokenizer(arg or "cl100k_base"),
+    "hf": lambda arg: HFTokenizer(arg),
+}
+
+
+_TIKTOKEN_BLOB = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+
+
+def _tiktoken_cached(encoding: str) -> bool:
+    """True if tiktoken has the encoding on disk (loading it won't download)."""
+    import hashlib
+    import tempfile
+
+    if "TIKTOKEN_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["TIKTOKEN_CACHE_DIR"]
+    elif "DATA_GYM_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["DATA_GYM_CACHE_DIR"]
+    else:
+        cache_dir = os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    if not cache_dir:
+        return False
+    key = hashlib.sha1(_TIKTOKEN_BLOB.format(encoding).encode()).hexdigest()
+    return os.path.exists(os.path.join(cache_dir, key))
+
+
+def get_tokenizer(spec: str = "auto"):
+    """Build a tokenizer from NAME[:ARG].
+
+    'auto' picks tiktoken only when its encoding is already cached, so a
+    default run never goes to the network. Unknown names or a
+    missing/failed backend fall back to the heuristic.
+    """
+    if spec == "auto":
+        spec = "tiktoken" if _tiktoken_cached("cl100k_base") else "heuristic"
+    name, _, arg = spec.partition(":")
+    factory = TOKENIZERS.get(name)
+    if factory is not None:
+        try:
+            return factory(arg)
+        except Exception:
+            pass
+    return HeuristicTokenizer()
+
+
+# Which budget layer each MemoryFile kind belongs to
+LAYER_OF_KIND = {
+    "managed": "managed",
+    "user": "user",
+    "auto_memory": "auto-memory",
+    "project": "project",
+    "local": "project",
+    "user_rule": "rule",
+    "project_rule": "rule",
+    "import": "import",
+}
+LAYERS = ("managed", "user", "auto-memory", "project", "rule", "import")
+
+
+@dataclass
+class BudgetReport:
+    tokenizer: str
+    budget: int
+    base: int  # always-loaded tokens
+    max: int  # with every conditional rule active
+    by_layer: dict[str, int]  # always-loaded tokens per layer
+
+    @property
+    def base_pct(self) -> int:
+        return int(self.base / self.budget * 100) if self.budget else 0
+
+    @property
+    def max_pct(self) -> int:
+        return int(self.max / self.budget * 100) if self.budget else 0
+
+    def layers_display(self) -> str:
+        return " · ".join(
+            f"{layer} {self.by_layer[layer]:,}"
+            for layer in LAYERS
+            if self.by_layer.get(layer)
+        )
+
+
+class TokenBudget:
+    """Token counts per memory file, cached by content digest.
+
+    Counts are memoized per (digest, tokenizer, line limit) for the run and
+    persisted in the on-disk index when one is attached to STORE. The
+    tokenizer is built lazily so runs that never count tokens pay nothing.
+    Map views show the Tokens line only when `requested` (a tokenizer or
+    budget was chosen explicitly) or with --audit.
+    """
+
+    def __init__(self, tokenizer: str = "auto", budget: int = TOKEN_BUDGET) -> None:
+        self.spec = os.environ.get("MEMORY_MAP_TOKENIZER", tokenizer)
+        self.requested = "MEMORY_MAP_TOKENIZER" in os.environ
+        self.budget = budget
+        self._tokenizer = None
+        self._counts: dict[tuple[str, str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def configure(
+        self, tokenizer: str | None = None, budget: int | None = None
+    ) -> None:
+        if tokenizer is not None:
+            self.spec = tokenizer
+            self._tokenizer = None
+            self.requested = True
+        if budget is not None:
+            self.budget = budget
+            self.requested = True
+
+    @property
+    def tokenizer(self):
+        with self._lock:
+            if self._tokenizer is None:
+                self._tokenizer = get_tokenizer(self.spec)
+            return self._tokenizer
+
+    def count_path(self, path: Path, max_lines: int = 0) -> int:
+        """Tokens in a file (only its first max_lines lines if > 0)."""
+        content = STORE.get(path)
+        if content is None:
+            return 0
+        name = self.tokenizer.name
+        key = (content.digest, name, max_lines)
+        count = self._counts.get(key)
+        if count is not None:
+            return count
+        index = STORE.index
+        if index is not None:
+            count = index.lookup_tokens(*key)
+        if count is None:
+            text = STORE.text(path)
+            if text is None:
+                return 0
+            if max_lines:
+                text = "".join(text.splitlines(keepends=True)[:max_lines])
+            count = self.tokenizer.count(text)
+            if index is not None:
+                index.store_tokens(*key, count)
+        self._counts[key] = count
+        return count
+
+    def count(self, m: MemoryFile) -> int:
+        """Tokens this entry puts into context (auto-memory is truncated)."""
+        if m.kind == "auto_memory":
+            return self.count_path(m.path, AUTO_MEMORY_LIMIT)
+        return self.count_path(m.path)
+
+    @PROFILE.timed("tokens")
+    def report(self, memories: list[MemoryFile]) -> BudgetReport:
+        startup = [m for m in memories if m.kind in LAYER_OF_KIND]
+        by_layer: dict[str, int] = {}
+        base = total = 0
+        for m in startup:
+            tokens = self.count(m)
+            total += tokens
+            if not m.conditional:
+                base += tokens
+                layer = LAYER_OF_KIND[m.kind]
+                by_layer[layer] = by_layer.get(layer, 0) + tokens
+        return BudgetReport(self.tokenizer.name, self.budget, base, total, by_layer)
+
+
+BUDGET = TokenBudget()
+
+
+# ── Tree walk ──────────────────────────────────────────────────────
+
+# Directories never worth descending into when looking for memory files
+DEFAULT_SKIP_DIRS = frozenset(
+    {
+        ".git",
+        ".hg",
+        ".svn",
+        "node_modules",
+        ".venv",
+        "venv",
+        "__pycache__",
+        ".mypy_cache",
+        ".pytest_cache",
+        ".ruff_cache",
+        ".tox",
+        ".nox",
+        "target",
+        "dist",
+        "build",
+        ".next",
+        ".nuxt",
+        ".turbo",
+        ".gradle",
+        "Pods",
+        "DerivedData",
+    }
+)
+SKILL_DIRS = (Path(".claude") / "skills", Path(".agents") / "skills")
+SKILL_SKIP_SUBDIRS = frozenset({"references", "scripts", "assets"})
+
+
+def glob_to_regex(pattern: str) -> str:
+    """Translate a gitignore / paths: glob (**, *, ?, [..], {a,b}) to a regex."""
+    out: list[str] = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                i += 2
+                if i < n and pattern[i] == "/":
+                    i += 1
+                    out.append("(?:.*/)?")  # zero or more directories
+                else:
+                    out.append(".*")
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[" and pattern.find("]", i + 2) != -1:
+            j = pattern.find("]", i + 2)
+            body = pattern[i + 1 : j].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = j + 1
+            continue
+        elif c == "{" and pattern.find("}", i) != -1:
+            j = pattern.find("}", i)
+            alts = pattern[i + 1 : j].split(",")
+            out.append("(?:" + "|".join(glob_to_regex(a) for a in alts) + ")")
+            i = j + 1
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+@dataclass
+class IgnoreRule:
+    regex: re.Pattern[str]
+    base: str  # directory of the .gitignore, relative to the walk root
+    negate: bool
+    dir_only: bool
+    anchored: bool  # pattern contains a slash: match the relative path
+
+
+def parse_gitignore(path: Path, base: str) -> list[IgnoreRule]:
+    """Parse one .gitignore into rules (comments, !negation, dir/ and /anchor)."""
+    try:
+        text = path.read_text()
+    except (OSError, UnicodeDecodeError):
+        return []
+    PROFILE.add_bytes(len(text))
+    rules = []
+    for raw in text.splitlines():
+        line = raw.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if not line:
+            continue
+        regex = re.compile(glob_to_regex(line) + r"\Z")
+        rules.append(IgnoreRule(regex, base, negate, dir_only, anchored))
+    return rules
+
+
+def is_ignored(rules: list[IgnoreRule], rel: str, is_dir: bool) -> bool:
+    """Apply gitignore rules in order (last match wins) to a root-relative path."""
+    ignored = False
+    name = rel.rsplit("/", 1)[-1]
+    for rule in rules:
+        if rule.dir_only and not is_dir:
+            continue
+        target = rel[len(rule.base) + 1 :] if rule.base else rel
+        if rule.regex.match(target if rule.anchored else name):
+            ignored = not rule.negate
+    return ignored
+
+
+@dataclass(frozen=True)
+class WalkOptions:
+    skip: frozenset[str] = DEFAULT_SKIP_DIRS
+    max_depth: int | None = None  # directory levels below the walk root
+    gitignore: bool = True
+
+
+@dataclass
+class WalkResult:
+    """Memory files found under a project root in one traversal."""
+
+    child_claude: list[Path] = field(default_factory=list)
+    skills: list[Path] = field(default_factory=list)
+    rules: list[Path] = field(default_factory=list)  # root/.claude/rules/**.md
+    dirs: list[Path] = field(default_factory=list)  # directories scanned
+    visited: int = 0  # len(dirs)
+    pruned: int = 0  # directories skipped (skip list, .gitignore, max depth)
+
+
+def prune_dir(
+    name: str, rel: str, depth: int, rules: list[IgnoreRule], options: WalkOptions
+) -> bool:
+    """Should the walk skip this directory (at depth = its parent's depth)?"""
+    return (
+        name in options.skip
+        or (options.max_depth is not None and depth >= options.max_depth)
+        or bool(rules and is_ignored(rules, rel, True))
+    )
+
+
+def iter_tree(
+    root: Path,
+    options: WalkOptions = WalkOptions(),
+    pruned: list[tuple[str, str]] | None = None,
+) -> Iterator[str]:
+    """Yield root-relative POSIX paths of every directory and file under root.
+
+    Uses the same pruning as walk_project(); symlinked dirs are not followed.
+    Pruned directories are appended to pruned as (path, rel) when given.
+    """
+    stack: list[tuple[str, str, int, list[IgnoreRule]]] = [(str(root), "", 0, [])]
+    while stack:
+        directory, rel, depth, rules = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        if options.gitignore and any(e.name == ".gitignore" for e in entries):
+            rules = rules + parse_gitignore(Path(directory) / ".gitignore", rel)
+        for entry in entries:
+            child_rel = f"{rel}/{entry.name}" if rel else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if prune_dir(entry.name, child_rel, depth, rules, options):
+                    if pruned is not None:
+                        pruned.append((entry.path, child_rel))
+                    continue
+                stack.append((entry.path, child_rel, depth + 1, rules))
+            elif rules and is_ignored(rules, child_rel, False):
+                continue
+            yield child_rel
+
+
+@PROFILE.timed("tree_walk")
+def walk_project(root: Path, options: WalkOptions = WalkOptions()) -> WalkResult:
+    """Single os.scandir pass collecting child CLAUDE.md, skills and rules.
+
+    Prunes the skip list, .gitignore'd directories and anything below
+    max_depth — except the .claude/.agents skill and rule directories,
+    which Claude Code reads regardless. Symlinked directories are only
+    followed inside skill roots, where linking shared skills in is common.
+    """
+    result = WalkResult()
+    root = root.resolve()
+    rules_root = root / ".claude" / "rules"
+    skill_roots = {root / d for d in SKILL_DIRS}
+    skills_by_root: dict[Path, list[Path]] = {r: [] for r in skill_roots}
+    # Always descend into these (and everything inside rules/skill roots)
+    protected = {rules_root, *skill_roots, *(root / d.parent for d in SKILL_DIRS)}
+    followed: set[tuple[int, int]] = set()
+
+    # (directory, relative path, depth, ignore rules, skill root, in rules dir)
+    stack: list[tuple[Path, str, int, list[IgnoreRule], Path | None, bool]] = [
+        (root, "", 0, [], None, False)
+    ]
+    while stack:
+        directory, rel, depth, rules, skill_root, in_rules = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        result.visited += 1
+        result.dirs.append(directory)
+
+        if options.gitignore and any(e.name == ".gitignore" for e in entries):
+            rules = rules + parse_gitignore(directory / ".gitignore", rel)
+
+        for entry in entries:
+            path = Path(entry.path)
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+
+            if is_dir:
+                child_rel = f"{rel}/{entry.name}" if rel else entry.name
+                child_skill_root = skill_root or (path if path in skill_roots else None)
+                child_in_rules = in_rules or path == rules_root
+                if entry.is_symlink():
+                    if child_skill_root is None:
+                        continue
+                    try:
+                        st = path.stat()
+                    except OSError:
+                        continue
+                    if (st.st_dev, st.st_ino) in followed:
+                        continue
+                    followed.add((st.st_dev, st.st_ino))
+                keep = child_skill_root or child_in_rules or path in protected
+                if not keep and prune_dir(entry.name, child_rel, depth, rules, options):
+                    result.pruned += 1
+                    continue
+                stack.append(
+                    (
+                        path,
+                        child_rel,
+                        depth + 1,
+                        rules,
+                        child_skill_root,
+                        child_in_rules,
+                    )
+                )
+                continue
+
+            if not entry.name.endswith(".md"):
+                continue
+            if entry.name == "CLAUDE.md" and depth > 0:
+                result.child_claude.append(path)
+            if in_rules:
+                result.rules.append(path)
+            if skill_root is not None:
+                parts = path.relative_to(skill_root).parts[:-1]
+                if not any(part in SKILL_SKIP_SUBDIRS for part in parts):
+                    skills_by_root[skill_root].append(path)
+
+    result.child_claude.sort()
+    result.rules.sort()
+    for d in SKILL_DIRS:  # .claude/skills before .agents/skills
+        result.skills.extend(sorted(skills_by_root[root / d]))
+    return result
+
+
+# ── Rule matching ──────────────────────────────────────────────────
+
+
+def _normalize_rule_path(path: str) -> str:
+    path = path.replace(os.sep, "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path.lstrip("/")
+
+
+def _literal_prefix(pattern: str) -> tuple[str, ...]:
+    """Leading path components of a glob that contain no wildcard."""
+    parts = []
+    for part in pattern.split("/")[:-1]:
+        if any(c in part for c in "*?[{"):
+            break
+        parts.append(part)
+    return tuple(parts)
+
+
+# Dead-rule check: a second pass looks inside what the walk pruned, with
+# only VCS metadata skipped. Vendored or ignored output still counts.
+DEAD_RULE_WALK = WalkOptions(skip=frozenset({".git"}), gitignore=False)
+
+
+class RuleMatcher:
+    """The paths: globs of every conditional rule, compiled once.
+
+    rules_for() answers "which rules activate for this file?". find_dead()
+    checks all rules in a single walk: one combined regex is tried per path
+    and each rule drops out of it as soon as it has a match, so the walk
+    stops early once every rule is accounted for.
+    """
+
+    def __init__(self, memories: list[MemoryFile]) -> None:
+        self.rules = [m for m in memories if m.conditional and m.paths_filter]
+        self._sources = [
+            "|".join(glob_to_regex(_normalize_rule_path(p)) for p in m.paths_filter)
+            for m in self.rules
+        ]
+        self._regexes = [re.compile(f"(?:{src})\\Z") for src in self._sources]
+        self._prefixes = [
+            [_literal_prefix(_normalize_rule_path(p)) for p in m.paths_filter]
+            for m in self.rules
+        ]
+
+    def rules_for(self, path: str | Path, root: Path | None = None) -> list[MemoryFile]:
+        """Conditional rules whose paths: match a file (relative to root)."""
+        if root is not None and Path(path).is_absolute():
+            try:
+                path = Path(path).resolve().relative_to(root.resolve())
+            except ValueError:
+                return []
+        rel = _normalize_rule_path(str(path))
+        return [m for m, rx in zip(self.rules, self._regexes) if rx.match(rel)]
+
+    def _combined(self, indexes: set[int]) -> re.Pattern[str] | None:
+        if not indexes:
+            return None
+        return re.compile(
+            "|".join(f"(?P<r{i}>(?:{self._sources[i]})\\Z)" for i in sorted(indexes))
+        )
+
+    def find_dead(
+        self, root: Path, options: WalkOptions = WalkOptions()
+    ) -> list[MemoryFile]:
+        """Rules whose globs match no file or directory under root.
+
+        The pruned walk settles most rules cheaply. Rules still unmatched
+        are then checked inside the directories it pruned (skip list,
+        .gitignore, max depth) that their literal prefix can reach, so
+        build/ or ignored output is never reported dead while files exist.
+        """
+        remaining = set(range(len(self.rules)))
+        pruned: list[tuple[str, str]] = []
+        self._discard_matches(remaining, iter_tree(root, options, pruned))
+        for path, rel in pruned:
+            if not remaining:
+                break
+            if Path(path).name in DEAD_RULE_WALK.skip or not self._reaches(
+                remaining, rel
+            ):
+                continue
+            self._discard_matches(remaining, [rel])
+            self._discard_matches(
+                remaining,
+                (f"{rel}/{sub}" for sub in iter_tree(Path(path), DEAD_RULE_WALK)),
+            )
+        return [self.rules[i] for i in sorted(remaining)]
+
+    def _reaches(self, indexes: set[int], rel: str) -> bool:
+        """Could a path under directory rel match one of these rules?"""
+        parts = tuple(rel.split("/"))
+        return any(
+            parts[: len(prefix)] == prefix[: len(parts)]
+            for i in indexes
+            for prefix in self._prefixes[i]
+        )
+
+    def _discard_matches(self, remaining: set[int], paths: Iterable[str]) -> None:
+        """Drop from remaining every rule matching one of paths."""
+        combined = self._combined(remaining)
+        if combined is None:
+            return
+        for rel in paths:
+            match = combined.match(rel)
+            while match is not None and match.lastgroup:
+                remaining.discard(int(match.lastgroup[1:]))
+                combined = self._combined(remaining)
+                if combined is None:
+                    return
+                match = combined.match(rel)
+
+
+# ── Main loader ────────────────────────────────────────────────────
+
+
+@dataclass
+class UserLayers:
+    """Managed policy, user memory and user rules — identical for every project."""
+
+    memories: list[MemoryFile]
+    priority: int  # last priority used; project layers continue from here
+
+
+def _add_memory(
+    memories: list[MemoryFile], path: Path, kind: str, priority: int, **kwargs
+) -> MemoryFile | None:
+    """Append a startup file (plus its @-imports) if it exists."""
+    content = STORE.get(path)
+    if content is None:
+        return None
+    resolved = content.path
+    lines = content.lines
+    mf = MemoryFile(
+        path=resolved,
+        kind=kind,
+        priority=priority,
+        lines=lines,
+        loaded_lines=kwargs.get("loaded_lines", lines),
+        conditional=kwargs.get("conditional", False),
+        paths_filter=kwargs.get("paths_filter", []),
+        chars=content.chars,
+    )
+    memories.append(mf)
+    # Check for imports
+    memories.extend(find_imports(resolved))
+    return mf
+
+
+def load_user_layers() -> UserLayers:
+    """Load the layers that do not depend on the working directory."""
+    memories: list[MemoryFile] = []
+    priority = 0
+
+    def add(path: Path, kind: str, **kwargs) -> MemoryFile | None:
+        nonlocal priority
+        priority += 1
+        return _add_memory(memories, path, kind, priority, **kwargs)
+
+    # 1. Managed policy
+    with PROFILE.phase("managed"):
+        if MANAGED_POLICY.exists():
+            add(MANAGED_POLICY, "managed")
+
+    # 2. User memory
+    with PROFILE.phase("user"):
+        add(USER_CLAUDE, "user")
+
+    # 3. User rules
+    with PROFILE.phase("user_rules"):
+        if USER_RULES.exists():
+            for rule in sorted(USER_RULES.rglob("*.md")):
+                paths_filter = parse_rule_frontmatter(rule)
+                add(
+                    rule,
+                    "user_rule",
+                    conditional=bool(paths_filter),
+                    paths_filter=paths_filter,
+                )
+
+    return UserLayers(memories, priority)
+
+
+def load_memory_map(
+    cwd: Path,
+    user_layers: UserLayers | None = None,
+    walk: WalkResult | None = None,
+) -> list[MemoryFile]:
+    """Replicate Claude Code's memory loading algorithm.
+
+    Pass user_layers to reuse steps 1-3 across several projects, and walk
+    to reuse a walk_project() result (e.g. one made with custom options).
+    """
+    return list(iter_memory_map(cwd, user_layers, walk))
+
+
+def iter_memory_map(
+    cwd: Path,
+    user_layers: UserLayers | None = None,
+    walk: WalkResult | None = None,
+    walk_options: WalkOptions = WalkOptions(),
+) -> Iterator[MemoryFile]:
+    """Yield memory files in load order as soon as each one is found.
+
+    Startup files are deduplicated on the fly by resolved path (the first
+    occurrence wins, i.e. the higher-priority one). The tree walk is only
+    done when step 5 reaches the project's own rules. Profiler phases are
+    closed before each yield so the consumer's time is not charged here.
+    """
+    layers = user_layers if user_layers is not None else load_user_layers()
+    priority = layers.priority
+    seen_paths: set[Path] = set()
+
+    def unseen(entries: list[MemoryFile]) -> list[MemoryFile]:
+        fresh = []
+        with PROFILE.phase("dedupe"):
+            for m in entries:
+                canonical = STORE.resolve(m.path)
+                if canonical not in seen_paths:
+                    seen_paths.add(canonical)
+                    fresh.append(m)
+        return fresh
+
+    def add(path: Path, kind: str, **kwargs) -> list[MemoryFile]:
+        nonlocal priority
+        priority += 1
+        entries: list[MemoryFile] = []
+        _add_memory(entries, path, kind, priority, **kwargs)
+        return unseen(entries)
+
+    yield from unseen(layers.memories)
+
+    # 4. Auto-memory
+    entries = []
+    with PROFILE.phase("auto_memory"):
+        project_key = get_project_key(cwd)
+        auto_memory = AUTO_MEMORY_BASE / project_key / "memory" / "MEMORY.md"
+        auto_content = STORE.get(auto_memory)
+        if auto_content is not None:
+            total = auto_content.lines
+            priority += 1
+            entries.append(
+                MemoryFile(
+                    path=auto_content.path,
+                    kind="auto_memory",
+                    priority=priority,
+                    lines=total,
+                    loaded_lines=min(total, AUTO_MEMORY_LIMIT),
+                    chars=auto_content.chars,
+                )
+            )
+            # Check for topic files
+            memory_dir = auto_memory.parent
+            for topic in sorted(memory_dir.glob("*.md")):
+                if topic.name != "MEMORY.md":
+                    priority += 1
+                    entries.append(on_demand(topic, "auto_memory_topic", priority))
+    yield from unseen(entries)
+
+    # 5. Directory hierarchy (root → CWD)
+    hierarchy = []
+    cwd = cwd.resolve()
+    current = cwd
+    while current != current.parent:  # stop before /
+        hierarchy.append(current)
+        current = current.parent
+
+    # Walk from top (closest to /) down to CWD
+    for level in reversed(hierarchy):
+        with PROFILE.phase("hierarchy"):
+            # CLAUDE.md
+            entries = add(level / "CLAUDE.md", "project")
+            # CLAUDE.local.md (at every level, not just CWD)
+            entries += add(level / "CLAUDE.local.md", "local")
+            # .claude/CLAUDE.md
+            entries += add(level / ".claude" / "CLAUDE.md", "project")
+        yield from entries
+        # .claude/rules/*.md
+        with PROFILE.phase("hierarchy"):
+            rules_dir = level / ".claude" / "rules"
+            if level == cwd:
+                if walk is None:
+                    walk = walk_project(cwd, walk_options)
+                rules = walk.rules  # already collected by the tree walk
+            else:
+                rules = sorted(rules_dir.rglob("*.md")) if rules_dir.exists() else []
+        for rule in rules:
+            with PROFILE.phase("project_rules"):
+                paths_filter = parse_rule_frontmatter(rule)
+                entries = add(
+                    rule,
+                    "project_rule",
+                    conditional=bool(paths_filter),
+                    paths_filter=paths_filter,
+                )
+            yield from entries
+    if walk is None:  # cwd is /
+        walk = walk_project(cwd, walk_options)
+
+    # 7. Child directories (just detect, not loaded at startup)
+    for child_claude in walk.child_claude:
+        with PROFILE.phase("children"):
+            if STORE.resolve(child_claude) in seen_paths:
+                continue  # already loaded at startup (e.g. .claude/CLAUDE.md)
+            priority += 1
+            entry = on_demand(child_claude, "child", priority)
+        yield entry
+
+    # 8. Skills (.claude/skills/ and .agents/skills/, minus references/,
+    # scripts/ and assets/ subdirs — collected by the tree walk)
+    for skill_file in walk.skills:
+        with PROFILE.phase("skills"):
+            canonical = STORE.resolve(skill_file)
+            if canonical in seen_paths:
+                continue  # same skill reached through another symlink
+            seen_paths.add(canonical)
+            priority += 1
+            entry = on_demand(skill_file, "skill", priority)
+        yield entry
+
+
+# ── Audit ─────────────────────────────────────────────────────────
+
+AUDIT_WORKERS = 8  # threads shared by every audit in the process
+AUDIT_TIMEOUT = 10.0  # seconds a single check may take before it is skipped
+POOL_INPUTS = frozenset({"fs", "tokens", "imports"})  # inputs that block on I/O
+
+
+@dataclass
+class AuditContext:
+    """Read-only snapshot every check works from.
+
+    contents is filled before any check starts, so concurrent checks read
+    parsed files from one dict instead of racing on the content store.
+    """
+
+    memories: list[MemoryFile]
+    cwd: Path | None
+    contents: dict[Path, FileContent | None]
+    budget: int = CHAR_BUDGET
+    startup: list[MemoryFile] = field(init=False)
+    conditional: list[MemoryFile] = field(init=False)
+    base_chars: int = field(init=False)
+    max_chars: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.startup = [
+            m
+            for m in self.memories
+            if m.kind not in ("child", "auto_memory_topic", "skill")
+        ]
+        self.conditional = [m for m in self.startup if m.conditional]
+        self.base_chars = sum(m.chars for m in self.startup if not m.conditional)
+        self.max_chars = sum(m.chars for m in self.startup)
+
+    @classmethod
+    def snapshot(cls, memories: list[MemoryFile], cwd: Path | None) -> AuditContext:
+        paths = [m.path for m in memories]
+        if cwd:
+            paths.append(cwd / "CLAUDE.md")
+        return cls(memories, cwd, {p: STORE.get(p) for p in paths})
+
+    def content(self, path: Path) -> FileContent | None:
+        if path in self.contents:
+            return self.contents[path]
+        return STORE.get(path)
+
+
+@dataclass(frozen=True)
+class AuditCheck:
+    name: str
+    run: Callable[[AuditContext], Iterable[str]]
+    # What the check reads: memories, contents, cwd (skipped without one),
+    # fs, tokens, imports. Checks with POOL_INPUTS run on the audit pool,
+    # the rest inline.
+    inputs: frozenset[str]
+    timeout: float = AUDIT_TIMEOUT
+
+    @property
+    def pooled(self) -> bool:
+        return bool(self.inputs & POOL_INPUTS)
+
+
+AUDIT_CHECKS: list[AuditCheck] = []  # hints are reported in this order
+
+
+def audit_check(name: str, *inputs: str, timeout: float = AUDIT_TIMEOUT):
+    """Register a check: a function yielding hint strings for a context."""
+
+    def register(fn: Callable[[AuditContext], Iterable[str]]):
+        AUDIT_CHECKS.append(AuditCheck(name, fn, frozenset(inputs), timeout))
+        return fn
+
+    return register
+
+
+class DaemonPool:
+    """Minimal thread pool whose workers never block interpreter exit.
+
+    ThreadPoolExecutor joins its workers at exit, so a check stuck past its
+    timeout would hang the CLI; these workers are daemon threads instead.
+    A worker whose task is abandoned leaves the pool and a fresh one takes
+    its place, so hung tasks cannot use up the pool in a long-lived process.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self._queue = None  # created with the first worker
+        self._threads: list[threading.Thread] = []
+        self._running: dict[Future, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        import queue
+        from concurrent.futures import Future
+
+        future: Future = Future()
+        with self._lock:
+            if self._queue is None:
+                self._queue = queue.SimpleQueue()
+            self._queue.put((future, fn, args))
+            if len(self._threads) < self.workers:
+                self._spawn()
+        return future
+
+    def abandon(self, future: Future) -> None:
+        """Give up on future: cancel it, or replace the worker running it."""
+        if future.cancel():
+            return
+        with self._lock:
+            thread = self._running.pop(future, None)
+            if thread in self._threads:
+                self._threads.remove(thread)
+                self._spawn()
+
+    def _spawn(self) -> None:
+        thread = threading.Thread(target=self._work, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _work(self) -> None:
+        me = threading.current_thread()
+        while True:
+            future, fn, args = self._queue.get()
+            with self._lock:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running[future] = me
+            try:
+                future.set_result(fn(*args))
+            except BaseException as exc:
+                future.set_exception(exc)
+            with self._lock:
+                self._running.pop(future, None)
+                if me not in self._threads:
+                    return  # abandoned; a replacement already took over
+
+
+AUDIT_POOL = DaemonPool(AUDIT_WORKERS)
+
+
+def run_check(check: AuditCheck, ctx: AuditContext) -> list[str]:
+    with PROFILE.phase(f"audit.{check.name}"):
+        return list(check.run(ctx))
+
+
+def audit_memory(
+    memories: list[MemoryFile], cwd: Path | None = None, parallel: bool = True
+) -> list[str]:
+    """Analyze memory map and return optimization hints.
+
+    I/O-bound checks run concurrently on AUDIT_POOL, the rest inline while
+    they do. Hints always come back in AUDIT_CHECKS order. A check that
+    outlives its timeout (counted from submission) or raises is reported
+    as a hint and does not hold up the others.
+    """
+    from concurrent.futures import TimeoutError as FutureTimeout
+
+    ctx = AuditContext.snapshot(memories, cwd)
+    checks = [c for c in AUDIT_CHECKS if cwd or "cwd" not in c.inputs]
+    started = time.monotonic()
+    futures = {
+        c.name: AUDIT_POOL.submit(run_check, c, ctx)
+        for c in checks
+        if parallel and c.pooled
+    }
+
+    hints: list[str] = []
+    for check in checks:
+        future = futures.get(check.name)
+        try:
+            if future is None:
+                hints.extend(run_check(check, ctx))
+            else:
+                remaining = check.timeout - (time.monotonic() - started)
+                hints.extend(future.result(timeout=max(remaining, 0)))
+        except FutureTimeout:
+            AUDIT_POOL.abandon(future)
+            hints.append(
+                f"AUDIT TIMEOUT: {check.name} check did not finish"
+                f" in {check.timeout:g}s — skipped"
+            )
+        except Exception as exc:
+            hints.append(f"AUDIT ERROR: {check.name} check failed — {exc!r}")
+
+    if not hints:
+        hints.append("All good — no issues found.")
+
+    return hints
+
+
+@audit_check("broken_symlinks", "memories", "fs")
+def check_broken_symlinks(ctx: AuditContext) -> Iterator[str]:
+    for m in ctx.memories:
+        if m.path.is_symlink():
+            target = m.path.resolve()
+            if not target.exists():
+                yield f"BROKEN SYMLINK: {short_path(m.path)} → {short_path(target)} (target missing)"
+
+
+@audit_check("budget", "memories", "tokens")
+def check_budget(ctx: AuditContext) -> Iterator[str]:
+    """Context budget (base = always loaded, max = all rules active)."""
+    budget, base_chars, max_chars = ctx.budget, ctx.base_chars, ctx.max_chars
+    base_pct = int(base_chars / budget * 100) if budget else 0
+    max_pct = int(max_chars / budget * 100) if budget else 0
+    if ctx.conditional:
+        yield f"BUDGET: base {base_chars:,}c ({base_pct}%) / max {max_chars:,}c ({max_pct}%) of {budget // 1000}k"
+    else:
+        yield f"BUDGET: {base_chars:,}c ({base_pct}%) of {budget // 1000}k"
+
+    report = BUDGET.report(ctx.memories)
+    tokens_line = f"TOKENS: base {report.base:,} ({report.base_pct}%)"
+    if ctx.conditional:
+        tokens_line += f" / max {report.max:,} ({report.max_pct}%)"
+    tokens_line += f" of {report.budget:,} [{report.tokenizer}]"
+    if report.by_layer:
+        tokens_line += f" — {report.layers_display()}"
+    yield tokens_line
+    if report.base > report.budget:
+        over = report.base - report.budget
+        yield f"OVER TOKEN BUDGET: base context {over:,} tokens over limit."
+
+    if base_chars > budget:
+        yield f"OVER BUDGET: base context {base_chars - budget:,} chars over limit."
+    elif max_chars > budget:
+        yield f"MAX OVER BUDGET: worst-case {max_chars - budget:,} chars over limit (when all rules active)."
+
+
+@audit_check("large_files", "memories")
+def check_large_files(ctx: AuditContext) -> Iterator[str]:
+    """Large files (by lines or chars)."""
+    for m in ctx.startup:
+        mc = m.chars
+        if m.lines > 300 or mc > 10000:
+            pct_file = int(mc / ctx.budget * 100) if ctx.budget else 0
+            yield f"LARGE: {short_path(m.path)} ({m.lines}L / {mc:,}c = {pct_file}% of budget) — consider splitting"
+
+
+@audit_check("unconditional", "memories")
+def check_unconditional(ctx: AuditContext) -> Iterator[str]:
+    """Rules without paths: (always loaded)."""
+    for m in ctx.startup:
+        if m.kind == "project_rule" and not m.conditional and m.lines > 30:
+            yield f"UNCONDITIONAL: {short_path(m.path)} ({m.lines} lines) — add paths: frontmatter to make conditional"
+
+
+@audit_check("dead_rules", "memories", "cwd", "fs")
+def check_dead_rules(ctx: AuditContext) -> Iterator[str]:
+    """Dead conditional rules — paths: globs that match nothing."""
+    for m in RuleMatcher(ctx.startup).find_dead(ctx.cwd):
+        yield f"DEAD RULE: {short_path(m.path)} — paths: {m.paths_filter} match no files in {short_path(ctx.cwd)}"
+
+
+@audit_check("chain_gap", "memories", "cwd", "fs")
+def check_chain_gap(ctx: AuditContext) -> Iterator[str]:
+    """Inheritance chain — check for gaps in project hierarchy."""
+    if not any(m.kind == "project" for m in ctx.startup):
+        return
+    deepest = ctx.cwd.resolve()
+    git_root = find_git_root(ctx.cwd)
+    chain_root = git_root if git_root else deepest
+    # Walk from chain_root up — check each parent for CLAUDE.md
+    current = deepest.parent
+    while current != current.parent and current != chain_root.parent:
+        expected = current / "CLAUDE.md"
+        if (
+            current.name
+            and not current.name.startswith(".")
+            and any(
+                d.is_dir() and (d / "CLAUDE.md").exists() for d in current.iterdir()
+            )
+            and not expected.exists()
+        ):
+            yield f"CHAIN GAP: {short_path(current)} has child projects but no CLAUDE.md"
+        current = current.parent
+
+
+@audit_check("essential_sections", "contents", "cwd")
+def check_essential_sections(ctx: AuditContext) -> Iterator[str]:
+    """Essential sections in CWD CLAUDE.md."""
+    cwd_claude = ctx.cwd / "CLAUDE.md"
+    cwd_content = ctx.content(cwd_claude)
+    if cwd_content is None:
+        return
+    headers = set(cwd_content.headers)
+    missing = []
+    # Check for common essential headers (flexible matching)
+    has_structure = any(
+        h for h in headers if "structure" in h or "directory" in h or "layout" in h
+    )
+    has_commands = any(
+        h for h in headers if "command" in h or "usage" in h or "make" in h
+    )
+    if not has_structure:
+        missing.append("project structure")
+    if not has_commands:
+        missing.append("commands/usage")
+    if missing:
+        yield f"INCOMPLETE: {short_path(cwd_claude)} missing sections: {', '.join(missing)}"
+
+
+@audit_check("duplicates", "memories", "contents")
+def check_duplicates(ctx: AuditContext) -> Iterator[str]:
+    """Duplicate content detection (same section headers)."""
+    sections_by_file: dict[str, list[str]] = {}
+    for m in ctx.startup:
+        content = ctx.content(m.path)
+        if content is None:
+            continue
+        sections_by_file[short_path(m.path)] = content.headers
+
+    all_headers: dict[str, list[str]] = {}
+    for fpath, headers in sections_by_file.items():
+        for h in headers:
+            all_headers.setdefault(h, []).append(fpath)
+    for header, files in all_headers.items():
+        if len(files) > 1:
+            yield f"DUPLICATE: section '{header}' appears in {', '.join(files)}"
+
+
+@audit_check("imports", "memories", "contents", "imports")
+def check_imports(ctx: AuditContext) -> Iterator[str]:
+    """Import graph — cycles, imports shared by several files, depth limit."""
+    roots = [m.path for m in ctx.startup if m.kind != "import"]
+    for cycle in IMPORTS.cycles(roots):
+        cost = sum(c.chars for f in set(cycle) if (c := ctx.content(f)))
+        chain = " → ".join(short_path(f) for f in cycle)
+        yield f"IMPORT CYCLE: {chain} ({cost:,}c in cycle)"
+    importers: dict[Path, set[Path]] = {}
+    for root in roots:
+        summary = IMPORTS.summary(root)
+        for f in summary.files:
+            importers.setdefault(f, set()).add(root)
+        if summary.truncated:
+            yield (
+                f"IMPORT DEPTH: {short_path(root)} — {len(summary.truncated)} file(s)"
+                f" past the {MAX_IMPORT_DEPTH}-level @-import limit are not loaded"
+            )
+    shared = [
+        (IMPORTS.summary(f), len(by)) for f, by in importers.items() if len(by) > 1
+    ]
+    shared.sort(key=lambda item: (-item[0].chars, str(item[0].root)))
+    for summary, count in shared[:5]:
+        pct_file = int(summary.chars / ctx.budget * 100) if ctx.budget else 0
+        yield (
+            f"SHARED IMPORT: {short_path(summary.root)} loaded by {count} files"
+            f" — {summary.chars:,}c / {summary.tokens:,} tokens incl. its imports"
+            f" ({pct_file}% of budget)"
+        )
+
+
+# ── Memory best practices (per code.claude.com/docs/en/memory) ──
+
+
+@audit_check("local_ignored", "cwd", "fs")
+def check_local_ignored(ctx: AuditContext) -> Iterator[str]:
+    """CLAUDE.local.md should be in .gitignore."""
+    local_md = ctx.cwd / "CLAUDE.local.md"
+    if not local_md.exists():
+        return
+    gitignore = ctx.cwd / ".gitignore"
+    is_ignored = False
+    if gitignore.exists():
+        try:
+            gi_text = gitignore.read_text()
+            is_ignored = "CLAUDE.local.md" in gi_text
+        except Exception:
+            pass
+    if not is_ignored:
+        yield f"LOCAL NOT IGNORED: {short_path(local_md)} exists but not in .gitignore"
+
+
+@audit_check("auto_memory", "memories")
+def check_auto_memory(ctx: AuditContext) -> Iterator[str]:
+    """Auto-memory MEMORY.md > 200 lines (only first 200 loaded)."""
+    for m in ctx.memories:
+        if m.kind == "auto_memory" and m.lines > 200:
+            yield f"AUTO-MEMORY LONG: {short_path(m.path)} ({m.lines}L) — only first 200 loaded. Move details to topic files"
+
+
+@audit_check("generic_names", "memories")
+def check_generic_names(ctx: AuditContext) -> Iterator[str]:
+    """Rules with generic names (should be descriptive per official docs)."""
+    generic_names = {"rules.md", "misc.md", "other.md", "notes.md", "extra.md"}
+    for m in ctx.memories:
+        if m.kind in ("project_rule", "user_rule"):
+            if m.path.name.lower() in generic_names:
+                yield f"GENERIC RULE NAME: {short_path(m.path)} — use descriptive name (e.g., testing.md, api-design.md)"
+
+
+# ── Skills best practices ──
+
+
+@audit_check("skills", "memories", "contents")
+def check_skills(ctx: AuditContext) -> Iterator[str]:
+    skills = [m for m in ctx.memories if m.kind == "skill"]
+    if not skills:
+        return
+    # Group by parent folder to distinguish references from legacy
+    skill_folders: dict[Path, list[MemoryFile]] = {}
+    for s in skills:
+        skill_folders.setdefault(s.path.parent, []).append(s)
+
+    for folder, files in skill_folders.items():
+        has_skill_md = any(f.path.name == "SKILL.md" for f in files)
+        if not has_skill_md:
+            # All .md files in this folder are legacy (no SKILL.md)
+            for f in files:
+                yield f"LEGACY SKILL: {short_path(f.path)} — migrate to {folder.name}/SKILL.md"
+
+    # Check SKILL.md frontmatter quality
+    for s in skills:
+        if s.path.name != "SKILL.md":
+            continue
+        content = ctx.content(s.path)
+        if content is None:
+            continue
+        # Check for frontmatter
+        if not content.has_fence:
+            yield f"SKILL NO FRONTMATTER: {short_path(s.path)} — add name: and description:"
+            continue
+        fm = content.frontmatter
+        if fm is None:
+            continue
+        has_name = any(line.strip().startswith("name:") for line in fm.splitlines())
+        has_desc = any(
+            line.strip().startswith("description:") for line in fm.splitlines()
+        )
+        if not has_name:
+            yield f"SKILL NO NAME: {short_path(s.path)} — add name: field"
+        if not has_desc:
+            yield f"SKILL NO DESC: {short_path(s.path)} — add description: with trigger phrases"
+        # Large skill
+        if s.lines > 200:
+            yield f"SKILL LARGE: {short_path(s.path)} ({s.lines}L) — move details to references/"
+
+    # Too many skills
+    proper_count = sum(1 for s in skills if s.path.name == "SKILL.md")
+    if proper_count > 20:
+        yield f"SKILL OVERLOAD: {proper_count} skills — consider selective enablement or skill packs"
+
+
+@audit_check("no_auto_memory", "memories")
+def check_no_auto_memory(ctx: AuditContext) -> Iterator[str]:
+    if not any(m.kind == "auto_memory" for m in ctx.memories):
+        yield "NO AUTO-MEMORY: consider enabling for cross-session learning"
+
+
+# ── Display ────────────────────────────────────────────────────────
+
+KIND_LABELS = {
+    "managed": "Managed Policy",
+    "user": "User Memory",
+    "user_rule": "User Rule",
+    "auto_memory": "Auto Memory",
+    "auto_memory_topic": "Auto Topic (on-demand)",
+    "project": "Project",
+    "project_rule": "Project Rule",
+    "local": "Local",
+    "child": "Child (on-demand)",
+    "import": "Import (@)",
+    "skill": "Skill",
+}
+
+KIND_COLORS = {
+    "managed": "red",
+    "user": "cyan",
+    "user_rule": "cyan",
+    "auto_memory": "magenta",
+    "auto_memory_topic": "dim magenta",
+    "project": "green",
+    "project_rule": "yellow",
+    "local": "blue",
+    "child": "dim",
+    "import": "dim cyan",
+    "skill": "bright_blue",
+}
+
+KIND_MARKERS = {
+    "managed": "!!",
+    "user": "~~",
+    "user_rule": "~r",
+    "auto_memory": "am",
+    "auto_memory_topic": "at",
+    "project": ">>",
+    "project_rule": "pr",
+    "local": "**",
+    "child": "..",
+    "import": "@@",
+    "skill": "sk",
+}
+
+
+def display_rich(
+    cwd: Path,
+    memories: list[MemoryFile],
+    show_audit: bool = False,
+    hints: list[str] | None = None,
+    walk: WalkResult | None = None,
+    console: Console | None = None,
+) -> None:
+    """Rich tree display."""
+    load_rich()
+    console = console or Console()
+    git_root = find_git_root(cwd)
+
+    startup = [
+        m for m in memories if m.kind not in ("child", "auto_memory_topic", "skill")
+    ]
+    on_demand = [m for m in memories if m.kind in ("child", "auto_memory_topic")]
+    skills = [m for m in memories if m.kind == "skill"]
+    always = [m for m in startup if not m.conditional]
+    conditional = [m for m in startup if m.conditional]
+    base_chars = sum(m.chars for m in always)
+    max_chars = sum(m.chars for m in startup)
+
+    # Header
+    header = Text()
+    header.append(f"CWD: {cwd}\n", style="bold")
+    if git_root:
+        header.append(f"Git: {git_root}\n", style="dim")
+    header.append(f"Key: {get_project_key(cwd)}", style="dim")
+    if walk is not None:
+        header.append(
+            f"\nScan: {walk.visited} dirs visited, {walk.pruned} pruned", style="dim"
+        )
+
+    tree = Tree(
+        Panel(header, title="Claude Code Memory Map", border_style="blue"),
+        guide_style="dim",
+    )
+
+    # Budget line
+    budget = CHAR_BUDGET
+    base_pct = int(base_chars / budget * 100)
+    max_pct = int(max_chars / budget * 100)
+    budget_style = "green" if base_pct < 50 else ("yellow" if base_pct < 75 else "red")
+    tree.add(
+        f"[{budget_style}]Budget: {base_chars:,}c base ({base_pct}%)"
+        + (f" / {max_chars:,}c max ({max_pct}%)" if conditional else "")
+        + f" of {budget // 1000}k[/]"
+    )
+    if show_audit or BUDGET.requested:
+        report = BUDGET.report(memories)
+        token_style = (
+            "green"
+            if report.base_pct < 50
+            else ("yellow" if report.base_pct < 75 else "red")
+        )
+        tree.add(
+            f"[{token_style}]Tokens: {report.base:,} base ({report.base_pct}%)"
+            + (f" / {report.max:,} max ({report.max_pct}%)" if conditional else "")
+            + f" of {report.budget:,}[/]"
+            + f" [dim]{report.tokenizer} — {report.layers_display()}[/]"
+        )
+
+    # Always-loaded branch
+    always_branch = tree.add(
+        f"[bold green]Always loaded[/] ({len(always)} files, {base_chars:,}c)"
+    )
+    for m in always:
+        color = KIND_COLORS.get(m.kind, "white")
+        label = KIND_LABELS.get(m.kind, m.kind)
+        name = m.path.name
+        size = (
+            f"{m.loaded_lines}L / {m.chars:,}c" if m.chars > 0 else f"{m.loaded_lines}L"
+        )
+        entry = f"[{color}]{name}[/] [dim]{label} | {size}[/]"
+        if m.imported_by:
+            entry += f" [dim italic](from {Path(m.imported_by).name})[/]"
+        always_branch.add(entry)
+
+    # Conditional rules branch
+    if conditional:
+        cond_chars = sum(m.chars for m in conditional)
+        cond_branch = tree.add(
+            f"[bold yellow]Conditional rules[/] ({len(conditional)} files, {cond_chars:,}c — loaded by paths:)"
+        )
+        for m in conditional:
+            name = m.path.name
+            size = (
+                f"{m.loaded_lines}L / {m.chars:,}c"
+                if m.chars > 0
+                else f"{m.loaded_lines}L"
+            )
+            paths_str = ", ".join(m.paths_filter[:2])
+            if len(m.paths_filter) > 2:
+                paths_str += f" +{len(m.paths_filter) - 2}"
+            entry = f"[yellow]{name}[/] [dim]{size} → {paths_str}[/]"
+            cond_branch.add(entry)
+
+    # On-demand branch
+    if on_demand:
+        od_branch = tree.add(f"[dim]On-demand[/] ({len(on_demand)} files)")
+        for m in on_demand:
+            od_branch.add(f"[dim]{short_path(m.path)} ({m.lines} lines)[/]")
+
+    # Skills branch
+    if skills:
+        # Group by folder to distinguish references from true legacy
+        sk_folders: dict[Path, list[MemoryFile]] = {}
+        for s in skills:
+            sk_folders.setdefault(s.path.parent, []).append(s)
+
+        proper = [s for s in skills if s.path.name == "SKILL.md"]
+        true_legacy = [
+            s
+            for s in skills
+            if s.path.name != "SKILL.md"
+            and not any(f.path.name == "SKILL.md" for f in sk_folders[s.path.parent])
+        ]
+        refs = [
+            s
+            for s in skills
+            if s.path.name != "SKILL.md"
+            and any(f.path.name == "SKILL.md" for f in sk_folders[s.path.parent])
+        ]
+
+        skills_label = f"[bold bright_blue]Skills[/] ({len(proper)}"
+        if true_legacy:
+            skills_label += f", {len(true_legacy)} legacy"
+        skills_label += ")"
+        sk_branch = tree.add(skills_label)
+        for s in proper:
+            folder = s.path.parent.name
+            ref_count = sum(1 for r in refs if r.path.parent == s.path.parent)
+            ref_note = f" +{ref_count} refs" if ref_count else ""
+            sk_branch.add(f"[bright_blue]{folder}/[/] [dim]{s.lines}L{ref_note}[/]")
+        for s in true_legacy:
+            sk_branch.add(f"[dim yellow]{s.path.name}[/] [dim]{s.lines}L (legacy)[/]")
+
+    console.print(tree)
+
+    # Audit
+    if show_audit:
+        if hints is None:
+            hints = audit_memory(memories, cwd)
+        if hints:
+            console.print()
+            table = Table(title="Audit Hints", border_style="yellow", show_lines=True)
+            table.add_column("Type", style="bold", width=15)
+            table.add_column("Details")
+            for h in hints:
+                parts = h.split(": ", 1)
+                if len(parts) == 2:
+                    table.add_row(parts[0], parts[1])
+                else:
+                    table.add_row("INFO", h)
+            console.print(table)
+
+
+def display_plain(
+    cwd: Path,
+    memories: list[MemoryFile],
+    show_audit: bool = False,
+    hints: list[str] | None = None,
+    walk: WalkResult | None = None,
+) -> None:
+    """Plain text fallback display."""
+    startup = [
+        m for m in memories if m.kind not in ("child", "auto_memory_topic", "skill")
+    ]
+    always = [m for m in startup if not m.conditional]
+    conditional = [m for m in startup if m.conditional]
+    base_chars = sum(m.chars for m in always)
+    max_chars = sum(m.chars for m in startup)
+    on_demand_list = [m for m in memories if m.kind in ("child", "auto_memory_topic")]
+    skills_list = [m for m in memories if m.kind == "skill"]
+
+    print(f"\n{'=' * 60}")
+    print("  Claude Code Memory Map")
+    print(f"  CWD: {cwd}")
+    git_root = find_git_root(cwd)
+    if git_root:
+        print(f"  Git: {git_root}")
+    print(f"  Project key: {get_project_key(cwd)}")
+    if walk is not None:
+        print(f"  Scan: {walk.visited} dirs visited, {walk.pruned} pruned")
+    budget = CHAR_BUDGET
+    base_pct = int(base_chars / budget * 100)
+    max_pct = int(max_chars / budget * 100)
+    budget_line = f"  Budget: {base_chars:,}c base ({base_pct}%)"
+    if conditional:
+        budget_line += f" / {max_chars:,}c max ({max_pct}%)"
+    budget_line += f" of {budget // 1000}k"
+    print(budget_line)
+    if show_audit or BUDGET.requested:
+        report = BUDGET.report(memories)
+        tokens_line = f"  Tokens: {report.base:,} base ({report.base_pct}%)"
+        if conditional:
+            tokens_line += f" / {report.max:,} max ({report.max_pct}%)"
+        tokens_line += f" of {report.budget:,} [{report.tokenizer}]"
+        print(tokens_line)
+        if report.by_layer:
+            print(f"    {report.layers_display()}")
+    print(f"{'=' * 60}\n")
+
+    # Always loaded
+    print(f"  Always loaded ({len(always)} files, {base_chars:,}c):")
+    print(f"  {'─' * 50}")
+    for m in always:
+        marker = KIND_MARKERS.get(m.kind, "  ")
+        label = KIND_LABELS.get(m.kind, m.kind)
+        display_path = short_path(m.path)
+        size = m.size_display
+        imp = (
+            f" (from {m.imported_by.replace(home_str(), '~')})" if m.imported_by else ""
+        )
+        print(f"  [{marker}] {display_path}")
+        print(f"       {label} | {size}{imp}")
+    print()
+
+    # Conditional rules
+    if conditional:
+        cond_chars = sum(m.chars for m in conditional)
+        print(f"  Conditional rules ({len(conditional)} files, {cond_chars:,}c):")
+        print(f"  {'─' * 50}")
+        for m in conditional:
+            marker = KIND_MARKERS.get(m.kind, "  ")
+            display_path = short_path(m.path)
+            size = m.size_display
+            paths_str = ", ".join(m.paths_filter[:2])
+            if len(m.paths_filter) > 2:
+                paths_str += f" +{len(m.paths_filter) - 2}"
+            print(f"  [{marker}] {display_path}")
+            print(f"       {size} → {paths_str}")
+        print()
+
+    # On-demand
+    if on_demand_list:
+        print(f"  On-demand ({len(on_demand_list)} files):")
+        print(f"  {'─' * 50}")
+        for m in on_demand_list:
+            marker = KIND_MARKERS.get(m.kind, "  ")
+            label = KIND_LABELS.get(m.kind, m.kind)
+            display_path = short_path(m.path)
+            size = m.size_display
+            imp = (
+                f" (from {m.imported_by.replace(home_str(), '~')})"
+                if m.imported_by
+                else ""
+            )
+            print(f"  [{marker}] {display_path}")
+            print(f"       {label} | {size}{imp}")
+        print()
+
+    # Skills
+    if skills_list:
+        sk_folders: dict[Path, list[MemoryFile]] = {}
+        for s in skills_list:
+            sk_folders.setdefault(s.path.parent, []).append(s)
+        proper = [s for s in skills_list if s.path.name == "SKILL.md"]
+        true_legacy = [
+            s
+            for s in skills_list
+            if s.path.name != "SKILL.md"
+            and not any(f.path.name == "SKILL.md" for f in sk_folders[s.path.parent])
+        ]
+        refs = [
+            s
+            for s in skills_list
+            if s.path.name != "SKILL.md"
+            and any(f.path.name == "SKILL.md" for f in sk_folders[s.path.parent])
+        ]
+        label = f"  Skills ({len(proper)}"
+        if true_legacy:
+            label += f", {len(true_legacy)} legacy"
+        label += "):"
+        print(label)
+        print(f"  {'─' * 50}")
+        for s in proper:
+            folder = s.path.parent.name
+            ref_count = sum(1 for r in refs if r.path.parent == s.path.parent)
+            ref_note = f" +{ref_count} refs" if ref_count else ""
+            print(f"  [sk] {folder}/ ({s.lines}L{ref_note})")
+        for s in true_legacy:
+            print(f"  [sk] {s.path.name} ({s.lines}L) — legacy")
+        print()
+
+    if show_audit:
+        if hints is None:
+            hints = audit_memory(memories, cwd)
+        print(f"  {'─' * 50}")
+        print("  Audit:")
+        for h in hints:
+            print(f"    {h}")
+        print()
+
+
+def display_timings_rich(console: Console | None = None) -> None:
+    """Per-phase table for --timings (rich)."""
+    load_rich()
+    console = console or Console()
+    table = Table(title="Timings", border_style="dim")
+    table.add_column("Phase", style="bold")
+    for column in ("ms", "calls", "reads", "bytes", "syscalls"):
+        table.add_column(column, justify="right")
+    rows = sorted(PROFILE.phases.values(), key=lambda p: -p.wall)
+    for p in [*rows, PROFILE.total()]:
+        table.add_row(
+            p.name,
+            f"{p.wall * 1000:.2f}",
+            str(p.calls),
+            str(p.reads),
+            f"{p.bytes_read:,}",
+            str(p.syscalls),
+        )
+    console.print()
+    console.print(table)
+
+
+def display_timings_plain() -> None:
+    """Per-phase table for --timings (plain text)."""
+    print(f"  {'─' * 50}")
+    print("  Timings (slowest first, threads summed):")
+    print(
+        f"    {'phase':<28} {'ms':>9} {'calls':>6} {'reads':>6}"
+        f" {'bytes':>10} {'syscalls':>8}"
+    )
+    rows = sorted(PROFILE.phases.values(), key=lambda p: -p.wall)
+    for p in [*rows, PROFILE.total()]:
+        print(
+            f"    {p.name:<28} {p.wall * 1000:>9.2f} {p.calls:>6} {p.reads:>6}"
+            f" {p.bytes_read:>10,} {p.syscalls:>8}"
+        )
+    print()
+
+
+def format_json(
+    memories: list[MemoryFile], timings: bool = False, hints: list[str] | None = None
+) -> str:
+    """JSON list of files; with hints or timings, {"memories": [...], ...}."""
+    files = [m.to_dict() for m in memories]
+    if hints is None and not timings:
+        return json.dumps(files, indent=2, default=str)
+    payload: dict[str, object] = {"memories": files}
+    if hints is not None:
+        payload["hints"] = hints
+    if timings:
+        payload["timings"] = PROFILE.to_dict()
+    return json.dumps(payload, indent=2, default=str)
+
+
+def display_json(memories: list[MemoryFile], timings: bool = False) -> None:
+    print(format_json(memories, timings))
+
+
+def stream_json_object(items: Iterable[tuple[str, object]]) -> None:
+    """Print a JSON object entry by entry, same layout as json.dumps(indent=2)."""
+    first = True
+    for key, value in items:
+        body = json.dumps(value, indent=2, default=str).replace("\n", "\n  ")
+        prefix = "{\n" if first else ",\n"
+        print(f"{prefix}  {json.dumps(key)}: {body}", end="", flush=True)
+        first = False
+    print("{}" if first else "\n}")
+
+
+NDJSON_SCHEMA = "solo-factory/memory-map"
+NDJSON_VERSION = 1
+
+
+def emit_record(record: dict) -> None:
+    """Write one NDJSON record and flush so consumers see it immediately."""
+    print(json.dumps(record, default=str, separators=(",", ":")), flush=True)
+
+
+def ndjson_header(mode: str, path: Path) -> dict:
+    return {
+        "type": "header",
+        "schema": NDJSON_SCHEMA,
+        "version": NDJSON_VERSION,
+        "mode": mode,  # project | all-projects
+        "path": str(path),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def stream_ndjson(
+    cwd: Path, show_audit: bool = False, walk_options: WalkOptions = WalkOptions()
+) -> None:
+    """header, one "memory" record per file as it is found, audit,
+    timings (with --timings), summary."""
+    started = time.perf_counter()
+    emit_record(ndjson_header("project", cwd))
+    memories = []
+    first_ms = None
+    for m in iter_memory_map(cwd, walk_options=walk_options):
+        if first_ms is None:
+            first_ms = (time.perf_counter() - started) * 1000
+        memories.append(m)
+        emit_record({"type": "memory", **m.to_dict()})
+    load_ms = (time.perf_counter() - started) * 1000
+    summary: dict = {"type": "summary", "files": len(memories)}
+    if show_audit:
+        audit_started = time.perf_counter()
+        hints = audit_memory(memories, cwd)
+        audit_ms = (time.perf_counter() - audit_started) * 1000
+        emit_record({"type": "audit", "hints": hints})
+        summary["audit_ms"] = round(audit_ms, 2)
+    summary["first_record_ms"] = round(first_ms or 0, 2)
+    summary["load_ms"] = round(load_ms, 2)
+    summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    if PROFILE.enabled:
+        emit_record({"type": "timings", **PROFILE.to_dict()})
+    emit_record(summary)
+
+
+# ── Multi-project scan ─────────────────────────────────────────────
+
+
+@dataclass
+class ProjectScan:
+    cwd: Path
+    memories: MemoryTable
+    hints: list[str] | None = None
+    walk: WalkResult | None = None
+    elapsed: float = 0.0  # seconds spent loading (and auditing) this project
+
+
+def scan_projects(
+    dirs: list[Path],
+    workers: int = DEFAULT_WORKERS,
+    audit: bool = False,
+    walk_options: WalkOptions = WalkOptions(),
+) -> Iterator[ProjectScan]:
+    """Load (and optionally audit) many projects on a thread pool.
+
+    User-level layers are loaded once and shared. Results are yielded in
+    input order, each as soon as it and every project before it is done.
+    Each result keeps its map as a MemoryTable and only the walk counters,
+    so hundreds of finished projects waiting in order stay small.
+    """
+    layers = load_user_layers()
+    strings, filters = Interner(), Interner(())  # shared by this scan's tables
+
+    def scan(d: Path) -> ProjectScan:
+        started = time.perf_counter()
+        walk = walk_project(d, walk_options)
+        memories = load_memory_map(d, layers, walk)
+        hints = audit_memory(memories, d) if audit else None
+        return ProjectScan(
+            d,
+            MemoryTable(memories, strings, filters),
+            hints,
+            WalkResult(visited=walk.visited, pruned=walk.pruned),
+            time.perf_counter() - started,
+        )
+
+    if workers <= 1 or len(dirs) <= 1:
+        yield from map(scan, dirs)
+        return
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(scan, dirs)
+
+
+# ── Fleet dedupe ───────────────────────────────────────────────────
+
+DEDUPE_KINDS = frozenset({"project", "local", "project_rule", "import"})
+MIN_DEDUPE_CHARS = 200  # smaller blocks are not worth hoisting
+NEAR_DUP_THRESHOLD = 0.8  # Jaccard similarity of normalized line sets
+MIN_SHINGLES = 3  # distinct lines a section needs for near-dup matching
+MINHASH_BANDS = 4  # LSH: candidates share all rows of at least one band
+MINHASH_ROWS = 4
+DEDUPE_TOP = 20  # groups shown in rich/plain output (JSON has all)
+_MINHASH_PRIME = (1 << 61) - 1
+
+
+@functools.cache
+def _minhash_seeds() -> list[tuple[int, int]]:
+    import hashlib
+
+    def seed(tag: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(tag, digest_size=8).digest(), "big")
+
+    return [
+        (seed(b"a%d" % i) | 1, seed(b"b%d" % i))
+        for i in range(MINHASH_BANDS * MINHASH_ROWS)
+    ]
+
+
+def normalize_block(lines: list[str]) -> str:
+    """Strip trailing whitespace, collapse blank runs, trim blank ends."""
+    out: list[str] = []
+    for line in lines:
+        line = line.rstrip()
+        if line or (out and out[-1]):
+            out.append(line)
+    while out and not out[-1]:
+        out.pop()
+    return "\n".join(out)
+
+
+@dataclass
+class SectionHash:
+    header: str  # "## ..." line as written, "" for text before the first one
+    digest: str  # of the normalized section text
+    chars: int
+    tokens: int
+    shingles: list[int]  # crc32 of each distinct non-blank normalized line
+
+
+@dataclass
+class FileHashes:
+    digest: str  # of the normalized whole file
+    chars: int
+    tokens: int
+    sections: list[SectionHash]
+
+
+def _blake(text: str) -> str:
+    import hashlib
+
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def hash_sections(text: str, tokenizer) -> FileHashes:
+    """Split on "## " headings outside code fences and hash each section.
+
+    Frontmatter belongs to the whole-file hash only, so the same section
+    copied into rules with different paths: still matches.
+    """
+    lines = text.splitlines()
+    whole = normalize_block(lines)
+    start = 0
+    if lines and lines[0].strip() == "---":
+        for i in range(1, len(lines)):
+            if lines[i].strip() == "---":
+                start = i + 1
+                break
+
+    blocks: list[list[str]] = [[]]
+    in_code = False
+    for line in lines[start:]:
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        elif not in_code and line.startswith("## "):
+            blocks.append([])
+        blocks[-1].append(line)
+
+    sections = []
+    for block in blocks:
+        body = normalize_block(block)
+        if not body:
+            continue
+        header = block[0].rstrip() if block[0].startswith("## ") else ""
+        shingles = sorted(
+            {zlib.crc32(line.encode()) for line in body.splitlines() if line}
+        )
+        sections.append(
+            SectionHash(
+                header, _blake(body), len(body), tokenizer.count(body), shingles
+            )
+        )
+    return FileHashes(_blake(whole), len(whole), tokenizer.count(whole), sections)
+
+
+def minhash(shingles: list[int]) -> tuple[int, ...]:
+    return tuple(
+        min((a * s + b) % _MINHASH_PRIME for s in shingles) for a, b in _minhash_seeds()
+    )
+
+
+def jaccard(a: list[int], b: list[int]) -> float:
+    sa, sb = set(a), set(b)
+    return len(sa & sb) / len(sa | sb) if sa or sb else 1.0
+
+
+@dataclass
+class DedupeGroup:
+    kind: str  # file | section | near
+    label: str  # file name or section header
+    files: list[Path]
+    projects: int
+    chars: int  # per copy (smallest copy for near duplicates)
+    tokens: int
+    # Copies hoisting would remove, counted once per file group (or per
+    # variant for near duplicates) so overlapping groups are not summed twice
+    copies: int
+    similarity: float = 1.0
+    in_context_chars: int = 0  # extra copies loaded together by one project
+
+    @property
+    def saved_chars(self) -> int:
+        return (self.copies - 1) * self.chars
+
+    @property
+    def saved_tokens(self) -> int:
+        return (self.copies - 1) * self.tokens
+
+    def hint(self) -> str:
+        tag = {"file": "EXACT FILE", "section": "EXACT SECTION", "near": "NEAR SECTION"}
+        what = (
+            f"{len(self.files)} copies of {self.label}"
+            if self.kind == "file"
+            else f"'{self.label or '(preamble)'}' in {len(self.files)} files"
+        )
+        if self.kind == "near":
+            what += f" (≥{int(self.similarity * 100)}% similar)"
+        text = (
+            f"{tag[self.kind]}: {what} across {self.projects} project(s)"
+            f" — {self.chars:,}c / {self.tokens:,} tokens each;"
+            f" hoist to ~/.claude/rules to save"
+            f" {self.saved_chars:,}c / {self.saved_tokens:,} tokens"
+        )
+        if self.in_context_chars:
+            text += f" ({self.in_context_chars:,}c loaded twice in-session)"
+        return text
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "label": self.label,
+            "files": [str(f) for f in self.files],
+            "projects": self.projects,
+            "chars": self.chars,
+            "tokens": self.tokens,
+            "copies": self.copies,
+            "similarity": round(self.similarity, 3),
+            "saved_chars": self.saved_chars,
+            "saved_tokens": self.saved_tokens,
+            "in_context_chars": self.in_context_chars,
+        }
+
+
+@dataclass
+class DedupeReport:
+    projects: int
+    files: int
+    sections: int
+    tokenizer: str
+    groups: list[DedupeGroup]
+
+    @property
+    def saved_chars(self) -> int:
+        return sum(g.saved_chars for g in self.groups)
+
+    @property
+    def saved_tokens(self) -> int:
+        return sum(g.saved_tokens for g in self.groups)
+
+    def summary(self) -> str:
+        return (
+            f"DEDUPE: {self.projects} projects, {self.files} files,"
+            f" {self.sections} sections hashed — {len(self.groups)} duplicate group(s),"
+            f" {self.saved_chars:,}c / {self.saved_tokens:,} tokens recoverable"
+            f" [{self.tokenizer}]"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "projects": self.projects,
+            "files": self.files,
+            "sections": self.sections,
+            "tokenizer": self.tokenizer,
+            "saved_chars": self.saved_chars,
+            "saved_tokens": self.saved_tokens,
+            "groups": [g.to_dict() for g in self.groups],
+        }
+
+
+class FleetDedupe:
+    """Content-addressed duplicate finder over every project's startup files.
+
+    Files are hashed whole and per "## " section after normalization.
+    Hashes are keyed by content digest, so a file copied into fifty repos
+    is hashed once, and persisted in the on-disk index for later runs.
+    Exact groups come from equal digests; near duplicates from MinHash
+    LSH over line hashes, verified by exact Jaccard similarity.
+    """
+
+    def __init__(self) -> None:
+        self.loaded_by: dict[Path, list[Path]] = {}  # file -> projects
+        self.project_count = 0
+        self._hashes: dict[tuple[str, str], FileHashes] = {}
+
+    def collect(self, scans: Iterable[ProjectScan]) -> Iterator[ProjectScan]:
+        """Pass scans through, recording which files each project loads."""
+        for scan in scans:
+            self.project_count += 1
+            for m in scan.memories:
+                if m.kind in DEDUPE_KINDS:
+                    self.loaded_by.setdefault(m.path, []).append(scan.cwd)
+            yield scan
+
+    def hashes(self, path: Path) -> FileHashes | None:
+        content = STORE.get(path)
+        if content is None:
+            return None
+        tokenizer = BUDGET.tokenizer
+        key = (content.digest, tokenizer.name)
+        cached = self._hashes.get(key)
+        if cached is not None:
+            return cached
+        index = STORE.index
+        data = index.lookup_sections(*key) if index is not None else None
+        if data is not None:
+            sections = [SectionHash(**s) for s in data.pop("sections")]
+            cached = FileHashes(**data, sections=sections)
+        else:
+            try:
+                text = content.path.read_text(errors="replace")
+            except OSError:
+                text = ""
+            PROFILE.add_bytes(content.size)
+            cached = hash_sections(text, tokenizer)
+            if index is not None:
+                index.store_sections(*key, asdict(cached))
+        self._hashes[key] = cached
+        return cached
+
+    def _projects(self, files: Iterable[Path]) -> tuple[int, int]:
+        """(projects loading any of files, chars-weight of repeat loads)."""
+        per_project: dict[Path, int] = {}
+        for f in files:
+            for p in self.loaded_by[f]:
+                per_project[p] = per_project.get(p, 0) + 1
+        repeats = sum(n - 1 for n in per_project.values())
+        return len(per_project), repeats
+
+    def analyze(self) -> DedupeReport:
+        with PROFILE.phase("fleet.hash"):
+            hashed = {f: h for f in sorted(self.loaded_by) if (h := self.hashes(f))}
+        with PROFILE.phase("fleet.match"):
+            groups = self._match(hashed)
+        groups.sort(key=lambda g: (-g.saved_chars, g.kind, g.label, str(g.files[0])))
+        return DedupeReport(
+            self.project_count,
+            len(hashed),
+            sum(len(h.sections) for h in hashed.values()),
+            BUDGET.tokenizer.name,
+            groups,
+        )
+
+    def _group(
+        self, kind, label, files, chars, tokens, copies, similarity=1.0
+    ) -> DedupeGroup:
+        projects, repeats = self._projects(files)
+        return DedupeGroup(
+            kind,
+            label,
+            files,
+            projects,
+            chars,
+            tokens,
+            copies,
+            similarity,
+            repeats * chars,
+        )
+
+    def _match(self, hashed: dict[Path, FileHashes]) -> list[DedupeGroup]:
+        groups: list[DedupeGroup] = []
+
+        # Whole files with identical normalized content
+        by_file: dict[str, list[Path]] = {}
+        for f, h in hashed.items():
+            by_file.setdefault(h.digest, []).append(f)
+        file_group = {}
+        for digest, files in by_file.items():
+            h = hashed[files[0]]
+            if len(files) > 1 and h.chars >= MIN_DEDUPE_CHARS:
+                for f in files:
+                    file_group[f] = digest
+                groups.append(
+                    self._group(
+                        "file", files[0].name, files, h.chars, h.tokens, len(files)
+                    )
+                )
+
+        # Sections: one representative per distinct digest
+        reps: dict[str, tuple[SectionHash, list[Path]]] = {}
+        for f, h in hashed.items():
+            for s in h.sections:
+                if s.chars < MIN_DEDUPE_CHARS:
+                    continue
+                rep = reps.setdefault(s.digest, (s, []))
+                if f not in rep[1]:
+                    rep[1].append(f)
+
+        def covered(files: list[Path]) -> bool:
+            """All copies are inside one whole-file group already reported."""
+            return len({file_group.get(f) for f in files} - {None}) == 1 and all(
+                f in file_group for f in files
+            )
+
+        for s, files in reps.values():
+            if len(files) > 1 and not covered(files):
+                copies = len({file_group.get(f, f) for f in files})
+                groups.append(
+                    self._group("section", s.header, files, s.chars, s.tokens, copies)
+                )
+
+        # Near duplicates: LSH buckets propose pairs, Jaccard confirms them
+        candidates = [
+            (s, files) for s, files in reps.values() if len(s.shingles) >= MIN_SHINGLES
+        ]
+        buckets: dict[tuple, list[int]] = {}
+        for i, (s, _files) in enumerate(candidates):
+            signature = minhash(s.shingles)
+            for band in range(MINHASH_BANDS):
+                rows = signature[band * MINHASH_ROWS : (band + 1) * MINHASH_ROWS]
+                buckets.setdefault((band, rows), []).append(i)
+        parent = list(range(len(candidates)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        similarity: dict[int, float] = {}
+        checked: set[tuple[int, int]] = set()
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pair = (members[x], members[y])
+                    if pair in checked:
+                        continue
+                    checked.add(pair)
+                    score = jaccard(
+                        candidates[pair[0]][0].shingles, candidates[pair[1]][0].shingles
+                    )
+                    if score < NEAR_DUP_THRESHOLD:
+                        continue
+                    a, b = find(pair[0]), find(pair[1])
+                    parent[b] = a
+                    similarity[a] = min(
+                        similarity.get(a, 1.0), similarity.get(b, 1.0), score
+                    )
+
+        clusters: dict[int, list[int]] = {}
+        for i in range(len(candidates)):
+            clusters.setdefault(find(i), []).append(i)
+        for root, members in clusters.items():
+            if len(members) < 2:
+                continue
+            files = sorted({f for i in members for f in candidates[i][1]})
+            if len(files) < 2 or covered(files):
+                continue
+            smallest = min((candidates[i][0] for i in members), key=lambda s: s.chars)
+            groups.append(
+                self._group(
+                    "near",
+                    candidates[members[0]][0].header,
+                    files,
+                    smallest.chars,
+                    smallest.tokens,
+                    len(members),
+                    similarity.get(root, NEAR_DUP_THRESHOLD),
+                )
+            )
+        return groups
+
+
+def display_dedupe_plain(report: DedupeReport) -> None:
+    print(f"\n{'=' * 60}")
+    print(f"  {report.summary()}")
+    print(f"{'=' * 60}")
+    for g in report.groups[:DEDUPE_TOP]:
+        print(f"\n  {g.hint()}")
+        for f in g.files[:5]:
+            print(f"      {short_path(f)}")
+        if len(g.files) > 5:
+            print(f"      (+{len(g.files) - 5} more)")
+    if len(report.groups) > DEDUPE_TOP:
+        print(f"\n  ... {len(report.groups) - DEDUPE_TOP} smaller group(s), see --json")
+    print()
+
+
+def display_dedupe_rich(report: DedupeReport, console: Console | None = None) -> None:
+    load_rich()
+    console = console or Console()
+    table = Table(title="Fleet Dedupe", border_style="yellow", show_lines=True)
+    table.add_column("Type", style="bold", width=15)
+    table.add_column("Details")
+    for g in report.groups[:DEDUPE_TOP]:
+        kind, details = g.hint().split(": ", 1)
+        files = "\n".join(short_path(f) for f in g.files[:5])
+        if len(g.files) > 5:
+            files += f"\n(+{len(g.files) - 5} more)"
+        table.add_row(kind, f"{details}\n[dim]{files}[/]")
+    console.print()
+    console.print(table)
+    console.print(f"[dim]{report.summary()}[/]")
+
+
+# ── Auto-memory truncation ─────────────────────────────────────────
+
+TRUNCATION_TOP = 20  # cut lines and sections listed in the text report
+MIN_SPAN_CHARS = 3  # shorter `code spans` are too generic to count as references
+_TOPIC_LINK_RE = LazyRegex(r"\]\(([^)\s#]+\.md)(?:#[^)]*)?\)|\[\[([^\]|#]+)")
+_HEADING_RE = LazyRegex(r"#{1,6}\s")
+
+
+def extract_refs(text: str) -> dict[str, list[str]]:
+    """Topic files a text links to ([x](a.md), [[a]]) and `code spans` it names."""
+    links: set[str] = set()
+    for match in _TOPIC_LINK_RE.finditer(text):
+        target = match.group(1) or match.group(2).strip()
+        name = Path(target).name
+        links.add(name if name.endswith(".md") else f"{name}.md")
+    spans = {
+        span
+        for match in _CODE_SPAN_RE.findall(text)
+        if len(span := match.strip("`").strip().lower()) >= MIN_SPAN_CHARS
+    }
+    return {"links": sorted(links), "spans": sorted(spans)}
+
+
+class TopicIndex:
+    """Per-file references, keyed by content digest.
+
+    Digests come from the content store, which re-reads only files whose
+    (inode, mtime, size) changed; refs are persisted in the on-disk index,
+    so a warm run over thousands of topic files reads none of them.
+    """
+
+    def __init__(self) -> None:
+        self._refs: dict[str, dict[str, list[str]]] = {}
+
+    def refs(self, path: Path) -> dict[str, list[str]] | None:
+        content = STORE.get(path)
+        if content is None:
+            return None
+        cached = self._refs.get(content.digest)
+        if cached is not None:
+            return cached
+        index = STORE.index
+        cached = index.lookup_refs(content.digest) if index is not None else None
+        if cached is None:
+            try:
+                text = content.path.read_text(errors="replace")
+            except OSError:
+                text = ""
+            PROFILE.add_bytes(content.size)
+            cached = extract_refs(text)
+            if index is not None:
+                index.store_refs(content.digest, cached)
+        self._refs[content.digest] = cached
+        return cached
+
+    def scan(self, directory: Path) -> dict[str, dict[str, list[str]] | None]:
+        """refs() for every topic file (*.md but MEMORY.md) directly in directory.
+
+        Warm, this is one scandir, one stat per file and a few queries:
+        digests of unchanged files come from a single range read of the
+        parse index, and only changed or symlinked files take refs().
+        """
+        directory = STORE.resolve(directory)
+        prefix = str(directory) + os.sep
+        stats: dict[str, tuple[os.stat_result, bool]] = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    name = entry.name
+                    if (
+                        name.endswith(".md")
+                        and name != "MEMORY.md"
+                        and not name.startswith(".")
+                    ):
+                        if entry.is_file():
+                            stats[name] = (entry.stat(), entry.is_symlink())
+        except OSError:
+            return {}
+        index = STORE.index
+        known = index.lookup_dir(directory) if index is not None else {}
+        digests: dict[str, str] = {}
+        for name, (st, is_link) in stats.items():
+            row = None if is_link else known.get(prefix + name)
+            if row is not None and row[:3] == (st.st_ino, st.st_mtime_ns, st.st_size):
+                digests[name] = row[3]
+        missing = set(digests.values()) - self._refs.keys()
+        if missing and index is not None:
+            self._refs.update(index.lookup_refs_many(missing))
+        return {
+            name: self._refs.get(digests.get(name, "")) or self.refs(directory / name)
+            for name in sorted(stats)
+        }
+
+
+TOPICS = TopicIndex()
+
+
+@dataclass
+class MemoryLine:
+    number: int  # 1-based
+    text: str
+    topics: list[str]  # existing topic files the line links to
+    score: int
+
+
+@dataclass
+class MemorySection:
+    heading: str  # "" for the lines before the first heading
+    start: int  # first line, 1-based
+    end: int  # last line, inclusive
+    score: int
+
+    @property
+    def lines(self) -> int:
+        return self.end - self.start + 1
+
+    def to_dict(self) -> dict:
+        return {
+            "heading": self.heading,
+            "start": self.start,
+            "end": self.end,
+            "lines": self.lines,
+            "score": self.score,
+        }
+
+
+def split_sections(lines: list[MemoryLine]) -> list[MemorySection]:
+    sections: list[MemorySection] = []
+    in_code = False
+    for line in lines:
+        if line.text.lstrip().startswith("```"):
+            in_code = not in_code
+        if not in_code and _HEADING_RE.match(line.text) or not sections:
+            heading = line.text.strip() if _HEADING_RE.match(line.text) else ""
+            sections.append(MemorySection(heading, line.number, line.number, 0))
+        sections[-1].end = line.number
+        sections[-1].score += line.score
+    return sections
+
+
+def suggest_order(sections: list[MemorySection], limit: int) -> list[MemorySection]:
+    """Order that fits the highest total score within limit lines.
+
+    The opening section (title or preamble) stays first; the best-scoring
+    set of the other sections (0/1 knapsack on line counts) follows in
+    its original order, then the rest. Ties keep the earlier section.
+    """
+    if not sections:
+        return []
+    head, rest = sections[:1], sections[1:]
+    capacity = max(0, limit - sum(s.lines for s in head))
+    best = [0] * (capacity + 1)
+    taken: list[list[bool]] = []
+    for s in rest:
+        row = [False] * (capacity + 1)
+        for c in range(capacity, s.lines - 1, -1):
+            if best[c - s.lines] + s.score > best[c]:
+                best[c] = best[c - s.lines] + s.score
+                row[c] = True
+        taken.append(row)
+    chosen: set[int] = set()
+    c = capacity
+    for i in range(len(rest) - 1, -1, -1):
+        if taken[i][c]:
+            chosen.add(i)
+            c -= rest[i].lines
+    kept = [s for i, s in enumerate(rest) if i in chosen]
+    return head + kept + [s for i, s in enumerate(rest) if i not in chosen]
+
+
+@dataclass
+class TruncationReport:
+    path: Path  # MEMORY.md
+    limit: int
+    lines: list[MemoryLine]
+    topics: list[str]  # topic files in the memory directory
+    suggested: list[MemorySection]
+
+    @property
+    def cut_lines(self) -> list[MemoryLine]:
+        return [line for line in self.lines[self.limit :] if line.text.strip()]
+
+    @property
+    def cut_topics(self) -> list[str]:
+        """Topics linked only from lines past the cutoff."""
+        kept = {t for line in self.lines[: self.limit] for t in line.topics}
+        return sorted(
+            {t for line in self.lines[self.limit :] for t in line.topics} - kept
+        )
+
+    @property
+    def unlinked_topics(self) -> list[str]:
+        linked = {t for line in self.lines for t in line.topics}
+        return [t for t in self.topics if t not in linked]
+
+    @property
+    def total_score(self) -> int:
+        return sum(line.score for line in self.lines)
+
+    @property
+    def kept_score(self) -> int:
+        return sum(line.score for line in self.lines[: self.limit])
+
+    @property
+    def suggested_score(self) -> int:
+        reordered = (
+            line for s in self.suggested for line in self.lines[s.start - 1 : s.end]
+        )
+        return sum(line.score for _, line in zip(range(self.limit), reordered))
+
+    def summary(self) -> str:
+        return (
+            f"TRUNCATION: {len(self.lines)}L, first {self.limit} loaded"
+            f" — {len(self.cut_lines)} line(s) and {len(self.cut_topics)} linked"
+            f" topic(s) cut off; reference score kept"
+            f" {self.kept_score}/{self.total_score},"
+            f" {self.suggested_score} with the suggested order"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "path": str(self.path),
+            "limit": self.limit,
+            "lines": len(self.lines),
+            "topics": len(self.topics),
+            "total_score": self.total_score,
+            "kept_score": self.kept_score,
+            "suggested_score": self.suggested_score,
+            "cut_lines": [
+                {"line": line.number, "score": line.score, "text": line.text}
+                for line in self.cut_lines
+            ],
+            "cut_topics": self.cut_topics,
+            "unlinked_topics": self.unlinked_topics,
+            "suggested_order": [s.to_dict() for s in self.suggested],
+        }
+
+
+def simulate_truncation(
+    cwd: Path, limit: int = AUTO_MEMORY_LIMIT
+) -> TruncationReport | None:
+    """What of auto-memory MEMORY.md falls past the startup cutoff, and a better order.
+
+    A line's score is how often what it points at is referenced across the
+    topic files: each linked topic counts once plus once per other topic
+    file linking to it, each `code span` once per topic file naming it.
+    """
+    memory_md = (
+        AUTO_MEMORY_BASE / get_project_key(cwd.resolve()) / "memory" / "MEMORY.md"
+    )
+    try:
+        text = memory_md.read_text()
+    except (OSError, UnicodeDecodeError):
+        return None
+    with PROFILE.phase("truncation.refs"):
+        refs = TOPICS.scan(memory_md.parent)
+    topics = list(refs)
+    with PROFILE.phase("truncation.score"):
+        linked_by: dict[str, int] = {}
+        named_by: dict[str, int] = {}
+        for name, r in refs.items():
+            for target in r["links"] if r else []:
+                if target != name:
+                    linked_by[target] = linked_by.get(target, 0) + 1
+            for span in r["spans"] if r else []:
+                named_by[span] = named_by.get(span, 0) + 1
+        existing = set(topics)
+        lines = []
+        for number, raw in enumerate(text.splitlines(), 1):
+            line_refs = (
+                extract_refs(raw) if "`" in raw or ".md" in raw or "[[" in raw else None
+            )
+            linked = (
+                [t for t in line_refs["links"] if t in existing] if line_refs else []
+            )
+            score = sum(1 + linked_by.get(t, 0) for t in linked)
+            score += (
+                sum(named_by.get(s, 0) for s in line_refs["spans"]) if line_refs else 0
+            )
+            lines.append(MemoryLine(number, raw, linked, score))
+        suggested = suggest_order(split_sections(lines), limit)
+    return TruncationReport(memory_md, limit, lines, topics, suggested)
+
+
+def display_truncation_plain(report: TruncationReport) -> None:
+    print(f"\n{'=' * 60}")
+    print(f"  {short_path(report.path)}")
+    print(f"  {report.summary()}")
+    print(f"{'=' * 60}")
+    cut = sorted(report.cut_lines, key=lambda line: (-line.score, line.number))
+    if cut:
+        print("\n  Highest-scoring lines past the cutoff:")
+        for line in cut[:TRUNCATION_TOP]:
+            print(f"    L{line.number:<5} {line.score:>4}  {line.text.strip()[:70]}")
+    if report.cut_topics:
+        shown = ", ".join(report.cut_topics[:TRUNCATION_TOP])
+        more = len(report.cut_topics) - TRUNCATION_TOP
+        print(
+            f"\n  Topics linked only past the cutoff: {shown}"
+            + (f" (+{more} more)" if more > 0 else "")
+        )
+    if report.unlinked_topics:
+        print(f"  Topics never linked: {len(report.unlinked_topics)}")
+    if report.suggested_score > report.kept_score:
+        print(f"\n  Suggested order (first {report.limit} lines):")
+        used = 0
+        for i, s in enumerate(report.suggested):
+            if used >= report.limit:
+                print(
+                    f"    ── cutoff ── (+{len(report.suggested) - i} more section(s))"
+                )
+                break
+            used += s.lines
+            label = s.heading or "(preamble)"
+            print(f"    L{s.start}-{s.end:<6} {s.lines:>4}L {s.score:>5}  {label[:50]}")
+    print()
+
+
+def display_truncation_rich(
+    report: TruncationReport, console: Console | None = None
+) -> None:
+    load_rich()
+    console = console or Console()
+    table = Table(title="Auto-memory Truncation", border_style="yellow")
+    table.add_column("Line", style="dim", justify="right")
+    table.add_column("Score", justify="right")
+    table.add_column("Past the cutoff")
+    cut = sorted(report.cut_lines, key=lambda line: (-line.score, line.number))
+    for line in cut[:TRUNCATION_TOP]:
+        table.add_row(str(line.number), str(line.score), line.text.strip()[:80])
+    console.print()
+    console.print(f"[bold]{short_path(report.path)}[/]")
+    if cut:
+        console.print(table)
+    if report.cut_topics:
+        cut_topics = ", ".join(report.cut_topics[:TRUNCATION_TOP])
+        if len(report.cut_topics) > TRUNCATION_TOP:
+            cut_topics += f" (+{len(report.cut_topics) - TRUNCATION_TOP} more)"
+        console.print(f"[yellow]Topics linked only past the cutoff:[/] {cut_topics}")
+    if report.suggested_score > report.kept_score:
+        order = Table(
+            title=f"Suggested order (first {report.limit} lines)", border_style="green"
+        )
+        order.add_column("Lines", style="dim")
+        order.add_column("Count", justify="right")
+        order.add_column("Score", justify="right")
+        order.add_column("Section")
+        used = 0
+        for s in report.suggested:
+            style = "" if used < report.limit else "dim"  # starts past the cutoff
+            used += s.lines
+            label = s.heading or "(preamble)"
+            order.add_row(
+                f"{s.start}-{s.end}", str(s.lines), str(s.score), label, style=style
+            )
+        console.print(order)
+    console.print(f"[dim]{report.summary()}[/]")
+
+
+# ── Watch mode ─────────────────────────────────────────────────────
+
+POLL_INTERVAL = 0.1  # seconds between stat sweeps without inotify
+MAX_TREE_WATCHES = 4000  # project dirs watched for new child CLAUDE.md
+ANCESTOR_NAMES = ("CLAUDE.md", "CLAUDE.local.md", ".claude/CLAUDE.md")  # read above cwd
+DEBOUNCE = 0.03  # collect an editor's burst of writes into one recompute
+WATCH_NAMES = frozenset(
+    {"CLAUDE.md", "CLAUDE.local.md", ".claude", ".agents", ".gitignore", ".git"}
+)
+
+
+class InotifyWatcher:
+    """Linux inotify via ctypes: blocks in select(), so idle CPU is zero.
+
+    Directories are watched (not files) so atomic saves — write to a temp
+    file, rename over the original — are seen as changes to the name.
+    """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    STRUCTURAL = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | STRUCTURAL
+        | IN_DELETE_SELF | IN_MOVE_SELF
+    )  # fmt: skip
+
+    def __init__(self) -> None:
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._by_wd: dict[int, Path] = {}
+        self._by_dir: dict[Path, int] = {}
+
+    def sync(self, dirs: set[Path], files: set[Path]) -> None:
+        """Watch exactly these directories (files are covered by their dirs)."""
+        for d in set(self._by_dir) - dirs:
+            wd = self._by_dir.pop(d)
+            self._by_wd.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+        for d in dirs - set(self._by_dir):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(d), self.MASK)
+            if wd >= 0:
+                self._by_wd[wd] = d
+                self._by_dir[d] = wd
+
+    def wait(self, timeout: float | None) -> tuple[set[Path], bool]:
+        """Block until events arrive; return (changed paths, structural?)."""
+        import select
+        import struct
+
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return set(), False
+        changed: set[Path] = set()
+        structural = False
+        while True:
+            try:
+                buf = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _cookie, length = struct.unpack_from("iIII", buf, offset)
+                raw = buf[offset + 16 : offset + 16 + length].rstrip(b"\0")
+                offset += 16 + length
+                directory = self._by_wd.get(wd)
+                if directory is None:
+                    continue
+                if mask & (self.STRUCTURAL | self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                    structural = True
+                changed.add(directory / os.fsdecode(raw) if raw else directory)
+        return changed, structural
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Portable fallback: stat every watched dir and file each POLL_INTERVAL."""
+
+    def __init__(self, interval: float = POLL_INTERVAL) -> None:
+        self.interval = interval
+        self._dirs: dict[Path, int] = {}
+        self._files: dict[Path, tuple[int, int, int] | None] = {}
+
+    @staticmethod
+    def _sig(path: Path) -> tuple[int, int, int] | None:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def sync(self, dirs: set[Path], files: set[Path]) -> None:
+        self._dirs = {d: (sig[1] if (sig := self._sig(d)) else 0) for d in dirs}
+        self._files = {f: self._sig(f) for f in files}
+
+    def wait(self, timeout: float | None) -> tuple[set[Path], bool]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed: set[Path] = set()
+            structural = False
+            for d, mtime in self._dirs.items():
+                sig = self._sig(d)
+                now = sig[1] if sig else 0
+                if now != mtime:
+                    self._dirs[d] = now
+                    changed.add(d)
+                    structural = True
+            for f, old in self._files.items():
+                sig = self._sig(f)
+                if sig != old:
+                    self._files[f] = sig
+                    changed.add(f)
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed, structural
+            time.sleep(self.interval)
+
+    def close(self) -> None:
+        pass
+
+
+def make_watcher() -> InotifyWatcher | PollingWatcher:
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except OSError:
+            pass
+    return PollingWatcher()
+
+
+def watch_targets(
+    cwd: Path, memories: list[MemoryFile], walk: WalkResult
+) -> tuple[set[Path], set[Path]]:
+    """Directories and files whose changes can alter the memory map."""
+    cwd = cwd.resolve()
+    dirs: set[Path] = {USER_CLAUDE.parent, USER_RULES, AUTO_MEMORY_BASE}
+    dirs.add(AUTO_MEMORY_BASE / get_project_key(cwd) / "memory")
+    for level in [cwd, *cwd.parents]:
+        dirs.update({level, level / ".claude", level / ".claude" / "rules"})
+    for d in SKILL_DIRS:
+        dirs.add(cwd / d)
+    files: set[Path] = set()
+    for m in memories:
+        files.add(m.path)
+        dirs.add(m.path.parent)
+    for path in walk.skills + walk.rules + walk.child_claude:
+        dirs.add(path.parent)
+    dirs.update(walk.dirs[:MAX_TREE_WATCHES])
+    if USER_RULES.is_dir():
+        dirs.update(p for p in USER_RULES.rglob("*") if p.is_dir())
+    return {d for d in dirs if d.is_dir()}, files
+
+
+def result_deps(
+    cwd: Path, memories: list[MemoryFile], walk: WalkResult
+) -> tuple[set[Path], set[Path]] | None:
+    """(stamped, presence-only) paths that validate a cached --json result.
+
+    Like watch_targets(), but ancestors of cwd (/tmp, ~) churn constantly
+    and only matter through a few names, so those are checked by presence.
+    Returns None when the tree is too large to be worth validating.
+    """
+    if len(walk.dirs) > MAX_TREE_WATCHES:
+        return None
+    cwd = cwd.resolve()
+    stamped: set[Path] = {
+        MANAGED_POLICY,
+        Path(__file__),
+        Path(memory_map_fast.__file__),
+    }
+    present: set[Path] = {USER_CLAUDE}
+    stamped.update(walk.dirs)
+    for path in walk.skills + walk.rules + walk.child_claude:
+        stamped.add(path.parent)
+    stamped.update(g for d in walk.dirs if (g := d / ".gitignore").is_file())
+    for d in SKILL_DIRS:
+        present.add(cwd / d)
+    memory_dir = AUTO_MEMORY_BASE / get_project_key(cwd) / "memory"
+    rules_dirs = [USER_RULES, memory_dir]
+    for level in [cwd, *cwd.parents]:
+        present.update({level / ".git", level / ".git" / "HEAD"})
+        if level != cwd:
+            present.update(level / name for name in ANCESTOR_NAMES)
+            rules_dirs.append(level / ".claude" / "rules")
+    for d in rules_dirs:
+        if d.is_dir():
+            stamped.add(d)
+            stamped.update(p for p in d.rglob("*") if p.is_dir())
+        else:
+            present.add(d)
+    for m in memories:
+        stamped.add(m.path)
+        content = STORE.get(m.path)
+        for _, ref in content.import_refs if content else []:
+            stamped.add(import_target(m.path, ref))
+    return stamped, present - stamped
+
+
+def is_relevant(cwd: Path, path: Path, dirs: set[Path], files: set[Path]) -> bool:
+    """Ignore unrelated churn in watched ancestors (e.g. files in /tmp)."""
+    return (
+        path in files
+        or path in dirs
+        or path.suffix == ".md"
+        or path.name in WATCH_NAMES
+        or (cwd in path.parents and path.is_dir())  # may gain a CLAUDE.md
+    )
+
+
+def redraw(previous: list[str], lines: list[str]) -> list[str]:
+    """Rewrite only the terminal lines that differ from the last frame."""
+    out = [] if previous else ["\x1b[H\x1b[2J"]
+    for i, line in enumerate(lines):
+        if i >= len(previous) or previous[i] != line:
+            out.append(f"\x1b[{i + 1};1H{line}\x1b[K")
+    if len(lines) < len(previous):
+        out.append(f"\x1b[{len(lines) + 1};1H\x1b[J")
+    if out:
+        sys.stdout.write("".join(out))
+        sys.stdout.flush()
+    return lines
+
+
+def render(
+    cwd: Path,
+    memories: list[MemoryFile],
+    walk: WalkResult,
+    use_rich: bool,
+    show_audit: bool,
+) -> str:
+    buf = io.StringIO()
+    if use_rich:
+        width = os.get_terminal_size().columns if sys.stdout.isatty() else 100
+        load_rich()
+        console = Console(file=buf, force_terminal=True, width=width)
+        display_rich(cwd, memories, show_audit, walk=walk, console=console)
+    else:
+        with contextlib.redirect_stdout(buf):
+            display_plain(cwd, memories, show_audit, walk=walk)
+    return buf.getvalue()
+
+
+def invalidate_changed(changed: set[Path], structural: bool) -> None:
+    """Forget cached state for changed paths (everything path-derived if structural)."""
+    for path in changed:
+        if path.is_dir():
+            STORE.invalidate_dir(path)
+        STORE.invalidate(path)
+        IMPORTS.invalidate(path)
+    if structural:
+        IMPORTS.invalidate()  # import targets may have (dis)appeared
+        _GIT_ROOTS.clear()  # a .git may have come or gone
+
+
+def watch(
+    cwd: Path,
+    use_rich: bool,
+    show_audit: bool,
+    output_json: bool = False,
+    walk_options: WalkOptions = WalkOptions(),
+) -> None:
+    """Redraw the memory map whenever a file that feeds it changes.
+
+    Only invalidated files are re-read (everything else comes from the
+    content store and import graph), the tree is re-walked only after
+    creates/deletes/renames, and only changed output lines are redrawn.
+    """
+    cwd = cwd.resolve()
+    watcher = make_watcher()
+    walk = walk_project(cwd, walk_options)
+    previous: list[str] = []
+    last_json = ""
+    try:
+        while True:
+            memories = load_memory_map(cwd, walk=walk)
+            if output_json:
+                frame = json.dumps([m.to_dict() for m in memories], default=str)
+                if frame != last_json:
+                    print(frame, flush=True)
+                    last_json = frame
+            else:
+                frame = render(cwd, memories, walk, use_rich, show_audit)
+                previous = redraw(previous, frame.splitlines())
+            if STORE.index is not None:
+                STORE.index.commit()
+
+            dirs, files = watch_targets(cwd, memories, walk)
+            watcher.sync(dirs, files)
+            changed: set[Path] = set()
+            structural = False
+            while not any(is_relevant(cwd, p, dirs, files) for p in changed):
+                changed, structural = watcher.wait(None)
+            while True:  # debounce
+                more, more_structural = watcher.wait(DEBOUNCE)
+                if not more:
+                    break
+                changed |= more
+                structural |= more_structural
+
+            invalidate_changed(changed, structural)
+            if structural:
+                walk = walk_project(cwd, walk_options)
+    finally:
+        watcher.close()
+
+
+# ── Daemon ─────────────────────────────────────────────────────────
+
+DAEMON_MAX_PROJECTS = 32  # least recently queried projects are dropped first
+DAEMON_OPS = ("map", "audit", "rules_for")
+
+
+@dataclass
+class DaemonProject:
+    """One project's warm state; None fields are recomputed on next query."""
+
+    cwd: Path
+    walk: WalkResult | None = None
+    memories: list[MemoryFile] | None = None
+    hints: list[str] | None = None
+    matcher: RuleMatcher | None = None
+    dirs: set[Path] = field(default_factory=set)
+    files: set[Path] = field(default_factory=set)
+
+    def load(self, walk_options: WalkOptions) -> list[MemoryFile]:
+        if self.walk is None:
+            self.walk = walk_project(self.cwd, walk_options)
+            self.memories = None
+        if self.memories is None:
+            self.memories = load_memory_map(self.cwd, walk=self.walk)
+            self.hints = self.matcher = None
+            self.dirs, self.files = watch_targets(self.cwd, self.memories, self.walk)
+        return self.memories
+
+    def answer(self, op: str, file: str | None, walk_options: WalkOptions) -> object:
+        """Same data the CLI prints for --json, --json --hints, --json --rules-for."""
+        memories = self.load(walk_options)
+        if op == "map":
+            return [m.to_dict() for m in memories]
+        if op == "audit":
+            if self.hints is None:
+                self.hints = audit_memory(memories, self.cwd)
+            return {"memories": [m.to_dict() for m in memories], "hints": self.hints}
+        if not file:
+            raise ValueError("rules_for needs a file")
+        if self.matcher is None:
+            self.matcher = RuleMatcher(memories)
+        return [m.to_dict() for m in self.matcher.rules_for(Path(file), self.cwd)]
+
+    def invalidate(self, changed: set[Path], structural: bool) -> None:
+        if any(is_relevant(self.cwd, p, self.dirs, self.files) for p in changed):
+            self.memories = None
+            if structural:
+                self.walk = None
+        elif structural and any(self.cwd in p.parents for p in changed):
+            self.hints = None  # dead-rule checks look at which files exist
+
+
+class MemoryDaemon:
+    """Keeps memory maps warm and answers queries on a Unix socket.
+
+    One JSON request per line, one JSON response per line:
+    {"op": "map" | "audit" | "rules_for", "cwd": ..., "file": ..., "home": ...}
+    -> {"ok": true, "result": ...} or {"ok": false, "error": ...}.
+    A watcher thread invalidates the content store, import graph and the
+    affected projects as files change, the same way --watch does. Queries
+    are answered one at a time; warm ones don't touch the disk.
+    """
+
+    def __init__(
+        self, path: Path = SOCKET_PATH, walk_options: WalkOptions = WalkOptions()
+    ) -> None:
+        self.path = path
+        self.walk_options = walk_options
+        self.projects: dict[Path, DaemonProject] = {}  # least recently used first
+        self._lock = threading.Lock()
+        self._watcher = make_watcher()
+        self._code = memory_map_fast.stamp(__file__)
+        self._server = None
+
+    def handle(self, request: dict) -> dict:
+        if request.get("home", home_str()) != home_str():
+            return {"ok": False, "error": f"daemon serves HOME={home_str()}"}
+        if memory_map_fast.stamp(__file__) != self._code:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+            return {"ok": False, "error": "memory_map changed; daemon is exiting"}
+        op = request.get("op")
+        if op not in DAEMON_OPS:
+            return {"ok": False, "error": f"unknown op {op!r}"}
+        cwd = Path(request.get("cwd") or ".").resolve()
+        if not cwd.is_dir():
+            return {"ok": False, "error": f"{cwd} does not exist"}
+        try:
+            with self._lock:
+                project = self.projects.pop(cwd, None) or DaemonProject(cwd)
+                self.projects[cwd] = project
+                loaded = project.memories
+                result = project.answer(op, request.get("file"), self.walk_options)
+                if (
+                    project.memories is not loaded
+                    or len(self.projects) > DAEMON_MAX_PROJECTS
+                ):
+                    while len(self.projects) > DAEMON_MAX_PROJECTS:
+                        del self.projects[next(iter(self.projects))]
+                    self._sync()
+                if STORE.index is not None:
+                    STORE.index.commit()
+        except Exception as e:  # one bad query must not take the daemon down
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        return {"ok": True, "result": result}
+
+    def _sync(self) -> None:
+        dirs: set[Path] = set()
+        files: set[Path] = set()
+        for project in self.projects.values():
+            dirs |= project.dirs
+            files |= project.files
+        self._watcher.sync(dirs, files)
+
+    def _watch_loop(self) -> None:
+        while True:
+            changed, structural = self._watcher.wait(None)
+            while changed:  # debounce
+                more, more_structural = self._watcher.wait(DEBOUNCE)
+                if not more:
+                    break
+                changed |= more
+                structural |= more_structural
+            if not changed:
+                continue
+            with self._lock:
+                invalidate_changed(changed, structural)
+                for project in self.projects.values():
+                    project.invalidate(changed, structural)
+
+    def serve(self) -> None:
+        """Listen until SIGTERM / Ctrl-C; refuses to start if one is running."""
+        import signal
+        import socket
+        import socketserver
+
+        daemon = self
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(self.path))
+            except OSError:
+                self.path.unlink()  # stale socket from a daemon that died
+            else:
+                raise OSError(f"a daemon is already listening on {self.path}")
+            finally:
+                probe.close()
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                    except ValueError:
+                        request = None
+                    if isinstance(request, dict):
+                        response = daemon.handle(request)
+                    else:
+                        response = {"ok": False, "error": "expected a JSON object"}
+                    self.wfile.write(json.dumps(response, default=str).encode() + b"\n")
+
+        class Server(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True
+
+        self._server = Server(str(self.path), Handler)
+        os.chmod(self.path, 0o600)
+        print(f"memory_map daemon listening on {self.path}", file=sys.stderr)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        threading.Thread(target=self._watch_loop, daemon=True).start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self.path.unlink(missing_ok=True)
+            self._watcher.close()
+
+
+# ── CLI ────────────────────────────────────────────────────────────
+
+
+def pop_option(args: list[str], name: str) -> str | None:
+    """Remove `name VALUE` or `name=VALUE` from args and return VALUE."""
+    for i, a in enumerate(args):
+        if a == name and i + 1 < len(args):
+            value = args[i + 1]
+            del args[i : i + 2]
+            return value
+        if a.startswith(name + "="):
+            del args[i]
+            return a.split("=", 1)[1]
+    return None
+
+
+def main():
+    args = sys.argv[1:]
+    result_key = memory_map_fast.result_key(args)  # plain `--json [path]` only
+
+    output_json = "--json" in args
+    args = [a for a in args if a != "--json"]
+
+    output_ndjson = "--ndjson" in args
+    args = [a for a in args if a != "--ndjson"]
+
+    show_audit = "--audit" in args
+    args = [a for a in args if a != "--audit"]
+
+    json_hints = "--hints" in args
+    args = [a for a in args if a != "--hints"]
+
+    all_projects = "--all-projects" in args
+    args = [a for a in args if a != "--all-projects"]
+
+    plain = "--plain" in args
+    args = [a for a in args if a != "--plain"]
+
+    no_cache = "--no-cache" in args
+    args = [a for a in args if a != "--no-cache"]
+
+    workers_opt = pop_option(args, "--workers")
+    try:
+        workers = int(workers_opt) if workers_opt else DEFAULT_WORKERS
+    except ValueError:
+        print(
+            f"Error: --workers expects a number, got {workers_opt!r}", file=sys.stderr
+        )
+        sys.exit(1)
+
+    watch_mode = "--watch" in args
+    args = [a for a in args if a != "--watch"]
+
+    no_gitignore = "--no-gitignore" in args
+    args = [a for a in args if a != "--no-gitignore"]
+
+    timings = "--timings" in args
+    args = [a for a in args if a != "--timings"]
+
+    dedupe = "--dedupe" in args
+    args = [a for a in args if a != "--dedupe"]
+
+    daemon_mode = "--daemon" in args
+    args = [a for a in args if a != "--daemon"]
+
+    truncation = "--truncation" in args
+    args = [a for a in args if a != "--truncation"]
+    if dedupe and not all_projects:
+        print("Error: --dedupe works with --all-projects", file=sys.stderr)
+        sys.exit(1)
+    if timings:
+        PROFILE.enable()
+
+    rules_for = pop_option(args, "--rules-for")
+    tokenizer_opt = pop_option(args, "--tokenizer")
+    budget_opt = pop_option(args, "--budget")
+    try:
+        budget = int(budget_opt) if budget_opt else None
+    except ValueError:
+        print(f"Error: --budget expects a number, got {budget_opt!r}", file=sys.stderr)
+        sys.exit(1)
+    BUDGET.configure(tokenizer=tokenizer_opt, budget=budget)
+    skip_opt = pop_option(args, "--skip")
+    depth_opt = pop_option(args, "--max-depth")
+    try:
+        max_depth = int(depth_opt) if depth_opt else None
+    except ValueError:
+        print(
+            f"Error: --max-depth expects a number, got {depth_opt!r}", file=sys.stderr
+        )
+        sys.exit(1)
+    extra_skip = {d for d in (skip_opt or "").split(",") if d}
+    walk_options = WalkOptions(
+        skip=DEFAULT_SKIP_DIRS | extra_skip,
+        max_depth=max_depth,
+        gitignore=not no_gitignore,
+    )
+
+    use_rich = not plain and not output_json and not output_ndjson and load_rich()
+
+    if not no_cache:
+        STORE.index = MemoryIndex()
+    try:
+        run(
+            args,
+            output_json,
+            show_audit,
+            all_projects,
+            use_rich,
+            workers,
+            walk_options,
+            rules_for,
+            watch_mode,
+            output_ndjson,
+            timings,
+            dedupe,
+            result_key,
+            daemon_mode,
+            truncation,
+            json_hints,
+        )
+    finally:
+        if STORE.index is not None:
+            STORE.index.close()
+
+
+def run(
+    args: list[str],
+    output_json: bool,
+    show_audit: bool,
+    all_projects: bool,
+    use_rich: bool,
+    workers: int = DEFAULT_WORKERS,
+    walk_options: WalkOptions = WalkOptions(),
+    rules_for: str | None = None,
+    watch_mode: bool = False,
+    output_ndjson: bool = False,
+    timings: bool = False,
+    dedupe: bool = False,
+    result_key: str | None = None,
+    daemon_mode: bool = False,
+    truncation: bool = False,
+    json_hints: bool = False,
+) -> None:
+    if daemon_mode:
+        if (
+            all_projects
+            or watch_mode
+            or output_json
+            or output_ndjson
+            or rules_for
+            or args
+        ):
+            print("Error: --daemon takes no path or output mode", file=sys.stderr)
+            sys.exit(1)
+        try:
+            MemoryDaemon(walk_options=walk_options).serve()
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        except KeyboardInterrupt:
+            print(file=sys.stderr)
+        return
+    if watch_mode and all_projects:
+        print("Error: --watch works on a single project", file=sys.stderr)
+        sys.exit(1)
+    if watch_mode and output_ndjson:
+        print("Error: --watch cannot be combined with --ndjson", file=sys.stderr)
+        sys.exit(1)
+    if watch_mode and timings:
+        print("Error: --watch cannot be combined with --timings", file=sys.stderr)
+        sys.exit(1)
+    if truncation and (all_projects or watch_mode or output_ndjson or rules_for):
+        print("Error: --truncation works on a single project", file=sys.stderr)
+        sys.exit(1)
+    if json_hints and (
+        not output_json or all_projects or watch_mode or rules_for or truncation
+    ):
+        print("Error: --hints works with --json on a single project", file=sys.stderr)
+        sys.exit(1)
+
+    if all_projects:
+        # Scan CWD (or parent) for subdirectories with CLAUDE.md
+        scan_root = Path.cwd()
+        dirs = sorted(
+            [
+                d
+                for d in scan_root.iterdir()
+                if d.is_dir() and (d / "CLAUDE.md").exists()
+            ]
+        )
+
+        scans = scan_projects(
+            dirs,
+            workers,
+            audit=show_audit and not output_json,
+            walk_options=walk_options,
+        )
+        fleet = FleetDedupe() if dedupe else None
+        if fleet is not None:
+            scans = fleet.collect(scans)
+        if output_ndjson:
+            started = time.perf_counter()
+            emit_record(ndjson_header("all-projects", scan_root))
+            files = 0
+            for scan in scans:
+                record = {
+                    "type": "project",
+                    "path": str(scan.cwd),
+                    "elapsed_ms": round(scan.elapsed * 1000, 2),
+                    "memories": [m.to_dict() for m in scan.memories],
+                }
+                if scan.hints is not None:
+                    record["hints"] = scan.hints
+                files += len(scan.memories)
+                emit_record(record)
+            if fleet is not None:
+                emit_record({"type": "dedupe", **fleet.analyze().to_dict()})
+            if timings:
+                emit_record({"type": "timings", **PROFILE.to_dict()})
+            emit_record(
+                {
+                    "type": "summary",
+                    "projects": len(dirs),
+                    "files": files,
+                    "workers": workers,
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+                }
+            )
+        elif output_json:
+
+            def entries() -> Iterator[tuple[str, object]]:
+                for scan in scans:
+                    yield str(scan.cwd), [m.to_dict() for m in scan.memories]
+                if fleet is not None:
+                    yield "dedupe", fleet.analyze().to_dict()
+                if timings:  # after every project has been scanned
+                    yield "timings", PROFILE.to_dict()
+
+            stream_json_object(entries())
+        else:
+            display = display_rich if use_rich else display_plain
+            for scan in scans:
+                with PROFILE.phase("render"):
+                    display(scan.cwd, scan.memories, show_audit, scan.hints, scan.walk)
+            if fleet is not None:
+                report = fleet.analyze()
+                display_dedupe_rich(report) if use_rich else display_dedupe_plain(
+                    report
+                )
+            if timings:
+                display_timings_rich() if use_rich else display_timings_plain()
+        return
+
+    cwd = Path(args[0]).resolve() if args else Path.cwd()
+    if not cwd.exists():
+        print(f"Error: {cwd} does not exist", file=sys.stderr)
+        sys.exit(1)
+
+    if truncation:
+        report = simulate_truncation(cwd)
+        if output_json:
+            payload = report.to_dict() if report else None
+            if timings:
+                payload = {"truncation": payload, "timings": PROFILE.to_dict()}
+            print(json.dumps(payload, indent=2, default=str))
+        elif report is None:
+            print(f"No auto-memory MEMORY.md for {short_path(cwd)}")
+        elif use_rich:
+            display_truncation_rich(report)
+        else:
+            display_truncation_plain(report)
+        if timings and not output_json:
+            display_timings_rich() if use_rich else display_timings_plain()
+        return
+
+    if watch_mode:
+        try:
+            watch(cwd, use_rich, show_audit, output_json, walk_options)
+        except KeyboardInterrupt:
+            print()
+        return
+
+    if output_ndjson and not rules_for:
+        stream_ndjson(cwd, show_audit, walk_options)
+        return
+
+    started_ns = time.time_ns()
+    walk = walk_project(cwd, walk_options)
+    memories = load_memory_map(cwd, walk=walk)
+
+    if rules_for:
+        with PROFILE.phase("rules_for"):
+            matched = RuleMatcher(memories).rules_for(Path.cwd() / rules_for, cwd)
+        if output_json:
+            display_json(matched, timings)
+        else:
+            for m in matched:
+                print(short_path(m.path))
+            if timings:
+                display_timings_plain()
+        return
+
+    if output_json:
+        hints = audit_memory(memories, cwd) if json_hints else None
+        output = format_json(memories, timings, hints)
+        print(output)
+        if result_key is not None and STORE.index is not None:
+            deps = result_deps(cwd, memories, walk)
+            if deps is not None:
+                stamped, present = (map(str, paths) for paths in deps)
+                snapshot = memory_map_fast.snapshot(stamped, present, started_ns)
+                if snapshot is not None:
+                    STORE.index.store_result(result_key, snapshot, output)
+        return
+    with PROFILE.phase("render"):
+        if use_rich:
+            display_rich(cwd, memories, show_audit, walk=walk)
+        else:
+            display_plain(cwd, memories, show_audit, walk=walk)
+    if timings:
+        display_timings_rich() if use_rich else display_timings_plain()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Startup fast paths for `memory_map.py --json`: daemon client and result cache.
+
+When a daemon (`memory_map.py --daemon`) is listening, `--json`,
+`--json --hints` and `--json --rules-for FILE` are forwarded to it over
+its Unix socket and printed as returned.
+
+Otherwise a full `--json` run stores its output together with the
+(mtime_ns, size) of every file and directory that can change the map,
+and the presence of paths that only matter by existing (see
+result_deps() in memory_map_core). The next identical invocation stats
+those paths and, when none of them moved, prints the stored output
+without importing the loader. A missing row, a changed stamp or any
+SQLite error means a full run.
+
+Only os, sqlite3 and sys are imported up front: this module is on the
+startup path.
+"""
+
+import os
+import sqlite3
+import sys
+
+RACY_NS = 2_000_000_000  # deps touched this close to the run may change unseen
+DAEMON_TIMEOUT = 5.0  # seconds to wait for an answer before computing in-process
+
+
+def cache_dir() -> str:
+    """Same directory as memory_map_core.CACHE_DIR."""
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache, "solo-factory")
+
+
+def index_path() -> str:
+    return os.path.join(cache_dir(), "memory-map.sqlite3")
+
+
+def socket_path() -> str:
+    return os.path.join(cache_dir(), "memory-map.sock")
+
+
+def parse_query(argv: list[str]) -> dict | None:
+    """Daemon request for `--json [--hints | --rules-for FILE] [path]`, else None.
+
+    `--audit` does not change `--json` output, so it is dropped.
+    """
+    args = [a for a in argv if a != "--audit"]
+    if "--json" not in args:
+        return None
+    args.remove("--json")
+    request = {"op": "map"}
+    if "--hints" in args:
+        args.remove("--hints")
+        request["op"] = "audit"
+    if "--rules-for" in args:
+        i = args.index("--rules-for")
+        if request["op"] != "map" or i + 1 >= len(args):
+            return None
+        request = {"op": "rules_for", "file": os.path.join(os.getcwd(), args[i + 1])}
+        del args[i : i + 2]
+    if len(args) > 1 or any(a.startswith("-") for a in args):
+        return None
+    request["cwd"] = os.path.realpath(args[0] if args else os.curdir)
+    request["home"] = os.path.expanduser("~")
+    return request
+
+
+def result_key(argv: list[str]) -> str | None:
+    """Cache key for a `--json [path]` invocation; None for anything else."""
+    request = parse_query(argv)
+    if request is None or request["op"] != "map":
+        return None
+    return "\0".join(("json", request["cwd"], request["home"]))
+
+
+def stamp(path: str) -> str:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "-"
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def snapshot(stamped, present, started_ns: int) -> str | None:
+    """One "stamp path" line per dependency; None if one is too fresh to trust.
+
+    Presence-only paths record "+" or "-". A file rewritten within one
+    mtime tick of being read looks unchanged, so nothing modified after
+    (started_ns - RACY_NS) is cached.
+    """
+    lines = {}
+    for path in present:
+        lines[path] = "+" if os.path.exists(path) else "-"
+    for path in stamped:
+        recorded = stamp(path)
+        if recorded != "-" and int(recorded.partition(":")[0]) >= started_ns - RACY_NS:
+            return None
+        lines[path] = recorded
+    return "\n".join(f"{lines[path]} {path}" for path in sorted(lines))
+
+
+def unchanged(recorded: str, path: str) -> bool:
+    if recorded == "+":
+        return os.path.exists(path)
+    if recorded == "-":
+        return not os.path.exists(path)
+    return stamp(path) == recorded
+
+
+def lookup(key: str) -> str | None:
+    """Stored output for key if every dependency still has its stamp."""
+    path = index_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=0.5)
+        try:
+            row = db.execute(
+                "SELECT deps, output FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        finally:
+            db.close()
+    except sqlite3.Error:
+        return None
+    if row is None:
+        return None
+    deps, output = row
+    for line in deps.splitlines():
+        recorded, _, dep = line.partition(" ")
+        if not unchanged(recorded, dep):
+            return None
+    return output
+
+
+def ask_daemon(request: dict, timeout: float = DAEMON_TIMEOUT):
+    """The daemon's result for request, or None (not running, error, timeout)."""
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+    import json
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as reply:
+                response = json.loads(reply.readline())
+    except (OSError, ValueError):
+        return None
+    return response.get("result") if response.get("ok") else None
+
+
+def try_daemon(argv: list[str]) -> bool:
+    """Print the daemon's answer for argv and return True, or return False."""
+    request = parse_query(argv)
+    result = ask_daemon(request) if request is not None else None
+    if result is None:
+        return False
+    import json
+
+    sys.stdout.write(json.dumps(result, indent=2) + "\n")
+    return True
+
+
+def try_cached(argv: list[str]) -> bool:
+    """Print the cached output for argv and return True, or return False."""
+    key = result_key(argv)
+    output = lookup(key) if key is not None else None
+    if output is None:
+        return False
+    sys.stdout.write(output + "\n")
+    return True
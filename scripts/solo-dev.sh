@@ -698,9 +698,14 @@ If the stage needs to go back (e.g. review found issues), output exactly: <solo:
   fi
   log_entry "INVOKE" "$SKILL $ARGS"
   OUTFILE=$(mktemp /tmp/solo-claude-XXXXXX)
+  # Raw stream-json for this stage, next to its .log: the formatter adds .zst
+  # (or .gz without the zstandard module); rate-limit retries append to it
+  ARCHIVE="$PROJECT_ROOT/.solo/pipelines/iter-$(printf '%03d' $ITERATION)-${STAGE_ID}.jsonl"
   CLAUDE_EXIT=0
   (cd "$CLAUDE_CWD" && claude $CLAUDE_FLAGS -p "$PROMPT" 2>&1) \
-    | python3 "$SCRIPT_DIR/solo-stream-fmt.py" \
+    | python3 "$SCRIPT_DIR/solo-stream-fmt.py" --buffered \
+      --metrics "$OUTFILE.metrics.json" --trace "$OUTFILE.trace.json" \
+      --archive "$ARCHIVE" \
     | tee "$OUTFILE" || CLAUDE_EXIT=$?
   OUTPUT=$(cat "$OUTFILE")
 
@@ -709,11 +714,11 @@ If the stage needs to go back (e.g. review found issues), output exactly: <solo:
   RATE_LIMIT_STATUS=0
   check_rate_limit "$OUTFILE" "$CLAUDE_EXIT" || RATE_LIMIT_STATUS=$?
   if [[ $RATE_LIMIT_STATUS -eq 2 ]]; then
-    rm -f "$OUTFILE"
+    rm -f "$OUTFILE" "$OUTFILE".{metrics,trace}.json
     break
   elif [[ $RATE_LIMIT_STATUS -eq 0 ]]; then
     sleep "$RATE_LIMIT_BACKOFF"
-    rm -f "$OUTFILE"
+    rm -f "$OUTFILE" "$OUTFILE".{metrics,trace}.json
     continue  # retry same stage, don't count toward circuit breaker
   fi
 
@@ -733,7 +738,7 @@ If the stage needs to go back (e.g. review found issues), output exactly: <solo:
       log_entry "SIGNAL" "<solo:redo/> → build not in stages, re-exec from build ($REMAINING iters left)"
       # Save iter log before re-exec
       cp "$OUTFILE" "$ITER_DIR/iter-$(printf '%03d' $ITERATION)-${STAGE_ID}.log" 2>/dev/null || true
-      rm -f "$STATE_FILE" "$OUTFILE"
+      rm -f "$STATE_FILE" "$OUTFILE" "$OUTFILE".{metrics,trace}.json
       REEXEC_ARGS=("$PROJECT_NAME" "$STACK" --from build --no-dashboard --max "$REMAINING" --max-hours "$MAX_HOURS")
       [[ -n "$FEATURE" ]] && REEXEC_ARGS+=(--feature "$FEATURE")
       [[ -n "$CONTEXT_FILE" ]] && REEXEC_ARGS+=(--file "$CONTEXT_FILE")
@@ -747,6 +752,8 @@ If the stage needs to go back (e.g. review found issues), output exactly: <solo:
   ITER_DIR="$PROJECT_ROOT/.solo/pipelines"
   mkdir -p "$ITER_DIR"
   cp "$OUTFILE" "$ITER_DIR/iter-$(printf '%03d' $ITERATION)-${STAGE_ID}.log"
+  cp "$OUTFILE.metrics.json" "$ITER_DIR/iter-$(printf '%03d' $ITERATION)-${STAGE_ID}.metrics.json" 2>/dev/null || true
+  cp "$OUTFILE.trace.json" "$ITER_DIR/iter-$(printf '%03d' $ITERATION)-${STAGE_ID}.trace.json" 2>/dev/null || true
 
   # --- Running docs (progress.md) ---
   PROGRESS_FILE="$ITER_DIR/progress.md"
@@ -772,11 +779,11 @@ PROGRESSEOF
 
   # --- Circuit breaker: abort after N consecutive identical failures ---
   if ! check_circuit_breaker "$STAGE_ID" "$OUTFILE" "$STAGE_RESULT"; then
-    rm -f "$OUTFILE"
+    rm -f "$OUTFILE" "$OUTFILE".{metrics,trace}.json
     break
   fi
 
-  rm -f "$OUTFILE"
+  rm -f "$OUTFILE" "$OUTFILE".{metrics,trace}.json
 
   # Check output file
   if [[ "$CHECK" == *"*"* ]]; then
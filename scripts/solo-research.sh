@@ -365,7 +365,7 @@ If the stage needs to go back (e.g. review found issues), output exactly: <solo:
   CLAUDE_EXIT=0
   claude --dangerously-skip-permissions --verbose --print \
     $MCP_FLAG --output-format stream-json -p "$PROMPT" 2>&1 \
-    | python3 "$SCRIPT_DIR/solo-stream-fmt.py" \
+    | python3 "$SCRIPT_DIR/solo-stream-fmt.py" --buffered \
     | tee "$OUTFILE" || CLAUDE_EXIT=$?
   OUTPUT=$(cat "$OUTFILE")
 
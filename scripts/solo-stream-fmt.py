@@ -4,27 +4,87 @@
 Reads stream-json events from stdin, outputs colored human-readable progress.
 Designed for tmux pipelines — always outputs colors (use --no-color to disable).
 Plays 8-bit sound effects per tool call (use --no-sound to disable).
+SFX_SINK picks the player: auto (default), afplay, aplay, paplay, pw-play,
+null, or file:PATH to record every sound into one WAV.
 
 Usage:
   claude --print --output-format stream-json -p "prompt" | solo-stream-fmt.py
   claude --print --output-format stream-json -p "prompt" | solo-stream-fmt.py --no-color
   claude --print --output-format stream-json -p "prompt" | solo-stream-fmt.py --no-sound
+  claude --print --output-format stream-json -p "prompt" | solo-stream-fmt.py --buffered
+  ... | solo-stream-fmt.py --metrics m.json
+  ... | solo-stream-fmt.py --trace t.json
+  ... | solo-stream-fmt.py --archive run.jsonl
+
+--buffered reads stdin in large chunks and batches output: text deltas are
+coalesced and written at each newline or at least every FLUSH_INTERVAL.
+
+--metrics PATH keeps a JSON snapshot of per-tool call counts, gaps between
+tool calls, text bytes, errors and the token usage / cost reported by
+`result` events. It is rewritten every METRICS_INTERVAL and at exit.
+
+Tool calls are timed from their tool_use to the matching tool_result.
+Calls over SLOW_TOOL_S get an inline line with their duration, and the
+slowest TRACE_TOP are summarized on stderr at exit (stderr keeps the teed
+log's last lines stable). --trace PATH also writes a Chrome trace /
+Perfetto JSON.
+
+--archive PATH (or SOLO_FMT_ARCHIVE) appends every raw input line to a
+compressed archive from a background thread: zstd when the zstandard
+module is installed, gzip otherwise (a .gz / .zst suffix picks one).
+PATH without either suffix gets one added, so the file written is
+PATH.zst or PATH.gz depending on whether zstandard is installed. Lines
+are compressed in blocks of up to ARCHIVE_BLOCK bytes / ARCHIVE_FLUSH_S
+seconds, each an independent gzip member or zstd frame, so `zcat` /
+`zstd -dc` replays the whole file and the .idx file next to it (one JSON
+line per block: offset, length, first event number, time, run) lets a
+reader decompress just the block it needs. Several runs can append to
+the same archive.
 """
 
+import hashlib
 import json
 import sys
 import os
 import shutil
 import wave
-import struct
+import queue
 import random
+import select
 import subprocess
 import tempfile
+import threading
 import time
+from array import array
+
+try:
+    import orjson  # optional, ~3x faster decode
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+try:
+    import zstandard  # optional, better ratio and speed than gzip
+except ImportError:
+    zstandard = None
 
 # ── Flags ──
 NO_COLOR = "--no-color" in sys.argv or os.environ.get("NO_COLOR")
 NO_SOUND = "--no-sound" in sys.argv or os.environ.get("NO_SOUND")
+BUFFERED = "--buffered" in sys.argv or os.environ.get("SOLO_FMT_BUFFERED")
+
+
+def _flag_value(name: str) -> str:
+    """VALUE from `name VALUE` in argv, or ""."""
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return ""
+
+
+METRICS_PATH = _flag_value("--metrics") or os.environ.get("SOLO_FMT_METRICS", "")
+TRACE_PATH = _flag_value("--trace") or os.environ.get("SOLO_FMT_TRACE", "")
+ARCHIVE_PATH = _flag_value("--archive") or os.environ.get("SOLO_FMT_ARCHIVE", "")
 
 # ── Colors (always on for tmux pipelines, --no-color to disable) ──
 if NO_COLOR:
@@ -73,201 +133,469 @@ ICONS = {
 
 SAMPLE_RATE = 22050
 SFX_VOLUME = float(os.environ.get("SFX_VOLUME", "0.15"))
+SFX_SYNTH_VERSION = 1  # bump when the generators below change their output
+SFX_CACHE_MAX_FILES = 200  # WAVs kept across volumes / recipe versions
+SFX_CACHE_MAX_AGE = 30 * 86400  # unused WAVs older than this are evicted
+SFX_TOUCH_AFTER = 86400  # refresh mtime of WAVs in use at most once a day
 _sfx_cache: dict[str, str] = {}  # event_type -> wav path
 _sfx_dir: str = ""
+_sfx_dir_is_temp = False
 _last_sfx_time: float = 0
 SFX_COOLDOWN = 0.3  # min seconds between sounds
+# Playback sink: auto | afplay | aplay | paplay | pw-play | null | file:PATH
+SFX_SINK = os.environ.get("SFX_SINK", "auto")
+SFX_QUEUE_SIZE = 4  # sounds waiting beyond this are dropped
+_sfx_queue: queue.Queue = queue.Queue(maxsize=SFX_QUEUE_SIZE)
+_sfx_worker: threading.Thread | None = None
+_sfx_pcm: dict[str, bytes] = {}  # event_type -> s16le frames, loaded once
+
+
+def _silence(n: int) -> array:
+    return array("d", bytes(8 * n))
 
 
-def _square(
-    freq: float, duration: float, vol: float = 1.0, duty: float = 0.5
-) -> list[float]:
+def _attack(samples: array) -> array:
+    """Quick 3 ms attack ramp, applied in place to the first samples only."""
+    ramp = SAMPLE_RATE * 0.003
+    for i in range(min(len(samples), int(ramp) + 1)):
+        samples[i] *= min(1.0, i / ramp)
+    return samples
+
+
+def _square(freq: float, duration: float, vol: float = 1.0, duty: float = 0.5) -> array:
     """Generate square wave samples."""
-    samples = []
     n = int(SAMPLE_RATE * duration)
-    for i in range(n):
-        if freq == 0:
-            samples.append(0)
-        else:
-            t = i / SAMPLE_RATE
-            phase = (t * freq) % 1.0
-            val = vol if phase < duty else -vol
-            # Quick attack + decay envelope
-            env = min(1.0, i / (SAMPLE_RATE * 0.003))
-            tail = max(0.0, 1.0 - (i / n) * 0.8)
-            samples.append(val * env * tail)
-    return samples
+    if freq == 0:
+        return _silence(n)
+    # One comprehension per tone; decay tail never drops below 0.2
+    return _attack(
+        array(
+            "d",
+            [
+                (vol if (i / SAMPLE_RATE * freq) % 1.0 < duty else -vol)
+                * (1.0 - (i / n) * 0.8)
+                for i in range(n)
+            ],
+        )
+    )
 
 
-def _triangle(freq: float, duration: float, vol: float = 1.0) -> list[float]:
+def _triangle(freq: float, duration: float, vol: float = 1.0) -> array:
     """Generate triangle wave samples (softer than square)."""
-    samples = []
     n = int(SAMPLE_RATE * duration)
-    for i in range(n):
-        if freq == 0:
-            samples.append(0)
-        else:
-            t = i / SAMPLE_RATE
-            phase = (t * freq) % 1.0
-            val = (4 * abs(phase - 0.5) - 1) * vol
-            env = min(1.0, i / (SAMPLE_RATE * 0.003))
-            tail = max(0.0, 1.0 - (i / n) * 0.6)
-            samples.append(val * env * tail)
-    return samples
+    if freq == 0:
+        return _silence(n)
+    return _attack(
+        array(
+            "d",
+            [
+                (4 * abs((i / SAMPLE_RATE * freq) % 1.0 - 0.5) - 1)
+                * vol
+                * (1.0 - (i / n) * 0.6)
+                for i in range(n)
+            ],
+        )
+    )
 
 
-def _noise_burst(duration: float, vol: float = 0.5) -> list[float]:
+def _noise_burst(duration: float, vol: float = 0.5, rng=random) -> array:
     """Short noise burst for percussive sounds."""
-    samples = []
     n = int(SAMPLE_RATE * duration)
-    for i in range(n):
-        env = max(0, 1.0 - (i / n) * 6)
-        samples.append(random.uniform(-vol, vol) * env)
+    audible = -(-n // 6)  # envelope reaches zero after the first sixth
+    samples = array(
+        "d",
+        [rng.uniform(-vol, vol) * (1.0 - (i / n) * 6) for i in range(audible)],
+    )
+    return samples + _silence(n - audible)
+
+
+def _clip(samples: array) -> array:
+    if samples and (min(samples) < -0.95 or max(samples) > 0.95):
+        return array("d", [max(-0.95, min(0.95, s)) for s in samples])
     return samples
 
 
-def _write_wav(path: str, samples: list[float]):
-    """Write samples to WAV file."""
-    with wave.open(path, "w") as w:
-        w.setnchannels(1)
-        w.setsampwidth(2)
-        w.setframerate(SAMPLE_RATE)
-        for s in samples:
-            s = max(-0.95, min(0.95, s))
-            w.writeframes(struct.pack("<h", int(s * 32767)))
+def _write_wav(path: str, samples: array):
+    """Write samples to WAV file (one writeframes call).
 
+    Written to a temp file beside path and renamed into place, so a
+    concurrent reader never sees a partial WAV.
+    """
+    frames = array("h", [int(s * 32767) for s in _clip(samples)])
+    if sys.byteorder == "big":
+        frames.byteswap()  # WAV is little-endian
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".wav")
+    try:
+        with os.fdopen(fd, "wb") as f, wave.open(f, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(SAMPLE_RATE)
+            w.writeframes(frames.tobytes())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
 
-def _merge(a: list[float], b: list[float]) -> list[float]:
-    """Mix two sample lists."""
-    length = max(len(a), len(b))
-    result = []
-    for i in range(length):
-        va = a[i] if i < len(a) else 0
-        vb = b[i] if i < len(b) else 0
-        result.append(max(-0.95, min(0.95, va + vb)))
-    return result
 
+def _merge(a: array, b: array) -> array:
+    """Mix two sample arrays."""
+    if len(a) < len(b):
+        a, b = b, a
+    mixed = array("d", a)
+    mixed[: len(b)] = array("d", [x + y for x, y in zip(a, b)])
+    return _clip(mixed)
 
-def _generate_all_sfx():
-    """Generate all sound effect WAV files into a temp directory."""
-    global _sfx_dir
-    _sfx_dir = tempfile.mkdtemp(prefix="solo-sfx-")
-    v = SFX_VOLUME
 
+# Effect recipes: segments played back to back. A segment is a tone
+# ("square", freq, seconds, vol, duty) / ("triangle", freq, seconds, vol) /
+# ("noise", seconds, vol), or ("mix", segment, segment). Volumes are
+# fractions of SFX_VOLUME. The cache key hashes the recipe, so editing
+# one only re-synthesizes that effect.
+SFX_RECIPES = {
     # Read: soft ascending two-note (C5 → E5, triangle, gentle)
-    s = _triangle(523, 0.06, v * 0.5) + _triangle(659, 0.08, v * 0.6)
-    _write_wav(os.path.join(_sfx_dir, "read.wav"), s)
-    _sfx_cache["read"] = os.path.join(_sfx_dir, "read.wav")
-
+    "read": [("triangle", 523, 0.06, 0.5), ("triangle", 659, 0.08, 0.6)],
     # Write/Edit: decisive two-note chord (E4 → C5, square, punchy)
-    s = _square(330, 0.05, v * 0.4, 0.25) + _square(523, 0.08, v * 0.5, 0.25)
-    _write_wav(os.path.join(_sfx_dir, "write.wav"), s)
-    _sfx_cache["write"] = os.path.join(_sfx_dir, "write.wav")
-
+    "write": [("square", 330, 0.05, 0.4, 0.25), ("square", 523, 0.08, 0.5, 0.25)],
     # Bash: sharp click (noise + high square blip)
-    s = _merge(_noise_burst(0.03, v * 0.3), _square(880, 0.04, v * 0.3, 0.15))
-    _write_wav(os.path.join(_sfx_dir, "bash.wav"), s)
-    _sfx_cache["bash"] = os.path.join(_sfx_dir, "bash.wav")
-
+    "bash": [("mix", ("noise", 0.03, 0.3), ("square", 880, 0.04, 0.3, 0.15))],
     # Search (Glob/Grep): scanning sweep (ascending A4→D5→A5)
-    s = (
-        _triangle(440, 0.04, v * 0.4)
-        + _triangle(587, 0.04, v * 0.45)
-        + _triangle(880, 0.05, v * 0.5)
-    )
-    _write_wav(os.path.join(_sfx_dir, "search.wav"), s)
-    _sfx_cache["search"] = os.path.join(_sfx_dir, "search.wav")
-
+    "search": [
+        ("triangle", 440, 0.04, 0.4),
+        ("triangle", 587, 0.04, 0.45),
+        ("triangle", 880, 0.05, 0.5),
+    ],
     # Web (WebSearch/WebFetch): melodic ping (G5 with harmonics)
-    s1 = _triangle(784, 0.1, v * 0.5)
-    s2 = _square(784 * 2, 0.1, v * 0.15, 0.25)
-    s = _merge(s1, s2)
-    _write_wav(os.path.join(_sfx_dir, "web.wav"), s)
-    _sfx_cache["web"] = os.path.join(_sfx_dir, "web.wav")
-
+    "web": [("mix", ("triangle", 784, 0.1, 0.5), ("square", 784 * 2, 0.1, 0.15, 0.25))],
     # Task/Agent: arpeggio (C4→E4→G4→C5, exciting)
-    s = (
-        _square(262, 0.05, v * 0.35, 0.25)
-        + _square(330, 0.05, v * 0.4, 0.25)
-        + _square(392, 0.05, v * 0.45, 0.25)
-        + _square(523, 0.08, v * 0.5, 0.25)
-    )
-    _write_wav(os.path.join(_sfx_dir, "agent.wav"), s)
-    _sfx_cache["agent"] = os.path.join(_sfx_dir, "agent.wav")
-
+    "agent": [
+        ("square", 262, 0.05, 0.35, 0.25),
+        ("square", 330, 0.05, 0.4, 0.25),
+        ("square", 392, 0.05, 0.45, 0.25),
+        ("square", 523, 0.08, 0.5, 0.25),
+    ],
     # Skill: power-up (ascending fast: E5→G5→B5)
-    s = (
-        _square(659, 0.04, v * 0.4, 0.3)
-        + _square(784, 0.04, v * 0.45, 0.3)
-        + _square(988, 0.06, v * 0.5, 0.3)
-    )
-    _write_wav(os.path.join(_sfx_dir, "skill.wav"), s)
-    _sfx_cache["skill"] = os.path.join(_sfx_dir, "skill.wav")
-
+    "skill": [
+        ("square", 659, 0.04, 0.4, 0.3),
+        ("square", 784, 0.04, 0.45, 0.3),
+        ("square", 988, 0.06, 0.5, 0.3),
+    ],
     # MCP: electronic blip (high square + quick noise)
-    s = _merge(_square(1047, 0.04, v * 0.3, 0.2), _noise_burst(0.02, v * 0.1))
-    _write_wav(os.path.join(_sfx_dir, "mcp.wav"), s)
-    _sfx_cache["mcp"] = os.path.join(_sfx_dir, "mcp.wav")
-
+    "mcp": [("mix", ("square", 1047, 0.04, 0.3, 0.2), ("noise", 0.02, 0.1))],
     # Error: descending (A4→E4→C4, ominous)
-    s = (
-        _square(440, 0.08, v * 0.5, 0.5)
-        + _square(330, 0.08, v * 0.45, 0.5)
-        + _square(262, 0.12, v * 0.4, 0.5)
-    )
-    _write_wav(os.path.join(_sfx_dir, "error.wav"), s)
-    _sfx_cache["error"] = os.path.join(_sfx_dir, "error.wav")
-
+    "error": [
+        ("square", 440, 0.08, 0.5, 0.5),
+        ("square", 330, 0.08, 0.45, 0.5),
+        ("square", 262, 0.12, 0.4, 0.5),
+    ],
     # Stage start: fanfare (C4→E4→G4→C5, longer + louder)
-    s = (
-        _square(262, 0.08, v * 0.4, 0.25)
-        + _square(330, 0.08, v * 0.45, 0.25)
-        + _square(392, 0.08, v * 0.5, 0.25)
-        + _triangle(523, 0.15, v * 0.6)
+    "stage": [
+        ("square", 262, 0.08, 0.4, 0.25),
+        ("square", 330, 0.08, 0.45, 0.25),
+        ("square", 392, 0.08, 0.5, 0.25),
+        ("triangle", 523, 0.15, 0.6),
+    ],
+    # Completion: victory jingle (C5→E5→G5→C6, bright + long)
+    "complete": [
+        ("triangle", 523, 0.08, 0.5),
+        ("triangle", 659, 0.08, 0.55),
+        ("triangle", 784, 0.08, 0.6),
+        ("triangle", 1047, 0.2, 0.7),
+    ],
+    # Browser: navigation ping (D5 → A5, bright web feel)
+    "browser": [("triangle", 587, 0.06, 0.45), ("triangle", 880, 0.08, 0.5)],
+    # Generic tool: single blip
+    "blip": [("triangle", 659, 0.06, 0.35)],
+}
+
+
+def _render(segment: tuple, rng: random.Random) -> array:
+    """Synthesize one recipe segment at SFX_VOLUME."""
+    kind, *args = segment
+    v = SFX_VOLUME
+    if kind == "mix":
+        return _merge(_render(args[0], rng), _render(args[1], rng))
+    if kind == "square":
+        freq, duration, vol, duty = args
+        return _square(freq, duration, v * vol, duty)
+    if kind == "triangle":
+        freq, duration, vol = args
+        return _triangle(freq, duration, v * vol)
+    if kind == "noise":
+        duration, vol = args
+        return _noise_burst(duration, v * vol, rng)
+    raise ValueError(f"unknown sfx segment: {kind}")
+
+
+def _sfx_key(recipe: list) -> str:
+    """Content address of an effect: everything that shapes its samples."""
+    spec = json.dumps([SFX_SYNTH_VERSION, SAMPLE_RATE, SFX_VOLUME, recipe])
+    return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+
+def _sfx_cache_dir() -> str:
+    if os.environ.get("SFX_CACHE_DIR"):
+        return os.environ["SFX_CACHE_DIR"]
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(HOME, ".cache")
+    return os.path.join(cache, "solo-factory", "sfx")
+
+
+def _evict_sfx(keep: set[str]):
+    """Drop WAVs unused for SFX_CACHE_MAX_AGE, then the oldest past SFX_CACHE_MAX_FILES.
+
+    Temp files younger than an hour may belong to a concurrent writer.
+    """
+    now = time.time()
+    entries = []
+    with os.scandir(_sfx_dir) as it:
+        for entry in it:
+            if not entry.name.endswith(".wav") or entry.path in keep:
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if entry.name.startswith(".tmp-") and now - mtime < 3600:
+                continue
+            entries.append((mtime, entry.path))
+    entries.sort(reverse=True)
+    budget = SFX_CACHE_MAX_FILES - len(keep)
+    for i, (mtime, path) in enumerate(entries):
+        if i >= budget or now - mtime > SFX_CACHE_MAX_AGE:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def _generate_all_sfx():
+    """Point _sfx_cache at cached WAVs, synthesizing only the missing ones.
+
+    WAVs live in a shared cache dir as <name>-<key>.wav, so a warm launch
+    only stats them. Noise is seeded from the key, so every writer of a
+    given file produces the same bytes. Falls back to a per-run temp dir
+    when the cache dir is not writable.
+    """
+    global _sfx_dir, _sfx_dir_is_temp
+    _sfx_dir = _sfx_cache_dir()
+    try:
+        os.makedirs(_sfx_dir, exist_ok=True)
+        if not os.access(_sfx_dir, os.W_OK):
+            raise PermissionError(_sfx_dir)
+    except OSError:
+        _sfx_dir = tempfile.mkdtemp(prefix="solo-sfx-")
+        _sfx_dir_is_temp = True
+
+    now = time.time()
+    wrote = False
+    for name, recipe in SFX_RECIPES.items():
+        key = _sfx_key(recipe)
+        path = os.path.join(_sfx_dir, f"{name}-{key}.wav")
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            rng = random.Random(key)
+            samples = array("d")
+            for segment in recipe:
+                samples += _render(segment, rng)
+            _write_wav(path, samples)
+            wrote = True
+        else:
+            if now - st.st_mtime > SFX_TOUCH_AFTER:
+                try:
+                    os.utime(path)  # still in use; keep it out of eviction
+                except OSError:
+                    pass
+        _sfx_cache[name] = path
+
+    if wrote and not _sfx_dir_is_temp:
+        _evict_sfx(set(_sfx_cache.values()))
+
+
+# ── Playback ──
+# One worker thread owns the sink. The event loop only enqueues names: it
+# never forks or blocks for sound. Sounds that pile up while the sink is
+# busy are mixed into one; a full queue drops new ones.
+
+
+def _load_pcm(name: str) -> bytes:
+    if name not in _sfx_pcm:
+        try:
+            with wave.open(_sfx_cache[name], "rb") as w:
+                _sfx_pcm[name] = w.readframes(w.getnframes())
+        except (KeyError, OSError, EOFError, wave.Error):
+            _sfx_pcm[name] = b""
+    return _sfx_pcm[name]
+
+
+def _mix_pcm(names: list[str]) -> bytes:
+    """Mix the named sounds into one s16le buffer."""
+    clips = [pcm for pcm in map(_load_pcm, names) if pcm]
+    if len(clips) < 2:
+        return clips[0] if clips else b""
+    tracks = []
+    for pcm in clips:
+        track = array("h", pcm)
+        if sys.byteorder == "big":
+            track.byteswap()
+        tracks.append(track)
+    mixed = array("h", bytes(2 * max(map(len, tracks))))
+    for track in tracks:
+        mixed[: len(track)] = array(
+            "h",
+            [max(-32767, min(32767, x + y)) for x, y in zip(mixed, track)],
+        )
+    if sys.byteorder == "big":
+        mixed.byteswap()
+    return mixed.tobytes()
+
+
+class _NullSink:
+    """Plays nothing (no player found, or SFX_SINK=null)."""
+
+    def play(self, names: list[str]):
+        pass
+
+    def close(self):
+        pass
+
+
+class _AfplaySink(_NullSink):
+    """macOS afplay only reads files: one process per sound, newest wins."""
+
+    def play(self, names: list[str]):
+        subprocess.Popen(
+            ["afplay", "-v", str(SFX_VOLUME), _sfx_cache[names[-1]]],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+
+class _PipeSink(_NullSink):
+    """Long-lived player process reading raw mono s16le PCM on stdin."""
+
+    def __init__(self, argv: list[str]):
+        self.proc = subprocess.Popen(
+            argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def play(self, names: list[str]):
+        self.proc.stdin.write(_mix_pcm(names))
+        self.proc.stdin.flush()
+
+    def close(self):
+        # The player drains what is buffered and exits on EOF
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+
+
+class _FileSink(_NullSink):
+    """Appends everything played to one WAV file (tests, debugging)."""
+
+    def __init__(self, path: str):
+        self.wav = wave.open(path, "wb")
+        self.wav.setnchannels(1)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(SAMPLE_RATE)
+
+    def play(self, names: list[str]):
+        self.wav.writeframes(_mix_pcm(names))
+
+    def close(self):
+        self.wav.close()
+
+
+# Players that stream raw PCM from stdin, in "auto" preference order
+_PIPE_PLAYERS = {
+    name: command.format(rate=SAMPLE_RATE).split()
+    for name, command in (
+        ("pw-play", "pw-play --rate {rate} --channels 1 --format s16 -"),
+        ("paplay", "paplay --raw --rate={rate} --channels=1 --format=s16le"),
+        ("aplay", "aplay -q -t raw -f S16_LE -r {rate} -c 1"),
     )
-    _write_wav(os.path.join(_sfx_dir, "stage.wav"), s)
-    _sfx_cache["stage"] = os.path.join(_sfx_dir, "stage.wav")
+}
 
-    # Completion: victory jingle (C5→E5→G5→C6, bright + long)
-    s = (
-        _triangle(523, 0.08, v * 0.5)
-        + _triangle(659, 0.08, v * 0.55)
-        + _triangle(784, 0.08, v * 0.6)
-        + _triangle(1047, 0.2, v * 0.7)
+
+def _open_sink(spec: str) -> _NullSink:
+    """Build the sink for SFX_SINK; "auto" picks the first player on PATH."""
+    if spec.startswith("file:"):
+        return _FileSink(spec[len("file:") :])
+    if spec == "auto":
+        candidates = ["afplay"] if sys.platform == "darwin" else list(_PIPE_PLAYERS)
+        spec = next((c for c in candidates if shutil.which(c)), "null")
+    if spec == "afplay":
+        return _AfplaySink()
+    if spec in _PIPE_PLAYERS:
+        return _PipeSink(_PIPE_PLAYERS[spec])
+    return _NullSink()
+
+
+def _sfx_loop(sink: _NullSink):
+    """Worker: play queued sounds until the None sentinel arrives."""
+    stop = False
+    while not stop:
+        names = [_sfx_queue.get()]
+        while True:
+            try:
+                names.append(_sfx_queue.get_nowait())
+            except queue.Empty:
+                break
+        stop = None in names
+        names = list(dict.fromkeys(n for n in names if n is not None))
+        if names:
+            try:
+                sink.play(names)
+            except Exception:
+                sink = _NullSink()  # player died; stay silent
+    try:
+        sink.close()
+    except Exception:
+        pass
+
+
+def _start_sfx():
+    """Open the sink and start the playback worker."""
+    global _sfx_worker
+    sink = _open_sink(SFX_SINK)
+    _sfx_worker = threading.Thread(
+        target=_sfx_loop, args=(sink,), name="sfx", daemon=True
     )
-    _write_wav(os.path.join(_sfx_dir, "complete.wav"), s)
-    _sfx_cache["complete"] = os.path.join(_sfx_dir, "complete.wav")
+    _sfx_worker.start()
 
-    # Browser: navigation ping (D5 → A5, bright web feel)
-    s = _triangle(587, 0.06, v * 0.45) + _triangle(880, 0.08, v * 0.5)
-    _write_wav(os.path.join(_sfx_dir, "browser.wav"), s)
-    _sfx_cache["browser"] = os.path.join(_sfx_dir, "browser.wav")
 
-    # Generic tool: single blip
-    s = _triangle(659, 0.06, v * 0.35)
-    _write_wav(os.path.join(_sfx_dir, "blip.wav"), s)
-    _sfx_cache["blip"] = os.path.join(_sfx_dir, "blip.wav")
+def _stop_sfx(timeout: float = 2.0):
+    """Let the worker finish what is queued, then close the sink."""
+    global _sfx_worker
+    if _sfx_worker is None:
+        return
+    try:
+        _sfx_queue.put(None, timeout=timeout)
+        _sfx_worker.join(timeout)
+    except queue.Full:
+        pass
+    _sfx_worker = None
 
 
 def _play_sfx(event_type: str):
-    """Play sound effect non-blocking. Respects cooldown."""
+    """Queue a sound effect. Respects cooldown; never blocks."""
     global _last_sfx_time
-    if NO_SOUND:
+    if NO_SOUND or _sfx_worker is None:
         return
     now = time.monotonic()
     if now - _last_sfx_time < SFX_COOLDOWN:
         return
     _last_sfx_time = now
-    wav = _sfx_cache.get(event_type)
-    if wav and os.path.exists(wav):
-        try:
-            subprocess.Popen(
-                ["afplay", "-v", str(SFX_VOLUME), wav],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-        except Exception:
-            pass
+    try:
+        _sfx_queue.put_nowait(event_type)
+    except queue.Full:
+        pass
 
 
 def _sfx_for_tool(name: str) -> str:
@@ -295,13 +623,409 @@ def _sfx_for_tool(name: str) -> str:
 
 
 def _cleanup_sfx():
-    """Remove temp sound files."""
-    if _sfx_dir and os.path.isdir(_sfx_dir):
+    """Stop playback; remove sound files if they went to a per-run temp dir."""
+    _stop_sfx()
+    if _sfx_dir_is_temp and os.path.isdir(_sfx_dir):
         import shutil as _sh
 
         _sh.rmtree(_sfx_dir, ignore_errors=True)
 
 
+# ═══════════════════════════════════════════════
+# Metrics sidecar (--metrics PATH)
+# ═══════════════════════════════════════════════
+
+METRICS_INTERVAL = 10.0  # seconds between periodic sidecar rewrites
+_started_at = time.time()
+_started = time.monotonic()
+_last_tool_at: float | None = None
+_metrics_written_at = 0.0
+_metrics = {
+    "session_id": "",
+    "model": "",
+    "events": 0,
+    "non_json_lines": 0,
+    "text_bytes": 0,
+    "errors": 0,
+    "tool_calls": 0,
+    "tools": {},  # tool name -> calls
+    "tool_gap_s": {"count": 0, "total": 0.0, "max": 0.0},
+    "tool_time_s": {},  # tool name -> summed tool_use..tool_result time
+    "tool_errors": 0,
+    "results": 0,
+    "result_errors": 0,
+    "num_turns": 0,
+    "duration_ms": 0,
+    "duration_api_ms": 0,
+    "total_cost_usd": 0.0,
+    "usage": {},  # summed across result events
+}
+
+
+def _add_counts(total: dict, counts: dict):
+    """Sum numeric fields of counts into total, recursing into dicts."""
+    for k, v in counts.items():
+        if isinstance(v, dict):
+            _add_counts(total.setdefault(k, {}), v)
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            total[k] = total.get(k, 0) + v
+
+
+def _count_tool(name: str):
+    global _last_tool_at
+    now = time.monotonic()
+    _metrics["tool_calls"] += 1
+    _metrics["tools"][name] = _metrics["tools"].get(name, 0) + 1
+    if _last_tool_at is not None:
+        gap = _metrics["tool_gap_s"]
+        gap["count"] += 1
+        gap["total"] += now - _last_tool_at
+        gap["max"] = max(gap["max"], now - _last_tool_at)
+    _last_tool_at = now
+
+
+def _count_result(event: dict):
+    m = _metrics
+    m["results"] += 1
+    if event.get("is_error"):
+        m["result_errors"] += 1
+    for key in ("num_turns", "duration_ms", "duration_api_ms"):
+        if isinstance(event.get(key), (int, float)):
+            m[key] += event[key]
+    cost = event.get("total_cost_usd", event.get("cost_usd"))
+    if isinstance(cost, (int, float)):
+        m["total_cost_usd"] += cost
+    if isinstance(event.get("usage"), dict):
+        _add_counts(m["usage"], event["usage"])
+
+
+def _write_json(path: str, data, indent: int | None = 2):
+    """Write JSON via a temp file + rename; errors are ignored (output is optional)."""
+    try:
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-"
+        )
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=indent)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _write_metrics(final: bool = False):
+    """Atomically rewrite the sidecar (no-op without --metrics)."""
+    global _metrics_written_at
+    if not METRICS_PATH:
+        return
+    _metrics_written_at = time.monotonic()
+    snapshot = dict(
+        _metrics,
+        started_at=_started_at,
+        elapsed_s=round(_metrics_written_at - _started, 3),
+        final=final,
+    )
+    _write_json(METRICS_PATH, snapshot)
+
+
+def _maybe_write_metrics():
+    if METRICS_PATH and time.monotonic() - _metrics_written_at >= METRICS_INTERVAL:
+        _write_metrics()
+
+
+# ═══════════════════════════════════════════════
+# Tool-call tracing (tool_use ↔ tool_result by id)
+# ═══════════════════════════════════════════════
+
+SLOW_TOOL_S = float(os.environ.get("SLOW_TOOL_S", "5"))  # inline duration above this
+TRACE_TOP = 5  # slowest calls listed at exit
+_open_calls: dict[str, dict] = {}  # tool_use_id -> call in flight
+_calls: list[dict] = []  # finished calls
+
+
+def _fmt_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    return f"{int(seconds // 60)}m{int(seconds % 60):02d}s"
+
+
+def _output_size(content) -> int:
+    """Bytes of a tool_result's content (string or content blocks)."""
+    if isinstance(content, str):
+        return len(content.encode())
+    size = 0
+    for block in content if isinstance(content, list) else ():
+        if isinstance(block, dict):
+            text = block.get("text")
+            if isinstance(text, str):
+                size += len(text.encode())
+            elif block.get("type") == "image":
+                size += len(block.get("source", {}).get("data", ""))
+    return size
+
+
+def start_call(block: dict):
+    """Open a call for a tool_use block; repeats of an id are ignored."""
+    call_id = block.get("id")
+    if not call_id or call_id in _open_calls:
+        return
+    _open_calls[call_id] = {
+        "id": call_id,
+        "name": block.get("name", "?"),
+        "input": block.get("input") or {},
+        "start": time.monotonic(),
+    }
+
+
+def finish_call(block: dict):
+    """Close the call a tool_result block answers; note it inline if slow."""
+    call = _open_calls.pop(block.get("tool_use_id", ""), None)
+    if call is None:
+        return
+    call["end"] = time.monotonic()
+    call["bytes"] = _output_size(block.get("content"))
+    call["error"] = bool(block.get("is_error"))
+    _calls.append(call)
+
+    name, elapsed = call["name"], call["end"] - call["start"]
+    times = _metrics["tool_time_s"]
+    times[name] = times.get(name, 0.0) + elapsed
+    _metrics["tool_errors"] += call["error"]
+    if elapsed >= SLOW_TOOL_S:
+        color = RED if call["error"] else DIM
+        note = _fmt_duration(elapsed) + (", error" if call["error"] else "")
+        emit_line(
+            f"  {tool_icon(name)} {color}{short_tool_name(name)} ... ({note}){RESET}"
+        )
+
+
+def _busy_seconds(calls: list[dict]) -> float:
+    """Wall time covered by at least one of calls (overlaps counted once)."""
+    busy, cursor = 0.0, float("-inf")
+    for call in sorted(calls, key=lambda c: c["start"]):
+        start = max(call["start"], cursor)
+        if call["end"] > start:
+            busy += call["end"] - start
+            cursor = call["end"]
+    return busy
+
+
+def _close_open_calls():
+    """Treat calls still in flight at exit as ending now."""
+    now = time.monotonic()
+    for call in _open_calls.values():
+        _calls.append(dict(call, end=now, bytes=0, error=False, unfinished=True))
+    _open_calls.clear()
+
+
+def print_trace_summary():
+    """Slowest calls and tool vs. MCP vs. wall time, on stderr."""
+    if not _calls:
+        return
+    wall = time.monotonic() - _started
+    lines = [f"\n  {BOLD}-- slowest tool calls --{RESET}"]
+    slowest = sorted(_calls, key=lambda c: c["start"] - c["end"])[:TRACE_TOP]
+    for call in slowest:
+        took = _fmt_duration(call["end"] - call["start"])
+        flag = f" {RED}(error){RESET}" if call["error"] else ""
+        if call.get("unfinished"):
+            flag = f" {YELLOW}(unfinished){RESET}"
+        line = format_tool_line(call["name"], call["input"]).strip()
+        lines.append(f"  {took:>7}  {line}{flag}")
+    mcp = [c for c in _calls if c["name"].startswith("mcp__")]
+    busy, mcp_busy = _busy_seconds(_calls), _busy_seconds(mcp)
+    lines.append(
+        f"  {DIM}{len(_calls)} calls, tools busy {_fmt_duration(busy)}"
+        f" (mcp {_fmt_duration(mcp_busy)}) of {_fmt_duration(wall)} wall{RESET}"
+    )
+    sys.stderr.write("\n".join(lines) + "\n")
+    sys.stderr.flush()
+
+
+def write_trace():
+    """Chrome trace / Perfetto JSON: one lane per concurrently running call."""
+    if not TRACE_PATH:
+        return
+    end = time.monotonic()
+    session = _metrics["session_id"] or "session"
+    events = [
+        {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": session}},
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": 1,
+            "tid": 0,
+            "args": {"name": "session"},
+        },
+        {
+            "name": "session",
+            "cat": "session",
+            "ph": "X",
+            "pid": 1,
+            "tid": 0,
+            "ts": 0,
+            "dur": round((end - _started) * 1e6),
+        },
+    ]
+    lanes: list[float] = []  # lane -> end of its last call
+    for call in sorted(_calls, key=lambda c: c["start"]):
+        lane = next((i for i, busy in enumerate(lanes) if busy <= call["start"]), None)
+        if lane is None:
+            lane = len(lanes)
+            lanes.append(0.0)
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": 1,
+                    "tid": lane + 1,
+                    "args": {"name": f"tools {lane + 1}"},
+                }
+            )
+        lanes[lane] = call["end"]
+        args = {
+            "id": call["id"],
+            "output_bytes": call["bytes"],
+            "is_error": call["error"],
+        }
+        if call.get("unfinished"):
+            args["unfinished"] = True
+        events.append(
+            {
+                "name": call["name"],
+                "cat": "mcp" if call["name"].startswith("mcp__") else "tool",
+                "ph": "X",
+                "pid": 1,
+                "tid": lane + 1,
+                "ts": round((call["start"] - _started) * 1e6),
+                "dur": round((call["end"] - call["start"]) * 1e6),
+                "args": args,
+            }
+        )
+    trace = {"traceEvents": events, "displayTimeUnit": "ms"}
+    _write_json(TRACE_PATH, trace, indent=None)
+
+
+# ═══════════════════════════════════════════════
+# Raw-event archive (--archive PATH)
+# ═══════════════════════════════════════════════
+
+ARCHIVE_BLOCK = 256 * 1024  # uncompressed bytes per block
+ARCHIVE_FLUSH_S = 2.0  # max seconds a line waits before its block is written
+_archive_queue: queue.SimpleQueue | None = None
+_archive_worker: threading.Thread | None = None
+
+
+def _archive_codec(path: str):
+    """(path, codec name, compress function) for the requested archive path."""
+    import gzip
+
+    use_zstd = zstandard is not None and not path.endswith(".gz")
+    if path.endswith(".zst") and zstandard is None:
+        sys.stderr.write(
+            "solo-stream-fmt: zstandard not installed, archiving with gzip\n"
+        )
+        path = path[: -len(".zst")]
+    if use_zstd:
+        suffix, codec = ".zst", "zstd"
+        compress = zstandard.ZstdCompressor(level=3).compress
+    else:
+        suffix, codec = ".gz", "gzip"
+
+        def compress(data: bytes) -> bytes:
+            return gzip.compress(data, compresslevel=6, mtime=0)
+
+    if not path.endswith(suffix):
+        path += suffix
+    return path, codec, compress
+
+
+def _archived_events(index_path: str) -> int:
+    """Events already in an archive being appended to (from its last index line)."""
+    try:
+        with open(index_path, "rb") as f:
+            f.seek(max(0, os.path.getsize(index_path) - 4096))
+            last = json.loads(f.read().splitlines()[-1])
+        return last["event"] + last["events"]
+    except (OSError, ValueError, IndexError, KeyError, TypeError):
+        return 0
+
+
+def _archive_loop(path: str, codec: str, compress):
+    """Writer thread: batch queued lines into compressed, indexed blocks."""
+    index_path = path + ".idx"
+    event = _archived_events(index_path)
+    batch: list[bytes] = []
+    size = 0
+    first_at = 0.0
+    with open(path, "ab") as out, open(index_path, "a") as index:
+        offset = out.tell()
+
+        def write_block():
+            nonlocal batch, size, offset, event
+            blob = compress(b"\n".join(batch) + b"\n")
+            out.write(blob)
+            out.flush()
+            entry = {
+                "offset": offset,
+                "length": len(blob),
+                "event": event,
+                "events": len(batch),
+                "t": round(first_at, 3),
+                "run": _started_at,
+                "codec": codec,
+            }
+            index.write(json.dumps(entry) + "\n")
+            index.flush()
+            offset += len(blob)
+            event += len(batch)
+            batch, size = [], 0
+
+        while True:
+            try:
+                line = _archive_queue.get(timeout=ARCHIVE_FLUSH_S if batch else None)
+            except queue.Empty:
+                write_block()
+                continue
+            if line is None:
+                break
+            if not batch:
+                first_at = time.time()
+            batch.append(line)
+            size += len(line) + 1
+            if size >= ARCHIVE_BLOCK:
+                write_block()
+        if batch:
+            write_block()
+
+
+def _start_archive():
+    global _archive_queue, _archive_worker
+    if not ARCHIVE_PATH:
+        return
+    path, codec, compress = _archive_codec(ARCHIVE_PATH)
+    _archive_queue = queue.SimpleQueue()
+    _archive_worker = threading.Thread(
+        target=_archive_loop, args=(path, codec, compress), name="archive", daemon=True
+    )
+    _archive_worker.start()
+
+
+def archive_line(line):
+    """Queue one raw input line (str or bytes) for the archive; never blocks."""
+    if _archive_queue is not None:
+        _archive_queue.put(line.encode() if isinstance(line, str) else line)
+
+
+def _close_archive():
+    """Write the last block and wait for the writer."""
+    global _archive_queue, _archive_worker
+    if _archive_worker is None:
+        return
+    _archive_queue.put(None)
+    _archive_worker.join()
+    _archive_queue = _archive_worker = None
+
+
 # ═══════════════════════════════════════════════
 # Formatting
 # ═══════════════════════════════════════════════
@@ -310,6 +1034,38 @@ def _cleanup_sfx():
 _last_was_tool = False
 _last_was_text = False
 
+# ── Output ──
+# Unbuffered: every write is flushed, as print(..., flush=True) did.
+# --buffered: writes collect in _pending until a newline or FLUSH_INTERVAL.
+FLUSH_INTERVAL = 0.03  # max seconds partial text waits on screen
+READ_CHUNK = 1 << 16
+_pending: list[str] = []
+_pending_since = 0.0
+_pending_newline = False
+
+
+def _write(s: str):
+    global _pending_since, _pending_newline
+    if not BUFFERED:
+        sys.stdout.write(s)
+        sys.stdout.flush()
+        return
+    if not _pending:
+        _pending_since = time.monotonic()
+    _pending.append(s)
+    if "\n" in s:
+        _pending_newline = True
+
+
+def _flush_output():
+    """Write everything pending in one call and flush stdout."""
+    global _pending_newline
+    if _pending:
+        sys.stdout.write("".join(_pending))
+        _pending.clear()
+        _pending_newline = False
+    sys.stdout.flush()
+
 
 def short_path(path: str) -> str:
     """Shorten path: replace home, truncate middle if too long."""
@@ -398,119 +1154,191 @@ def format_tool_line(name: str, inp: dict) -> str:
         return f"  {DIM}--{RESET} {CYAN}{short}{RESET} {DIM}{first_val}{RESET}"
 
 
-def emit_tool(name: str, inp: dict):
-    """Print a tool call line + play sound."""
+def emit_line(line: str):
+    """Print a tool-style status line (breaks out of a text block first)."""
     global _last_was_tool, _last_was_text
     if _last_was_text:
-        print(flush=True)  # newline after text block
-    line = format_tool_line(name, inp)
-    print(line, flush=True)
-    _play_sfx(_sfx_for_tool(name))
+        _write("\n")  # newline after text block
+    _write(line + "\n")
     _last_was_tool = True
     _last_was_text = False
 
 
+def emit_tool(name: str, inp: dict):
+    """Print a tool call line + play sound."""
+    emit_line(format_tool_line(name, inp))
+    _play_sfx(_sfx_for_tool(name))
+    _count_tool(name)
+
+
 def emit_text(text: str):
     """Print text content."""
     global _last_was_tool, _last_was_text
     if _last_was_tool and text.strip():
-        print(flush=True)  # blank line after tools before text
-    print(text, end="", flush=True)
+        _write("\n")  # blank line after tools before text
+    _write(text)
+    _metrics["text_bytes"] += len(text.encode())
     if text.strip():
         _last_was_text = True
         _last_was_tool = False
 
 
+def handle_event(event: dict):
+    """Render one stream-json event."""
+    etype = event.get("type", "")
+
+    if etype == "assistant":
+        msg = event.get("message", {})
+        for block in msg.get("content", []):
+            btype = block.get("type", "")
+            if btype == "tool_use":
+                start_call(block)
+                emit_tool(block.get("name", "?"), block.get("input", {}))
+            elif btype == "text":
+                text = block.get("text", "")
+                if text:
+                    emit_text(text)
+
+    elif etype == "result":
+        # Final result text
+        result = event.get("result", "")
+        if isinstance(result, str) and result.strip():
+            emit_text(result)
+        # Check nested content
+        for block in event.get("content", []):
+            if block.get("type") == "text":
+                emit_text(block.get("text", ""))
+        _count_result(event)
+        _play_sfx("complete")  # completion sound
+
+    elif etype == "content_block_start":
+        block = event.get("content_block", {})
+        if block.get("type") == "tool_use":
+            start_call(block)
+            name = block.get("name", "?")
+            inp = block.get("input", {})
+            if inp:
+                emit_tool(name, inp)
+            # If no input yet, we'll see it in deltas
+
+    elif etype == "user":
+        content = event.get("message", {}).get("content")
+        for block in content if isinstance(content, list) else ():
+            if isinstance(block, dict) and block.get("type") == "tool_result":
+                finish_call(block)
+
+    elif etype == "content_block_delta":
+        delta = event.get("delta", {})
+        if delta.get("type") == "text_delta":
+            emit_text(delta.get("text", ""))
+
+    elif etype == "error":
+        err = event.get("error", {})
+        msg = err.get("message", str(err))
+        _write(f"\n  {RED}!! Error: {msg}{RESET}\n")
+        _metrics["errors"] += 1
+        _play_sfx("error")
+
+    elif etype == "system":
+        subtype = event.get("subtype", "")
+        if subtype == "init":
+            session = event.get("session_id", "")[:8]
+            model = event.get("model", "")
+            _metrics["session_id"] = event.get("session_id", "")
+            _metrics["model"] = model
+            if model or session:
+                _write(f"  {DIM}session: {session}  model: {model}{RESET}\n")
+
+
+def handle_line(line):
+    """Decode one input line (str or bytes); non-JSON lines pass through."""
+    line = line.strip()
+    if not line:
+        return
+    archive_line(line)
+    try:
+        event = _loads(line)
+    except ValueError:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        _write(line + "\n")
+        _metrics["non_json_lines"] += 1
+        return
+    _metrics["events"] += 1
+    handle_event(event)
+    _maybe_write_metrics()
+
+
+def _read_buffered():
+    """Feed stdin to handle_line in READ_CHUNK reads.
+
+    Pending output is flushed once per chunk if it holds a newline, and
+    otherwise when FLUSH_INTERVAL runs out while waiting for input.
+    """
+    fd = sys.stdin.fileno()
+    tail = b""
+    while True:
+        timeout = None
+        if _pending:
+            timeout = max(0.0, _pending_since + FLUSH_INTERVAL - time.monotonic())
+        if not select.select([fd], [], [], timeout)[0]:
+            _flush_output()
+            continue
+        chunk = os.read(fd, READ_CHUNK)
+        if not chunk:
+            break
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            handle_line(line)
+        if _pending_newline or (
+            _pending and time.monotonic() - _pending_since >= FLUSH_INTERVAL
+        ):
+            _flush_output()
+    handle_line(tail)
+
+
 def main():
     # Generate sound effects at startup
     if not NO_SOUND:
         try:
             _generate_all_sfx()
+            _start_sfx()
         except Exception:
             pass  # sound is optional
 
     _play_sfx("stage")  # opening sound
+    _start_archive()
 
-    for line in sys.stdin:
-        line = line.strip()
-        if not line:
-            continue
-
-        try:
-            event = json.loads(line)
-        except json.JSONDecodeError:
-            print(line, flush=True)
-            continue
-
-        etype = event.get("type", "")
-
-        if etype == "assistant":
-            msg = event.get("message", {})
-            for block in msg.get("content", []):
-                btype = block.get("type", "")
-                if btype == "tool_use":
-                    emit_tool(block.get("name", "?"), block.get("input", {}))
-                elif btype == "text":
-                    text = block.get("text", "")
-                    if text:
-                        emit_text(text)
-
-        elif etype == "result":
-            # Final result text
-            result = event.get("result", "")
-            if isinstance(result, str) and result.strip():
-                emit_text(result)
-            # Check nested content
-            for block in event.get("content", []):
-                if block.get("type") == "text":
-                    emit_text(block.get("text", ""))
-            _play_sfx("complete")  # completion sound
-
-        elif etype == "content_block_start":
-            block = event.get("content_block", {})
-            if block.get("type") == "tool_use":
-                name = block.get("name", "?")
-                inp = block.get("input", {})
-                if inp:
-                    emit_tool(name, inp)
-                # If no input yet, we'll see it in deltas
-
-        elif etype == "content_block_delta":
-            delta = event.get("delta", {})
-            if delta.get("type") == "text_delta":
-                emit_text(delta.get("text", ""))
-
-        elif etype == "error":
-            err = event.get("error", {})
-            msg = err.get("message", str(err))
-            print(f"\n  {RED}!! Error: {msg}{RESET}", flush=True)
-            _play_sfx("error")
-
-        elif etype == "system":
-            msg = event.get("message", "")
-            subtype = event.get("subtype", "")
-            if subtype == "init":
-                session = event.get("session_id", "")[:8]
-                model = event.get("model", "")
-                if model or session:
-                    print(
-                        f"  {DIM}session: {session}  model: {model}{RESET}", flush=True
-                    )
+    if BUFFERED:
+        _read_buffered()
+    else:
+        for line in sys.stdin:
+            handle_line(line)
 
     # Final newline
-    print(flush=True)
+    _write("\n")
+    _flush_output()
+    _close_open_calls()
+    print_trace_summary()
     _play_sfx("complete")
 
-    # Cleanup temp files
-    _cleanup_sfx()
-
 
 if __name__ == "__main__":
     try:
         main()
-    except KeyboardInterrupt:
-        _cleanup_sfx()
+    except (KeyboardInterrupt, BrokenPipeError):
         sys.exit(0)
-    except BrokenPipeError:
+    finally:
+        # Every exit, crashes included: a crashed run's output, archive
+        # and metrics are the ones most worth having.
+        try:
+            _flush_output()  # --buffered: what was formatted before the exit
+        except OSError:
+            pass  # stdout is gone (broken pipe)
+        _close_open_calls()
+        write_trace()
+        _write_metrics(final=True)
+        _close_archive()
+        # Let queued sounds play, cleanup temp files
         _cleanup_sfx()
-        sys.exit(0)
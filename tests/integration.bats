@@ -103,6 +103,24 @@ run_pipeline() {
   grep -q "DONE" "$LOG_FILE"
 }
 
+@test "integration: each stage's raw stream is archived next to its log" {
+  export MOCK_CLAUDE_OUTPUT='<solo:done/>'
+  # Record the formatter's arguments, then pass the stream through
+  cat > "$MOCK_BIN/python3" << EOF
+#!/bin/bash
+if [[ "\$*" == *"solo-stream-fmt"* ]]; then echo "\$*" >> "$TEST_TMPDIR/fmt_args"; cat
+elif [[ "\$*" == *"yaml"* ]]; then echo ""; else /usr/bin/python3 "\$@"; fi
+EOF
+
+  run_pipeline
+
+  [ "$status" -eq 0 ]
+  PIPES="$PROJECT_ROOT/.solo/pipelines"
+  grep -q -- "--archive $PIPES/iter-001-build.jsonl" "$TEST_TMPDIR/fmt_args"
+  grep -q -- "--archive $PIPES/iter-002-deploy.jsonl" "$TEST_TMPDIR/fmt_args"
+  [ -f "$PIPES/iter-001-build.log" ]
+}
+
 # =============================================================
 # Redo flow
 # =============================================================
@@ -0,0 +1,684 @@
+#!/usr/bin/env bats
+# memory_map.bats — memory_map.py behaviour on small fixture trees
+
+load test_helper
+
+setup() {
+  export HOME="$BATS_TEST_TMPDIR/home"
+  export XDG_CACHE_HOME="$BATS_TEST_TMPDIR/cache"
+  mkdir -p "$HOME"
+  MEMORY_MAP="$REAL_SCRIPT_DIR/memory_map.py"
+  PROJ="$BATS_TEST_TMPDIR/proj"
+  mkdir -p "$PROJ/.claude/rules"
+  echo "# Project" > "$PROJ/CLAUDE.md"
+}
+
+teardown() {
+  if [ -n "${BG_PID:-}" ]; then
+    kill "$BG_PID" 2>/dev/null || true
+    wait "$BG_PID" 2>/dev/null || true
+  fi
+}
+
+# start_daemon — run --daemon in the background until its socket is up
+start_daemon() {
+  python3 "$MEMORY_MAP" --daemon 2>/dev/null &
+  BG_PID=$!
+  SOCK="$XDG_CACHE_HOME/solo-factory/memory-map.sock"
+  for _ in $(seq 50); do [ -S "$SOCK" ] && break; sleep 0.1; done
+  [ -S "$SOCK" ]
+}
+
+# ask_daemon LINE — send one raw request line, print the response line
+ask_daemon() {
+  python3 -c '
+import socket, sys
+with socket.socket(socket.AF_UNIX) as sock:
+    sock.connect(sys.argv[1])
+    sock.sendall(sys.argv[2].encode() + b"\n")
+    print(sock.makefile().readline(), end="")
+' "$SOCK" "$1"
+}
+
+# rule NAME GLOB — conditional rule with a single paths: glob
+rule() {
+  printf -- '---\npaths:\n  - "%s"\n---\nRule %s\n' "$2" "$1" > "$PROJ/.claude/rules/$1.md"
+}
+
+# ── Project walk (child CLAUDE.md discovery) ──
+
+@test "walk: finds nested CLAUDE.md but skips node_modules and gitignored dirs" {
+  for d in pkg/a node_modules/x gen/y; do
+    mkdir -p "$PROJ/$d"
+    echo "# $d" > "$PROJ/$d/CLAUDE.md"
+  done
+  mkdir -p "$PROJ/.git"
+  echo "gen/" > "$PROJ/.gitignore"
+
+  run python3 "$MEMORY_MAP" --json "$PROJ"
+
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"$PROJ/pkg/a/CLAUDE.md"* ]]
+  [[ "$output" != *"node_modules"* ]]
+  [[ "$output" != *"$PROJ/gen/"* ]]
+}
+
+@test "walk: --no-gitignore, --skip and --max-depth change what is walked" {
+  for d in gen/y pkg/a deep/d1/d2/d3; do
+    mkdir -p "$PROJ/$d"
+    echo "# $d" > "$PROJ/$d/CLAUDE.md"
+  done
+  mkdir -p "$PROJ/.git"
+  echo "gen/" > "$PROJ/.gitignore"
+
+  run python3 "$MEMORY_MAP" --json --no-gitignore "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"$PROJ/gen/y/CLAUDE.md"* ]]
+
+  run python3 "$MEMORY_MAP" --json --skip pkg "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" != *"$PROJ/pkg/"* ]]
+  [[ "$output" == *"$PROJ/deep/d1/d2/d3/CLAUDE.md"* ]]
+
+  run python3 "$MEMORY_MAP" --json --max-depth 2 "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"$PROJ/pkg/a/CLAUDE.md"* ]]
+  [[ "$output" != *"$PROJ/deep/"* ]]
+}
+
+@test "walk: a CLAUDE.md that is not valid UTF-8 is still listed" {
+  printf '\xff\xfe# Project\nsecond line\n' > "$PROJ/CLAUDE.md"
+
+  run python3 "$MEMORY_MAP" --json "$PROJ"
+
+  [ "$status" -eq 0 ]
+  run python3 -c '
+import json, sys
+memories = json.loads(sys.argv[1])
+project = [m for m in memories if m["path"] == sys.argv[2]]
+assert project and project[0]["lines"] == 2, memories
+' "$output" "$PROJ/CLAUDE.md"
+  [ "$status" -eq 0 ]
+}
+
+# ── Git root discovery (no git subprocess) ──
+
+# git_root DIR — the "Git:" line of the plain report for DIR, if any
+git_root() {
+  python3 "$MEMORY_MAP" --plain "$1" | sed -n 's/^  Git: //p'
+}
+
+@test "git root: linked worktrees and gitfile checkouts resolve like git does" {
+  repo="$BATS_TEST_TMPDIR/repo"
+  git init -q "$repo"
+  git -C "$repo" -c user.name=t -c user.email=t@t commit -q --allow-empty -m init
+  git -C "$repo" worktree add -q "$BATS_TEST_TMPDIR/wt"
+  mkdir -p "$BATS_TEST_TMPDIR/wt/pkg"
+  # --separate-git-dir leaves a gitfile, the same layout as a submodule
+  mkdir -p "$BATS_TEST_TMPDIR/modules"
+  git init -q --separate-git-dir "$BATS_TEST_TMPDIR/modules/sub" "$repo/sub"
+  mkdir -p "$repo/sub/deep"
+  [ -f "$repo/sub/.git" ] && [ -f "$BATS_TEST_TMPDIR/wt/.git" ]
+
+  for dir in "$BATS_TEST_TMPDIR/wt/pkg" "$repo/sub/deep" "$repo"; do
+    expected="$(git -C "$dir" rev-parse --show-toplevel)"
+    [ "$(git_root "$dir")" = "$expected" ]
+  done
+}
+
+@test "git root: a dangling gitfile is skipped, no repo means no Git line" {
+  repo="$BATS_TEST_TMPDIR/repo"
+  git init -q "$repo"
+  mkdir -p "$repo/vendor/lib"
+  echo "gitdir: ../../nowhere" > "$repo/vendor/.git"
+  [ "$(git_root "$repo/vendor/lib")" = "$repo" ]
+
+  bare="$BATS_TEST_TMPDIR/plain/dir"
+  mkdir -p "$bare"
+  if git -C "$bare" rev-parse 2>/dev/null; then
+    skip "test tmpdir is inside a git work tree"
+  fi
+  run python3 "$MEMORY_MAP" --plain "$bare"
+  [ "$status" -eq 0 ]
+  [[ "$output" != *"Git:"* ]]
+  [[ "$output" == *"Project key: ${bare//\//-}"* ]]
+}
+
+# ── Conditional rules (--rules-for, dead-rule audit) ──
+
+@test "rules-for: globs match like Claude Code's paths: frontmatter" {
+  rule ts "src/**/*.{ts,tsx}"
+  rule docs "docs/*.md"
+  echo "Always" > "$PROJ/.claude/rules/always.md"
+  cd "$PROJ"
+
+  run python3 "$MEMORY_MAP" --rules-for src/a/b/view.tsx "$PROJ"
+  [ "$status" -eq 0 ]
+  [ "$output" = "$PROJ/.claude/rules/ts.md" ]
+
+  run python3 "$MEMORY_MAP" --rules-for src/main.ts "$PROJ"
+  [ "$output" = "$PROJ/.claude/rules/ts.md" ]
+
+  run python3 "$MEMORY_MAP" --rules-for docs/intro.md "$PROJ"
+  [ "$output" = "$PROJ/.claude/rules/docs.md" ]
+
+  # * stops at /, and unconditional rules are not listed
+  run python3 "$MEMORY_MAP" --rules-for docs/guide/intro.md "$PROJ"
+  [ "$status" -eq 0 ]
+  [ -z "$output" ]
+  run python3 "$MEMORY_MAP" --rules-for src/main.js "$PROJ"
+  [ -z "$output" ]
+}
+
+@test "audit: rule matching nothing is reported dead" {
+  rule docs "docs/**"
+
+  run python3 "$MEMORY_MAP" --audit "$PROJ"
+
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"DEAD RULE"*"docs.md"* ]]
+}
+
+@test "audit: rule for files under a skip-listed dir is not dead" {
+  rule build "build/**/*.js"
+  mkdir -p "$PROJ/build/sub"
+  touch "$PROJ/build/sub/out.js"
+
+  run python3 "$MEMORY_MAP" --audit "$PROJ"
+
+  [ "$status" -eq 0 ]
+  [[ "$output" != *"DEAD RULE"* ]]
+}
+
+@test "audit: rule for files in a gitignored dir is not dead" {
+  rule gen "gen/*.ts"
+  mkdir -p "$PROJ/.git" "$PROJ/gen"
+  echo "gen/" > "$PROJ/.gitignore"
+  touch "$PROJ/gen/api.ts"
+
+  run python3 "$MEMORY_MAP" --audit "$PROJ"
+
+  [ "$status" -eq 0 ]
+  [[ "$output" != *"DEAD RULE"* ]]
+}
+
+# ── @-import graph ──
+
+@test "imports: a cycle loads each file once and is reported" {
+  mkdir -p "$PROJ/docs"
+  printf '# Project\n@docs/a.md\n' > "$PROJ/CLAUDE.md"
+  printf '# A\n@b.md\n' > "$PROJ/docs/a.md"
+  printf '# B\n@a.md\n' > "$PROJ/docs/b.md"
+
+  run timeout 20 python3 "$MEMORY_MAP" --json "$PROJ"
+  [ "$status" -eq 0 ]
+  [ "$(grep -c '"path": "'"$PROJ"'/docs/a.md"' <<< "$output")" -eq 1 ]
+  [ "$(grep -c '"path": "'"$PROJ"'/docs/b.md"' <<< "$output")" -eq 1 ]
+
+  run timeout 20 python3 "$MEMORY_MAP" --audit --plain "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"IMPORT CYCLE: $PROJ/docs/a.md → $PROJ/docs/b.md → $PROJ/docs/a.md"* ]]
+}
+
+@test "imports: chains past the depth limit are cut and reported" {
+  mkdir -p "$PROJ/docs"
+  printf '# Project\n@docs/l1.md\n' > "$PROJ/CLAUDE.md"
+  for i in 1 2 3 4 5 6 7; do
+    printf '# L%s\n@l%s.md\n' "$i" "$((i + 1))" > "$PROJ/docs/l$i.md"
+  done
+  echo "# End" > "$PROJ/docs/l8.md"
+
+  run python3 "$MEMORY_MAP" --json "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"$PROJ/docs/l5.md"* ]]
+  [[ "$output" != *"$PROJ/docs/l6.md"* ]]
+
+  run python3 "$MEMORY_MAP" --audit --plain "$PROJ"
+  [[ "$output" == *"IMPORT DEPTH: $PROJ/CLAUDE.md — 1 file(s) past the 5-level"* ]]
+}
+
+# ── On-disk index (optional cache) ──
+
+@test "index: a file edited in place is parsed again on the next run" {
+  echo "# A" > "$PROJ/a.md"
+  echo "# B" > "$PROJ/b.md"
+  printf '# Project\n@a.md\n' > "$PROJ/CLAUDE.md"
+  touch -d "2001-01-01" "$PROJ/CLAUDE.md"
+
+  run python3 "$MEMORY_MAP" --plain "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"$PROJ/a.md"* ]]
+  [ -f "$XDG_CACHE_HOME/solo-factory/memory-map.sqlite3" ]
+
+  # Same size, new mtime: the stored parse must not be reused
+  printf '# Project\n@b.md\n' > "$PROJ/CLAUDE.md"
+  run python3 "$MEMORY_MAP" --plain "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"$PROJ/b.md"* ]]
+  [[ "$output" != *"$PROJ/a.md"* ]]
+}
+
+@test "index: unwritable cache dir falls back to running without it" {
+  touch "$BATS_TEST_TMPDIR/notadir"
+  export XDG_CACHE_HOME="$BATS_TEST_TMPDIR/notadir/cache"
+
+  run python3 "$MEMORY_MAP" "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"$PROJ/CLAUDE.md"* ]]
+
+  run python3 "$MEMORY_MAP" --json "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"$PROJ/CLAUDE.md"* ]]
+}
+
+# ── Token budget ──
+
+@test "tokens: plain map shows the Tokens line only when a budget is asked for" {
+  run python3 "$MEMORY_MAP" --plain "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"Budget:"* ]]
+  [[ "$output" != *"Tokens:"* ]]
+
+  run python3 "$MEMORY_MAP" --plain --budget 100 "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"Tokens:"*"of 100 ["* ]]
+}
+
+@test "tokens: auto tokenizer stays offline without a cached tiktoken encoding" {
+  export TIKTOKEN_CACHE_DIR="$BATS_TEST_TMPDIR/tiktoken"
+  mkdir -p "$TIKTOKEN_CACHE_DIR"
+
+  run python3 "$MEMORY_MAP" --audit "$PROJ"
+
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"TOKENS: "*"[heuristic]"* ]]
+}
+
+@test "tokens: files parsed from the index are still counted" {
+  printf '# Project\n\nSome words, numbers 12345 and punctuation!\n' > "$PROJ/CLAUDE.md"
+
+  run python3 "$MEMORY_MAP" --plain --tokenizer heuristic --no-cache "$PROJ"
+  [ "$status" -eq 0 ]
+  cold=$(grep "Tokens:" <<< "$output")
+  [[ "$cold" == *"Tokens: "[1-9]* ]]
+
+  # First run fills the index without counting; the second counts from it
+  run python3 "$MEMORY_MAP" --plain "$PROJ"
+  [ "$status" -eq 0 ]
+  run python3 "$MEMORY_MAP" --plain --tokenizer heuristic "$PROJ"
+  [ "$status" -eq 0 ]
+  [ "$(grep "Tokens:" <<< "$output")" = "$cold" ]
+}
+
+# ── Audit checks (pooled) ──
+
+@test "audit: a check that hangs past its timeout does not use up the pool" {
+  run python3 -c '
+import sys, threading
+sys.path.insert(0, sys.argv[1])
+import memory_map_core as mm
+hang = threading.Event()
+calls = []
+
+def slow(ctx):
+    calls.append(1)
+    if len(calls) == 1:
+        hang.wait()  # first run never returns
+    yield "SLOW: done"
+
+mm.AUDIT_POOL = mm.DaemonPool(1)
+mm.AUDIT_CHECKS[:] = [mm.AuditCheck("slow", slow, frozenset({"fs"}), timeout=0.3)]
+first = mm.audit_memory([])
+assert first[0].startswith("AUDIT TIMEOUT: slow"), first
+# the only worker is still stuck in the first run
+assert mm.audit_memory([]) == ["SLOW: done"]
+assert mm.audit_memory([]) == ["SLOW: done"]
+assert len(mm.AUDIT_POOL._threads) == 1
+' "$REAL_SCRIPT_DIR"
+
+  [ "$status" -eq 0 ]
+}
+
+# ── Auto-memory truncation (--truncation) ──
+
+@test "truncation: reports what falls past line 200 and a better order" {
+  memory="$HOME/.claude/projects/$(cd "$PROJ" && pwd -P | tr / -)/memory"
+  mkdir -p "$memory"
+  echo "# Deploy" > "$memory/deploy.md"
+  {
+    echo "# Memory"
+    echo "## Notes"
+    for i in $(seq 120); do echo "- note $i"; done
+    echo "## Old"
+    for i in $(seq 100); do echo "- old $i"; done
+    echo "## Deploy"
+    echo '- see [deploy](deploy.md) for `make deploy`'
+  } > "$memory/MEMORY.md"
+
+  run python3 "$MEMORY_MAP" --truncation --plain "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"TRUNCATION: 225L, first 200 loaded — 25 line(s) and 1 linked topic(s) cut off"* ]]
+  [[ "$output" == *"Topics linked only past the cutoff: deploy.md"* ]]
+
+  run python3 "$MEMORY_MAP" --truncation --json "$PROJ"
+  [ "$status" -eq 0 ]
+  python3 -c '
+import json, sys
+d = json.loads(sys.argv[1])
+assert (d["kept_score"], d["total_score"], d["suggested_score"]) == (0, 1, 1), d
+order = [s["heading"] for s in d["suggested_order"]]
+assert order == ["# Memory", "## Deploy", "## Notes", "## Old"], order
+' "$output"
+}
+
+@test "truncation: no MEMORY.md is not an error" {
+  run python3 "$MEMORY_MAP" --truncation "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == "No auto-memory MEMORY.md for "* ]]
+}
+
+# ── Per-phase timings (--timings) ──
+
+@test "timings: --json becomes {memories, timings}, plain output gets a table" {
+  rule docs "docs/**"
+  # Old enough to be served from the result cache on the second --json
+  find "$PROJ" "$HOME" -exec touch -d "2001-01-01" {} +
+  python3 "$MEMORY_MAP" --json "$PROJ" > "$BATS_TEST_TMPDIR/map.json"
+  python3 "$MEMORY_MAP" --json "$PROJ" > /dev/null
+
+  run python3 "$MEMORY_MAP" --json --timings "$PROJ"
+  [ "$status" -eq 0 ]
+  python3 -c '
+import json, sys
+out = json.loads(sys.argv[1])
+assert sorted(out) == ["memories", "timings"], out
+assert out["memories"] == json.load(open(sys.argv[2]))
+phases = out["timings"]["phases"]
+for name in ("tree_walk", "hierarchy", "user", "project_rules", "imports"):
+    assert sorted(phases[name]) == ["bytes_read", "calls", "ms", "reads", "syscalls"], phases
+assert out["timings"]["total"]["calls"] >= len(phases)
+' "$output" "$BATS_TEST_TMPDIR/map.json"
+
+  run python3 "$MEMORY_MAP" --plain --timings "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"Timings (slowest first"* ]]
+  for phase in tree_walk hierarchy project_rules total; do
+    [[ "$output" == *"    $phase "* ]]
+  done
+}
+
+# ── Result cache (--json fast path) ──
+
+@test "result cache: repeated --json skips the core until an input changes" {
+  rule docs "docs/**"
+  # Inputs touched within the last two seconds are never cached
+  find "$PROJ" "$HOME" -exec touch -d "2001-01-01" {} +
+
+  run python3 "$MEMORY_MAP" --json "$PROJ"
+  [ "$status" -eq 0 ]
+  first="$output"
+
+  run python3 -X importtime "$MEMORY_MAP" --json "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" != *"memory_map_core"* ]]
+  [[ "$output" == *"$first"* ]]
+
+  rule api "api/**"
+  run python3 -X importtime "$MEMORY_MAP" --json "$PROJ"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"memory_map_core"* ]]
+  [[ "$output" == *"$PROJ/.claude/rules/api.md"* ]]
+}
+
+# ── JSON output and daemon queries ──
+
+@test "json: --audit keeps the list shape, --hints adds the hints" {
+  rule docs "docs/**"
+
+  run python3 "$MEMORY_MAP" --json --audit "$PROJ"
+  [ "$status" -eq 0 ]
+  python3 -c 'import json,sys; assert isinstance(json.loads(sys.argv[1]), list)' "$output"
+
+  run python3 "$MEMORY_MAP" --json --hints "$PROJ"
+  [ "$status" -eq 0 ]
+  python3 -c '
+import json, sys
+d = json.loads(sys.argv[1])
+assert sorted(d) == ["hints", "memories"], d
+assert any("DEAD RULE" in h for h in d["hints"]), d["hints"]
+' "$output"
+}
+
+@test "json: --hints without --json is an error" {
+  run python3 "$MEMORY_MAP" --hints "$PROJ"
+  [ "$status" -eq 1 ]
+  [[ "$output" == *"--hints works with --json"* ]]
+}
+
+@test "daemon: answers --json queries with the same output as a local run" {
+  rule docs "docs/**"
+  expected=()
+  for q in "--json" "--json --audit" "--json --hints"; do
+    expected+=("$(cd "$PROJ" && python3 "$MEMORY_MAP" $q --no-cache)")
+  done
+
+  start_daemon
+
+  i=0
+  for q in "--json" "--json --audit" "--json --hints"; do
+    run bash -c "cd '$PROJ' && python3 -X importtime '$MEMORY_MAP' $q"
+    [ "$status" -eq 0 ]
+    [[ "$output" != *"memory_map_core"* ]]  # answered without loading the core
+    [[ "$output" == *"${expected[$i]}"* ]]
+    i=$((i + 1))
+  done
+}
+
+@test "daemon: malformed or foreign requests get an error, not a crash" {
+  start_daemon
+  cwd=$(cd "$PROJ" && pwd -P)
+
+  run ask_daemon 'not json'
+  [[ "$output" == '{"ok": false, "error": "expected a JSON object"}' ]]
+
+  run ask_daemon '{"op": "bogus", "cwd": "'"$cwd"'", "home": "'"$HOME"'"}'
+  [[ "$output" == '{"ok": false, "error": "unknown op '\''bogus'\''"}' ]]
+
+  run ask_daemon '{"op": "map", "cwd": "'"$cwd"'", "home": "/elsewhere"}'
+  [[ "$output" == '{"ok": false, "error": "daemon serves HOME='"$HOME"'"}' ]]
+
+  run ask_daemon '{"op": "rules_for", "cwd": "'"$cwd"'", "home": "'"$HOME"'"}'
+  [[ "$output" == *'"ok": false'*"rules_for needs a file"* ]]
+
+  # Still serving after the bad requests
+  run ask_daemon '{"op": "map", "cwd": "'"$cwd"'", "home": "'"$HOME"'"}'
+  [[ "$output" == '{"ok": true, "result": ['*"$cwd/CLAUDE.md"* ]]
+}
+
+# ── NDJSON output (--ndjson) ──
+
+@test "ndjson: header, one memory record per --json entry, then summary" {
+  echo "@notes.md" >> "$PROJ/CLAUDE.md"
+  echo "notes" > "$PROJ/notes.md"
+  rule docs "docs/**"
+  python3 "$MEMORY_MAP" --json "$PROJ" > "$BATS_TEST_TMPDIR/map.json"
+
+  run python3 "$MEMORY_MAP" --ndjson "$PROJ"
+  [ "$status" -eq 0 ]
+  python3 -c '
+import json, sys
+records = [json.loads(line) for line in sys.argv[1].splitlines()]
+expected = json.load(open(sys.argv[3]))
+header, *memories, summary = records
+assert header["type"] == "header" and header["mode"] == "project", header
+assert header["schema"] == "solo-factory/memory-map" and header["version"] == 1
+assert header["path"] == sys.argv[2], header
+assert [m.pop("type") for m in memories] == ["memory"] * len(expected)
+assert memories == expected, memories
+assert summary["type"] == "summary" and summary["files"] == len(expected), summary
+' "$output" "$PROJ" "$BATS_TEST_TMPDIR/map.json"
+
+  run python3 "$MEMORY_MAP" --ndjson --audit "$PROJ"
+  [ "$status" -eq 0 ]
+  python3 -c '
+import json, sys
+records = [json.loads(line) for line in sys.argv[1].splitlines()]
+assert [r["type"] for r in records[-2:]] == ["audit", "summary"], records
+assert any("DEAD RULE" in h for h in records[-2]["hints"]), records[-2]
+assert "audit_ms" in records[-1]
+' "$output"
+}
+
+@test "ndjson: --all-projects emits one project record per project, in order" {
+  ws="$BATS_TEST_TMPDIR/ws"
+  for p in beta alpha gamma; do
+    mkdir -p "$ws/$p"
+    printf '# %s\n' "$p" > "$ws/$p/CLAUDE.md"
+  done
+  cd "$ws"
+
+  run python3 "$MEMORY_MAP" --all-projects --ndjson --audit
+  [ "$status" -eq 0 ]
+  python3 -c '
+import json, sys
+records = [json.loads(line) for line in sys.argv[1].splitlines()]
+header, *projects, summary = records
+assert header["type"] == "header" and header["mode"] == "all-projects", header
+assert [p["type"] for p in projects] == ["project"] * 3, projects
+assert [p["path"].rsplit("/", 1)[-1] for p in projects] == ["alpha", "beta", "gamma"]
+for p in projects:
+    assert p["path"] + "/CLAUDE.md" in [m["path"] for m in p["memories"]], p
+    assert isinstance(p["hints"], list) and p["hints"], p
+assert summary["type"] == "summary" and summary["projects"] == 3, summary
+assert summary["files"] == sum(len(p["memories"]) for p in projects), summary
+' "$output"
+}
+
+# ── Multi-project scan ──
+
+@test "scan: --all-projects output does not depend on the worker count" {
+  ws="$BATS_TEST_TMPDIR/ws"
+  mkdir -p "$HOME/.claude"
+  printf '# User\n@~/.claude/shared.md\n' > "$HOME/.claude/CLAUDE.md"
+  echo "shared" > "$HOME/.claude/shared.md"
+  for i in 1 2 3 4 5 6 7 8; do
+    p="$ws/p$i"
+    mkdir -p "$p/.claude/rules" "$p/sub$i"
+    printf '# p%s\n@notes.md\n' "$i" > "$p/CLAUDE.md"
+    seq "$i" > "$p/notes.md"
+    echo "# child" > "$p/sub$i/CLAUDE.md"
+    printf -- '---\npaths:\n  - "src/*.ts"\n---\nRule\n' > "$p/.claude/rules/ts.md"
+  done
+  cd "$ws"
+
+  python3 "$MEMORY_MAP" --all-projects --json --workers 1 > "$BATS_TEST_TMPDIR/serial.json"
+  for run in 1 2 3; do
+    python3 "$MEMORY_MAP" --all-projects --json --workers 8 > "$BATS_TEST_TMPDIR/parallel.json"
+    cmp "$BATS_TEST_TMPDIR/serial.json" "$BATS_TEST_TMPDIR/parallel.json"
+  done
+  python3 "$MEMORY_MAP" --all-projects --plain --audit --workers 1 > "$BATS_TEST_TMPDIR/serial.txt"
+  python3 "$MEMORY_MAP" --all-projects --plain --audit --workers 8 > "$BATS_TEST_TMPDIR/parallel.txt"
+  cmp "$BATS_TEST_TMPDIR/serial.txt" "$BATS_TEST_TMPDIR/parallel.txt"
+
+  # Each project's entry is what a single-project run reports
+  python3 "$MEMORY_MAP" --json "$ws/p5" > "$BATS_TEST_TMPDIR/p5.json"
+  python3 -c '
+import json, sys
+fleet = json.load(open(sys.argv[1]))
+assert list(fleet) == [sys.argv[3] + "/p%d" % i for i in range(1, 9)], list(fleet)
+assert fleet[sys.argv[3] + "/p5"] == json.load(open(sys.argv[2]))
+' "$BATS_TEST_TMPDIR/serial.json" "$BATS_TEST_TMPDIR/p5.json" "$ws"
+}
+
+@test "scan: MemoryTable round-trips each map, interned per scan" {
+  rule docs "docs/**"
+
+  run python3 -c '
+import sys
+sys.path.insert(0, sys.argv[1])
+from pathlib import Path
+import memory_map_core as mm
+proj = Path(sys.argv[2]).resolve()
+first = next(mm.scan_projects([proj], workers=1))
+again = next(mm.scan_projects([proj], workers=1))
+expected = [m.to_dict() for m in mm.load_memory_map(proj)]
+assert [m.to_dict() for m in first.memories] == expected
+assert first.memories.strings is not again.memories.strings
+' "$REAL_SCRIPT_DIR" "$PROJ"
+
+  [ "$status" -eq 0 ]
+}
+
+@test "dedupe: exact and near-duplicate sections across projects are grouped" {
+  ws="$BATS_TEST_TMPDIR/ws"
+  mkdir -p "$ws/a" "$ws/b" "$ws/c" "$ws/d"
+  section=""
+  for i in $(seq 10); do
+    section+="- testing rule number $i: keep the suite green and fast"$'\n'
+  done
+  for p in a b; do printf '# %s\n\n## Testing\n%s' "$p" "$section" > "$ws/$p/CLAUDE.md"; done
+  printf '# c\n\n## Testing\n%s' "${section/number 3/NUMBER three}" > "$ws/c/CLAUDE.md"
+  printf '# d\n\n## Other\nnothing in common here\n' > "$ws/d/CLAUDE.md"
+  cd "$ws"
+
+  run python3 "$MEMORY_MAP" --all-projects --dedupe --json
+  [ "$status" -eq 0 ]
+  python3 -c '
+import json, sys
+groups = json.loads(sys.argv[1])["dedupe"]["groups"]
+by_kind = {g["kind"]: g for g in groups}
+assert sorted(by_kind) == ["near", "section"], groups
+assert [p.split("/")[-2] for p in by_kind["section"]["files"]] == ["a", "b"]
+assert [p.split("/")[-2] for p in by_kind["near"]["files"]] == ["a", "b", "c"]
+assert 0.8 <= by_kind["near"]["similarity"] < 1
+' "$output"
+
+  run python3 "$MEMORY_MAP" --all-projects --dedupe --plain
+  [[ "$output" == *"EXACT SECTION: '## Testing' in 2 files"* ]]
+}
+
+# ── Watch mode ──
+
+@test "watch: a repository created above the project moves its auto-memory" {
+  mkdir -p "$PROJ/app"
+  echo "# App" > "$PROJ/app/CLAUDE.md"
+  memory="$HOME/.claude/projects/$(cd "$PROJ" && pwd -P | tr / -)/memory"
+  mkdir -p "$memory"
+  echo "# Notes" > "$memory/MEMORY.md"
+
+  python3 "$MEMORY_MAP" --watch --json "$PROJ/app" > "$BATS_TEST_TMPDIR/frames" 2>&1 &
+  BG_PID=$!
+  for _ in $(seq 50); do [ -s "$BATS_TEST_TMPDIR/frames" ] && break; sleep 0.1; done
+  [[ "$(cat "$BATS_TEST_TMPDIR/frames")" != *"MEMORY.md"* ]]
+
+  git init -q "$PROJ"
+  for _ in $(seq 50); do grep -q "MEMORY.md" "$BATS_TEST_TMPDIR/frames" && break; sleep 0.1; done
+  grep -q "$memory/MEMORY.md" "$BATS_TEST_TMPDIR/frames"
+}
+
+# ── Benchmark harness (make bench-memory-map) ──
+
+@test "bench: a tiny make bench-memory-map run reports every phase and compares" {
+  tiny="--levels 2 --rules 3 --user-rules 2 --decoy-dirs 2 --projects 2"
+  tiny+=" --skills 1 --topics 2 --repeat 1 --no-startup"
+
+  run make -s -C "$BATS_TEST_DIRNAME/.." bench-memory-map ARGS="$tiny --json"
+  [ "$status" -eq 0 ]
+  python3 -c '
+import json, sys
+report = json.loads(sys.argv[1])
+assert report["spec"]["levels"] == 2 and report["spec"]["projects"] == 2, report["spec"]
+assert {"walk", "load_cold", "load_warm_index", "audit", "all_projects"} <= set(report["phases"])
+for name, phase in report["phases"].items():
+    assert phase["wall_ms"] > 0 and phase["subprocesses"] == 0, (name, phase)
+' "$output"
+
+  run make -s -C "$BATS_TEST_DIRNAME/.." bench-memory-map \
+    ARGS="$tiny --save-baseline $BATS_TEST_TMPDIR/base.json"
+  [ "$status" -eq 0 ]
+  [ -s "$BATS_TEST_TMPDIR/base.json" ]
+  run make -s -C "$BATS_TEST_DIRNAME/.." bench-memory-map \
+    ARGS="$tiny --compare $BATS_TEST_TMPDIR/base.json --tolerance 100"
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"No regressions against baseline."* ]]
+}
@@ -0,0 +1,287 @@
+#!/usr/bin/env bats
+# stream_fmt.bats — solo-stream-fmt.py behaviour on small stream-json samples
+
+load test_helper
+
+setup() {
+  export HOME="$BATS_TEST_TMPDIR/home"
+  mkdir -p "$HOME"
+  FMT="$REAL_SCRIPT_DIR/solo-stream-fmt.py"
+  STREAM="$BATS_TEST_TMPDIR/stream.jsonl"
+  cat > "$STREAM" <<'EOF'
+{"type": "system", "subtype": "init", "session_id": "abcdef123456", "model": "test-model"}
+{"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Looking "}}
+{"type": "content_block_delta", "delta": {"type": "text_delta", "text": "at the repo\n"}}
+{"type": "assistant", "message": {"content": [{"type": "tool_use", "id": "t1", "name": "Read", "input": {"file_path": "/src/app.py"}}]}}
+{"type": "assistant", "message": {"content": [{"type": "tool_use", "id": "t2", "name": "Grep", "input": {"pattern": "TODO"}}]}}
+{"type": "user", "message": {"content": [{"type": "tool_result", "tool_use_id": "t1", "content": "print(1)\n"}]}}
+{"type": "user", "message": {"content": [{"type": "tool_result", "tool_use_id": "t2", "content": [{"type": "text", "text": "none"}], "is_error": true}]}}
+not json at all
+{"type": "assistant", "message": {"content": [{"type": "tool_use", "id": "t3", "name": "Read", "input": {"file_path": "/src/lib.py"}}]}}
+{"type": "assistant", "message": {"content": [{"type": "text", "text": "Done."}]}}
+{"type": "result", "result": "", "num_turns": 3, "duration_ms": 1200, "total_cost_usd": 0.25, "usage": {"input_tokens": 100, "output_tokens": 40, "cache_read_input_tokens": 7}}
+EOF
+}
+
+# fmt [ARGS...] — run the formatter on $STREAM without color or sound
+fmt() {
+  python3 "$FMT" --no-sound --no-color "$@" < "$STREAM"
+}
+
+# ── Buffered reader (--buffered) ──
+
+@test "buffered: output is identical to the unbuffered path" {
+  fmt > "$BATS_TEST_TMPDIR/plain.out"
+  fmt --buffered > "$BATS_TEST_TMPDIR/buffered.out"
+
+  grep -q "session: abcdef12  model: test-model" "$BATS_TEST_TMPDIR/plain.out"
+  grep -q "not json at all" "$BATS_TEST_TMPDIR/plain.out"
+  cmp "$BATS_TEST_TMPDIR/plain.out" "$BATS_TEST_TMPDIR/buffered.out"
+}
+
+@test "buffered: a last line without a trailing newline is still handled" {
+  printf '%s' '{"type": "assistant", "message": {"content": [{"type": "text", "text": "tail text"}]}}' > "$STREAM"
+
+  run fmt --buffered
+
+  [ "$status" -eq 0 ]
+  [[ "$output" == *"tail text"* ]]
+}
+
+@test "buffered: SOLO_FMT_BUFFERED turns it on without the flag" {
+  fmt > "$BATS_TEST_TMPDIR/plain.out"
+  SOLO_FMT_BUFFERED=1 fmt > "$BATS_TEST_TMPDIR/buffered.out"
+
+  cmp "$BATS_TEST_TMPDIR/plain.out" "$BATS_TEST_TMPDIR/buffered.out"
+}
+
+@test "buffered: output formatted before a crash is still written" {
+  echo '123' >> "$STREAM"
+
+  fmt > "$BATS_TEST_TMPDIR/plain.out" 2> /dev/null || true
+  fmt --buffered > "$BATS_TEST_TMPDIR/buffered.out" 2> /dev/null || true
+
+  grep -q "Done." "$BATS_TEST_TMPDIR/buffered.out"
+  cmp "$BATS_TEST_TMPDIR/plain.out" "$BATS_TEST_TMPDIR/buffered.out"
+}
+
+# ── Metrics sidecar (--metrics) ──
+
+@test "metrics: counts tools, errors and non-JSON lines, sums the result usage" {
+  fmt --metrics "$BATS_TEST_TMPDIR/m.json" > /dev/null
+
+  run python3 -c '
+import json, sys
+m = json.load(open(sys.argv[1]))
+assert m["final"] is True, m
+assert m["session_id"] == "abcdef123456" and m["model"] == "test-model", m
+assert m["tools"] == {"Read": 2, "Grep": 1} and m["tool_calls"] == 3, m
+assert m["tool_errors"] == 1 and m["non_json_lines"] == 1, m
+assert m["events"] == 10 and m["results"] == 1, m
+assert m["num_turns"] == 3 and m["duration_ms"] == 1200, m
+assert m["total_cost_usd"] == 0.25, m
+assert m["usage"] == {"input_tokens": 100, "output_tokens": 40, "cache_read_input_tokens": 7}, m
+assert set(m["tool_time_s"]) == {"Read", "Grep"}, m
+' "$BATS_TEST_TMPDIR/m.json"
+
+  [ "$status" -eq 0 ]
+}
+
+@test "metrics: usage is summed across several result events" {
+  grep '"type": "result"' "$STREAM" > "$BATS_TEST_TMPDIR/one"
+  cat "$BATS_TEST_TMPDIR/one" "$BATS_TEST_TMPDIR/one" > "$STREAM"
+
+  SOLO_FMT_METRICS="$BATS_TEST_TMPDIR/m.json" fmt > /dev/null
+
+  run python3 -c '
+import json, sys
+m = json.load(open(sys.argv[1]))
+assert m["results"] == 2 and m["num_turns"] == 6, m
+assert m["total_cost_usd"] == 0.5 and m["usage"]["input_tokens"] == 200, m
+' "$BATS_TEST_TMPDIR/m.json"
+
+  [ "$status" -eq 0 ]
+}
+
+# ── Tool-call trace (--trace) ──
+
+@test "trace: pairs tool_use with tool_result by id in a Chrome trace" {
+  fmt --trace "$BATS_TEST_TMPDIR/t.json" > /dev/null 2>&1
+
+  run python3 -c '
+import json, sys
+t = json.load(open(sys.argv[1]))
+calls = {e["args"]["id"]: e for e in t["traceEvents"] if e.get("cat") == "tool"}
+assert set(calls) == {"t1", "t2", "t3"}, calls
+assert calls["t1"]["name"] == "Read" and calls["t1"]["args"]["output_bytes"] == 9, calls
+assert calls["t2"]["args"]["is_error"] is True, calls
+assert calls["t3"]["args"].get("unfinished") is True, calls
+assert all(e["ph"] == "X" and e["dur"] >= 0 for e in calls.values()), calls
+names = [e["args"]["name"] for e in t["traceEvents"] if e["name"] == "process_name"]
+assert names == ["abcdef123456"], names
+' "$BATS_TEST_TMPDIR/t.json"
+
+  [ "$status" -eq 0 ]
+}
+
+@test "trace: the slowest-calls summary goes to stderr, not stdout" {
+  fmt > "$BATS_TEST_TMPDIR/out" 2> "$BATS_TEST_TMPDIR/err"
+
+  grep -q -- "-- slowest tool calls --" "$BATS_TEST_TMPDIR/err"
+  grep -q "3 calls, tools busy" "$BATS_TEST_TMPDIR/err"
+  grep -q '(unfinished)' "$BATS_TEST_TMPDIR/err"
+  [[ "$(cat "$BATS_TEST_TMPDIR/out")" != *"slowest tool calls"* ]]
+}
+
+@test "trace: a tool_result for an unknown id is ignored" {
+  echo '{"type": "user", "message": {"content": [{"type": "tool_result", "tool_use_id": "nope", "content": "x"}]}}' > "$STREAM"
+
+  run fmt --trace "$BATS_TEST_TMPDIR/t.json"
+
+  [ "$status" -eq 0 ]
+  [[ "$output" != *"slowest tool calls"* ]]
+  run python3 -c '
+import json, sys
+t = json.load(open(sys.argv[1]))
+assert [e for e in t["traceEvents"] if e.get("cat") in ("tool", "mcp")] == []
+' "$BATS_TEST_TMPDIR/t.json"
+  [ "$status" -eq 0 ]
+}
+
+# ── Raw-event archive (--archive) ──
+
+@test "archive: replays the raw input, non-JSON lines included, with an index" {
+  fmt --archive "$BATS_TEST_TMPDIR/raw.jsonl.gz" > /dev/null 2>&1
+
+  [ -f "$BATS_TEST_TMPDIR/raw.jsonl.gz.idx" ]
+  zcat "$BATS_TEST_TMPDIR/raw.jsonl.gz" | cmp - "$STREAM"
+  run python3 -c '
+import json, sys
+idx = [json.loads(l) for l in open(sys.argv[1])]
+assert [(e["offset"], e["event"], e["events"], e["codec"]) for e in idx] == [(0, 0, 11, "gzip")], idx
+' "$BATS_TEST_TMPDIR/raw.jsonl.gz.idx"
+  [ "$status" -eq 0 ]
+}
+
+@test "archive: a second run appends a block and continues the event count" {
+  fmt --archive "$BATS_TEST_TMPDIR/raw.jsonl.gz" > /dev/null 2>&1
+  SOLO_FMT_ARCHIVE="$BATS_TEST_TMPDIR/raw.jsonl.gz" fmt > /dev/null 2>&1
+
+  zcat "$BATS_TEST_TMPDIR/raw.jsonl.gz" | cmp - <(cat "$STREAM" "$STREAM")
+  run python3 -c '
+import json, os, sys
+idx = [json.loads(l) for l in open(sys.argv[1] + ".idx")]
+assert [(e["event"], e["events"]) for e in idx] == [(0, 11), (11, 11)], idx
+assert idx[1]["offset"] == idx[0]["length"], idx
+assert idx[1]["offset"] + idx[1]["length"] == os.path.getsize(sys.argv[1]), idx
+' "$BATS_TEST_TMPDIR/raw.jsonl.gz"
+  [ "$status" -eq 0 ]
+}
+
+@test "archive: a path without a suffix gets the codec's suffix" {
+  fmt --archive "$BATS_TEST_TMPDIR/raw" > /dev/null 2>&1
+
+  if python3 -c "import zstandard" 2>/dev/null; then
+    [ -f "$BATS_TEST_TMPDIR/raw.zst" ] && [ -f "$BATS_TEST_TMPDIR/raw.zst.idx" ]
+  else
+    [ -f "$BATS_TEST_TMPDIR/raw.gz" ] && [ -f "$BATS_TEST_TMPDIR/raw.gz.idx" ]
+    zcat "$BATS_TEST_TMPDIR/raw.gz" | cmp - "$STREAM"
+  fi
+  [ ! -e "$BATS_TEST_TMPDIR/raw" ]
+}
+
+@test "archive: a run that crashes still leaves its archive and final metrics" {
+  echo '123' >> "$STREAM"
+
+  run fmt --archive "$BATS_TEST_TMPDIR/raw.jsonl.gz" --metrics "$BATS_TEST_TMPDIR/m.json"
+
+  [ "$status" -ne 0 ]
+  zcat "$BATS_TEST_TMPDIR/raw.jsonl.gz" | cmp - "$STREAM"
+  [ -s "$BATS_TEST_TMPDIR/raw.jsonl.gz.idx" ]
+  run python3 -c '
+import json, sys
+m = json.load(open(sys.argv[1]))
+assert m["final"] is True and m["results"] == 1, m
+' "$BATS_TEST_TMPDIR/m.json"
+  [ "$status" -eq 0 ]
+}
+
+# ── Sound effects (cache and sinks) ──
+
+# sfx [ENV...] — run with sound into a WAV file sink and a private cache
+sfx() {
+  env SFX_CACHE_DIR="$BATS_TEST_TMPDIR/sfx" SFX_SINK="file:$BATS_TEST_TMPDIR/out.wav" "$@" \
+    python3 "$FMT" --no-color < "$STREAM" > /dev/null 2>&1
+}
+
+@test "sfx: each effect is a 16-bit mono WAV with its recipe's frame count" {
+  sfx
+  SFX_CACHE_DIR="$BATS_TEST_TMPDIR/sfx2" SFX_SINK=null python3 "$FMT" --no-color < /dev/null > /dev/null 2>&1
+
+  run python3 -c '
+import importlib.util, os, sys, wave
+from array import array
+cache, again, script = sys.argv[1:]
+sys.argv = [script, "--no-sound"]
+spec = importlib.util.spec_from_file_location("fmt", script)
+fmt = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fmt)
+
+def frames(segment):
+    if segment[0] == "mix":
+        return max(frames(segment[1]), frames(segment[2]))
+    duration = segment[1] if segment[0] == "noise" else segment[2]
+    return int(fmt.SAMPLE_RATE * duration)
+
+wavs = sorted(os.listdir(cache))
+assert [w.rsplit("-", 1)[0] for w in wavs] == sorted(fmt.SFX_RECIPES), wavs
+for name in wavs:
+    with wave.open(os.path.join(cache, name)) as w:
+        assert (w.getnchannels(), w.getsampwidth(), w.getframerate()) == (1, 2, 22050)
+        expected = sum(map(frames, fmt.SFX_RECIPES[name.rsplit("-", 1)[0]]))
+        assert w.getnframes() == expected, (name, w.getnframes(), expected)
+        pcm = array("h", w.readframes(w.getnframes()))
+    assert 0 < max(map(abs, pcm)) <= int(0.95 * 32767), name
+    # same recipe, same bytes: noise is seeded from the cache key
+    assert open(os.path.join(cache, name), "rb").read() == open(os.path.join(again, name), "rb").read()
+stage = [w for w in wavs if w.startswith("stage-")][0]
+with wave.open(os.path.join(cache, stage)) as w:
+    assert w.getnframes() == 3 * 1764 + 3307
+' "$BATS_TEST_TMPDIR/sfx" "$BATS_TEST_TMPDIR/sfx2" "$FMT"
+  [ "$status" -eq 0 ]
+}
+
+@test "sfx: a warm cache is reused as-is, a new volume adds its own files" {
+  sfx
+  ls -i "$BATS_TEST_TMPDIR/sfx" > "$BATS_TEST_TMPDIR/first"
+  [ "$(wc -l < "$BATS_TEST_TMPDIR/first")" -gt 0 ]
+  grep -q ' stage-[0-9a-f]\{16\}\.wav$' "$BATS_TEST_TMPDIR/first"
+  touch -d '2001-01-01' "$BATS_TEST_TMPDIR"/sfx/*.wav
+
+  sfx
+  # same files, same inodes (not rewritten), mtimes refreshed against eviction
+  ls -i "$BATS_TEST_TMPDIR/sfx" | cmp - "$BATS_TEST_TMPDIR/first"
+  [ -z "$(find "$BATS_TEST_TMPDIR/sfx" -name '*.wav' ! -newermt '2001-01-02')" ]
+
+  sfx SFX_VOLUME=0.5
+  [ "$(ls "$BATS_TEST_TMPDIR/sfx" | wc -l)" -eq $((2 * $(wc -l < "$BATS_TEST_TMPDIR/first"))) ]
+}
+
+@test "sfx: SFX_SINK=file:PATH records what was played as a mono WAV" {
+  sfx
+
+  run python3 -c '
+import sys, wave
+with wave.open(sys.argv[1]) as w:
+    assert (w.getnchannels(), w.getsampwidth(), w.getframerate()) == (1, 2, 22050)
+    assert w.getnframes() > 0
+' "$BATS_TEST_TMPDIR/out.wav"
+  [ "$status" -eq 0 ]
+}
+
+@test "sfx: --no-sound neither synthesizes nor plays anything" {
+  SFX_CACHE_DIR="$BATS_TEST_TMPDIR/sfx" SFX_SINK="file:$BATS_TEST_TMPDIR/out.wav" fmt > /dev/null 2>&1
+
+  [ ! -e "$BATS_TEST_TMPDIR/sfx" ]
+  [ ! -e "$BATS_TEST_TMPDIR/out.wav" ]
+}